@@ -0,0 +1,192 @@
+import json
+import time
+import uuid
+from botocore.exceptions import BotoCoreError, ClientError
+from helper import Get_S3_Client, List_Cloud_Objects
+
+# Fleet-wide admission into the model loading, so hundreds of nodes do not throttle the bucket by downloading at once
+# The nodes and the coordinator (37_admission.py on the Test Worker) only talk through small objects in the bucket:
+#   ds:{BUCKET}/{FOLDER}/admission/coordinator.json       the lock/lease of the single coordinator, and its state
+#   ds:{BUCKET}/{FOLDER}/admission/requests/{NODE}.json   written by a node waiting for its turn
+#   ds:{BUCKET}/{FOLDER}/admission/grants/{NODE}.json     written by the coordinator, a lease on a download slot
+#   ds:{BUCKET}/{FOLDER}/admission/done/{NODE}.json       written by the node, with its dl_throughput_Gbps
+# Each object has a single writer, so no conditional writes are needed
+
+ADMISSION_PREFIX = "admission"
+LOCK_NAME        = "coordinator.json"
+
+def _Key(folder, *parts):
+    return "/".join([folder.strip("/"), ADMISSION_PREFIX] + list(parts))
+
+def _Put_Json(bucket, key, data):
+    Get_S3_Client().put_object(Bucket=bucket, Key=key, Body=json.dumps(data).encode())
+
+# The object, or None if it does not exist
+def _Get_Json(bucket, key):
+    try:
+        return json.loads(Get_S3_Client().get_object(Bucket=bucket, Key=key)['Body'].read())
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+########## The node side
+
+# Wait for a grant; returns (attempt, seconds waited), or None after the timeout (or without a coordinator), to go ahead anyway
+def Request_Admission(bucket, folder, node, timeout_s=3600, poll_s=10):
+    start = time.time()
+    attempt = uuid.uuid4().hex[:8]
+    try:
+        _Put_Json(bucket, _Key(folder, "requests", f"{node}.json"), {"node": node, "attempt": attempt, "requested": start})
+        print(f"Waiting for the admission into the model loading: ds:{bucket}/{_Key(folder)}", flush=True)
+        while time.time() - start < timeout_s:
+            grant = _Get_Json(bucket, _Key(folder, "grants", f"{node}.json"))
+            if grant is not None and grant['attempt'] == attempt:
+                print(f"Admitted after {round(time.time() - start, 3)} seconds, {grant['admitted']} nodes admitted so far", flush=True)
+                return attempt, round(time.time() - start, 3)
+            time.sleep(poll_s)
+    except (BotoCoreError, ClientError) as e:
+        print(f"The error message: {e}", flush=True)
+        return None
+    print(f"Attention: not admitted in {timeout_s} seconds, loading anyway", flush=True)
+    return None
+
+# Report the end of the download, which frees the slot, and its throughput, which tunes the admissions
+def Report_Done(bucket, folder, node, attempt, result):
+    try:
+        _Put_Json(bucket, _Key(folder, "done", f"{node}.json"), dict(result, node=node, attempt=attempt, done=time.time()))
+        return 1
+    except (BotoCoreError, ClientError) as e:
+        print(f"The error message: {e}", flush=True)
+        return 0
+
+########## The coordinator side
+
+# Token bucket sized from the aggregate bandwidth of the bucket, in admissions:
+#   burst (the concurrent downloads) = bandwidth / per-node rate
+#   refill (admissions per second)   = bandwidth / model size, the pace at which the bucket can complete downloads
+# The bandwidth estimate is tuned from the dl_throughput_Gbps reported by the nodes, AIMD like TCP:
+# a node slower than THROTTLE_RATIO of the best per-node rate means the bucket is saturated (or throttling), so the estimate
+# drops, at most once per round of downloads; a node at full speed while all the slots were used adds a node to the estimate
+# until the first drop (slow start), then 1/burst of a node
+class Admission_Controller:
+    THROTTLE_RATIO = 0.8
+    DECREASE       = 0.7
+
+    def __init__(self, bandwidth_Gbps, node_rate_Gbps, model_size_GB):
+        self.bandwidth_Gbps = bandwidth_Gbps
+        self.node_rate_Gbps = node_rate_Gbps # The best per-node rate seen, the NIC or the per-connection limit
+        self.model_size_GB = model_size_GB
+        self.tokens = float(self.burst())
+        self.updated = None
+        self.decreased = 0.0 # The time of the last decrease
+        self.samples = 0
+
+    def burst(self):
+        return max(1, int(self.bandwidth_Gbps / self.node_rate_Gbps))
+
+    def refill_per_s(self):
+        return self.bandwidth_Gbps / (self.model_size_GB * 8)
+
+    # A completed download, granted at granted, with the number of downloads sharing the bucket with it (including itself)
+    def observe(self, now, throughput_Gbps, active, granted, size_GB=None):
+        if not throughput_Gbps or throughput_Gbps <= 0:
+            return
+        self.samples += 1
+        if size_GB:
+            self.model_size_GB = size_GB
+        self.node_rate_Gbps = max(self.node_rate_Gbps, throughput_Gbps)
+        if throughput_Gbps < self.THROTTLE_RATIO * self.node_rate_Gbps:
+            if granted >= self.decreased: # Started after the last decrease, so not the same congestion
+                self.bandwidth_Gbps = max(throughput_Gbps * active, self.bandwidth_Gbps * self.DECREASE, self.node_rate_Gbps)
+                self.decreased = now
+        elif active >= self.burst(): # A node per download until the first decrease (slow start), then 1/burst
+            self.bandwidth_Gbps += self.node_rate_Gbps if self.decreased == 0 else self.node_rate_Gbps / self.burst()
+        self.tokens = min(self.tokens, float(self.burst()))
+
+    # The number of nodes to admit now, given the downloads in flight
+    def admit(self, now, active, pending):
+        if self.updated is not None:
+            self.tokens = min(self.tokens + (now - self.updated) * self.refill_per_s(), float(self.burst()))
+        self.updated = now
+        count = min(int(self.tokens), max(self.burst() - active, 0), pending)
+        self.tokens -= count
+        return count
+
+    def state(self):
+        return {"bandwidth_Gbps": round(self.bandwidth_Gbps, 3), "node rate_Gbps": round(self.node_rate_Gbps, 3),
+                "model size_GB": round(self.model_size_GB, 3), "burst": self.burst(), "tokens": round(self.tokens, 3), "samples": self.samples}
+
+# The coordinator state in the bucket; a poll lists the admission folder once, and reads only the new or changed objects
+# Each request carries an attempt ID, so a node which restarts its model loading asks again, and is admitted again
+class Admission_Coordinator:
+    def __init__(self, bucket, folder, controller, lease_s=1800, lock_s=60):
+        self.bucket = bucket
+        self.folder = folder.strip("/")
+        self.controller = controller
+        self.lease_s = lease_s # A granted node not done after this is considered gone, and its slot freed
+        self.lock_s = lock_s
+        self.owner = f"{uuid.uuid4()}"
+        self.etags = {}    # key -> etag, the objects already read
+        self.requests = {} # node -> {"attempt", "requested"}
+        self.granted = {}  # node -> (grant time, downloads active with it), for the current attempt
+        self.done = {}     # node -> the done object of the current attempt
+        self.admitted = 0
+
+    # Take or renew the lock; another live coordinator keeps it until its lease expires
+    # Without conditional writes this is best effort: write, then read back to see who won
+    def acquire(self, now):
+        lock = _Get_Json(self.bucket, _Key(self.folder, LOCK_NAME))
+        if lock is not None and lock['owner'] != self.owner and lock['expires'] > now:
+            return 0
+        _Put_Json(self.bucket, _Key(self.folder, LOCK_NAME), {"owner": self.owner, "expires": now + self.lock_s, "controller": self.controller.state()})
+        lock = _Get_Json(self.bucket, _Key(self.folder, LOCK_NAME))
+        return 1 if lock is not None and lock['owner'] == self.owner else 0
+
+    # The ETag is recorded once the object is read and handled (the generator resumed), so a failed read is retried on the next poll
+    def _changed(self, items):
+        for item in items:
+            if self.etags.get(item['key']) != item['etag']:
+                data = _Get_Json(self.bucket, item['key'])
+                if data is not None:
+                    yield data
+                self.etags[item['key']] = item['etag']
+
+    def active(self, now):
+        return sum(1 for node, (granted, _) in self.granted.items() if node not in self.done and now - granted < self.lease_s)
+
+    # Returns [(node, wait_s)] admitted by this poll
+    def poll(self, now):
+        items = {"requests": [], "grants": [], "done": []}
+        for item in List_Cloud_Objects(self.bucket, _Key(self.folder)):
+            kind, _, name = item['key'][len(_Key(self.folder)) + 1:].partition("/")
+            if kind in items and name.endswith(".json"):
+                items[kind].append(item)
+
+        for request in self._changed(items['requests']):
+            if self.requests.get(request['node'], {}).get('attempt') != request['attempt']: # A new attempt
+                self.requests[request['node']] = request
+                self.granted.pop(request['node'], None)
+                self.done.pop(request['node'], None)
+        for grant in self._changed(items['grants']): # e.g. by a previous coordinator
+            if grant['attempt'] == self.requests.get(grant['node'], {}).get('attempt'):
+                self.granted.setdefault(grant['node'], (grant['granted'], grant.get('active', 1)))
+        for done in self._changed(items['done']):
+            if done['attempt'] == self.requests.get(done['node'], {}).get('attempt') and done['node'] not in self.done:
+                # The downloads sharing the bucket with it, at its start or at its end
+                granted, active = self.granted.get(done['node'], (now, 1))
+                active = max(active, self.active(now))
+                self.done[done['node']] = done
+                self.controller.observe(now, done.get('dl_throughput_Gbps'), active, granted, done.get('transferred size_GB'))
+
+        pending = sorted((node for node in self.requests if node not in self.granted and node not in self.done), key=lambda node: self.requests[node]['requested'])
+        admitted = []
+        count = self.controller.admit(now, self.active(now), len(pending))
+        active = self.active(now) + count
+        for node in pending[:count]: # First come, first served
+            self.admitted += 1
+            _Put_Json(self.bucket, _Key(self.folder, "grants", f"{node}.json"),
+                      {"node": node, "attempt": self.requests[node]['attempt'], "granted": now, "active": active, "lease_s": self.lease_s, "admitted": self.admitted})
+            self.granted[node] = (now, active)
+            admitted.append((node, round(now - self.requests[node]['requested'], 3)))
+        return admitted
@@ -0,0 +1,71 @@
+import sys
+import json
+import time
+import random
+import asyncio
+from aiohttp import web
+
+# A fake vLLM server with a configurable latency behavior, for testing the load generator and the goodput search without GPUs
+#   python3 fake_vllm.py {PORT} [{TTFT ms} {ITL ms} {OUTPUT TOKENS} {KNEE} {MAX SEQS}]
+#   python3 load_generator.py http://127.0.0.1:{PORT}/v1/chat/completions 1.0 50
+# It streams OUTPUT TOKENS tokens (or max_tokens if fewer) per chat completion, after TTFT ms, one every ITL ms, like an
+# OpenAI-compatible server; beyond KNEE running requests, the prefill and each token slow down in proportion, like a batch
+# sharing the GPUs, and beyond MAX SEQS the requests wait for a slot, like the vLLM scheduler queue
+JITTER = 0.1 # The relative spread of each delay
+
+class Fake_Server:
+    def __init__(self, ttft_ms, itl_ms, output_tokens, knee, max_seqs):
+        self.ttft_s = ttft_ms / 1000
+        self.itl_s = itl_ms / 1000
+        self.output_tokens = output_tokens
+        self.knee = knee
+        self.slots = asyncio.Semaphore(max_seqs)
+        self.running = 0
+        self.requests = 0
+
+    def delay(self, base_s):
+        return base_s * max(1.0, self.running / self.knee) * random.uniform(1 - JITTER, 1 + JITTER)
+
+    async def health(self, request):
+        return web.Response(text="")
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        prompt_tokens = sum(len(str(message.get('content', "")).split()) for message in body.get('messages', []))
+        output_tokens = min(self.output_tokens, body.get('max_tokens') or self.output_tokens)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        async with self.slots:
+            self.running += 1
+            self.requests += 1
+            try:
+                await asyncio.sleep(self.delay(self.ttft_s))
+                for index in range(output_tokens):
+                    if index > 0:
+                        await asyncio.sleep(self.delay(self.itl_s))
+                    event = {"object": "chat.completion.chunk", "created": int(time.time()), "model": body.get('model', ""),
+                             "choices": [{"index": 0, "delta": {"content": f"token{index} "}, "finish_reason": None}]}
+                    await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            finally:
+                self.running -= 1
+        if (body.get('stream_options') or {}).get('include_usage'):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": output_tokens, "total_tokens": prompt_tokens + output_tokens}
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 fake_vllm.py {PORT} [{TTFT ms} {ITL ms} {OUTPUT TOKENS} {KNEE} {MAX SEQS}]")
+        sys.exit(1)
+    port = int(sys.argv[1])
+    values = [float(value) for value in sys.argv[2:7]]
+    ttft_ms, itl_ms, output_tokens, knee, max_seqs = values + [50, 10, 128, 16, 256][len(values):]
+    server = Fake_Server(ttft_ms, itl_ms, int(output_tokens), knee, int(max_seqs))
+    app = web.Application()
+    app.router.add_get("/health", server.health)
+    app.router.add_post("/v1/chat/completions", server.chat_completions)
+    print(f"Fake vLLM on 127.0.0.1:{port}: TTFT {ttft_ms} ms, ITL {itl_ms} ms, {int(output_tokens)} tokens, knee {knee}, max seqs {int(max_seqs)}", flush=True)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
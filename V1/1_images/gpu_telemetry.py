@@ -0,0 +1,146 @@
+import re
+import sys
+import json
+import time
+import threading
+import subprocess
+import numpy as np
+
+# Per-GPU telemetry sampled in the background from the concise output of rocm-smi, into a fixed-size ring buffer
+# The series are shipped next to RESULT as {NODE_NAME}.telemetry.json, and summarized in RESULT['gpu telemetry']
+
+# Column -> unit in the concise output
+#  Device  Node  IDs              Temp        Power     Partitions          SCLK     MCLK     Fan  Perf  PwrCap   VRAM%  GPU%
+#  0       2     0x74b9,   43855  47.0°C      358.0W    NPS1, SPX, 0        2097Mhz  1500Mhz  0%   auto  1000.0W  91%    100%
+FIELDS = ["temp_c", "power_w", "sclk_mhz", "mclk_mhz", "fan_pct", "power cap_w", "vram_pct", "gpu_pct"]
+
+def _Value(unit):
+    return rf"(?:([\d.]+){unit}|N/A)"
+
+ROW_PATTERN = re.compile(
+    rf"^\s*(\d+)\s+\d+\s+.*?\s{_Value('°C')}\s+{_Value('W')}\s+.*?\s{_Value('Mhz')}\s+{_Value('Mhz')}"
+    rf"\s+{_Value('%')}\s+\S+\s+{_Value('W')}\s+{_Value('%')}\s+{_Value('%')}\s*$")
+
+# The GPU rows of a concise rocm-smi output: [{"device", "temp_c", "power_w", ...}, ...], with None for N/A
+def Parse_Rocm_Smi(text):
+    rows = []
+    for line in text.splitlines():
+        match = ROW_PATTERN.match(line)
+        if match is None:
+            continue
+        row = {"device": int(match.group(1))}
+        for name, value in zip(FIELDS, match.groups()[1:]):
+            row[name] = float(value) if value is not None else None
+        rows.append(row)
+    return rows
+
+# rocm-smi --showproduct: {device: {"Card Model": "0x74b9", "Card SKU": ..., "GFX Version": ...}}
+PRODUCT_PATTERN = re.compile(r"^GPU\[(\d+)\]\s*:\s*([^:]+?):\s*(.*?)\s*$")
+
+def Parse_Product_Info(text):
+    products = {}
+    for line in text.splitlines():
+        match = PRODUCT_PATTERN.match(line)
+        if match:
+            products.setdefault(int(match.group(1)), {})[match.group(2).strip()] = match.group(3)
+    return products
+
+SAMPLE_INTERVAL_S = 10.0
+CAPACITY          = 720 # Samples kept, 2 hours at the default interval; the oldest ones are overwritten
+
+class GPU_Sampler:
+    def __init__(self, interval_s=SAMPLE_INTERVAL_S, capacity=CAPACITY, command=("rocm-smi",)):
+        self.interval_s = interval_s
+        self.capacity = capacity
+        self.command = list(command)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = None # (capacity, GPUs, FIELDS) float32, NaN for N/A, allocated on the first sample
+        self.count = 0     # Samples taken since the start
+        self.last_text = "" # The last raw output, for the human-readable log
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        text = subprocess.run(self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+        rows = Parse_Rocm_Smi(text)
+        with self.lock:
+            self.last_text = text
+            if not rows:
+                return
+            if self.values is None:
+                self.values = np.full((self.capacity, len(rows), len(FIELDS)), np.nan, dtype=np.float32)
+            index = self.count % self.capacity
+            self.times[index] = time.time()
+            self.values[index] = np.nan
+            for gpu, row in enumerate(rows[:self.values.shape[1]]):
+                self.values[index, gpu] = [np.nan if row[name] is None else row[name] for name in FIELDS]
+            self.count += 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                self.sample()
+            except OSError as e: # No rocm-smi
+                print(f"The error message: {e}", flush=True)
+                return
+            self.stop_event.wait(max(self.interval_s - (time.perf_counter() - start), 0))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    # (times, values) in time order, copies
+    def snapshot(self):
+        with self.lock:
+            if self.values is None:
+                return np.zeros(0), np.zeros((0, 0, len(FIELDS)), dtype=np.float32)
+            if self.count <= self.capacity:
+                return self.times[:self.count].copy(), self.values[:self.count].copy()
+            index = self.count % self.capacity
+            return np.roll(self.times, -index), np.roll(self.values, -index, axis=0)
+
+    # {field: {"mean", "max"}} over all GPUs and samples in the buffer
+    def summary(self):
+        times, values = self.snapshot()
+        result = {"samples": int(len(times)), "interval_s": self.interval_s}
+        if len(times) == 0:
+            return result
+        for i, name in enumerate(FIELDS):
+            column = values[:, :, i]
+            if np.isnan(column).all():
+                continue
+            result[name] = {"mean": round(float(np.nanmean(column)), 1), "max": round(float(np.nanmax(column)), 1)}
+        return result
+
+    # Compact time series: the sample times as offsets from "start", and per field a list of samples, each a list per GPU
+    def to_dict(self):
+        times, values = self.snapshot()
+        series = {}
+        for i, name in enumerate(FIELDS):
+            column = np.round(values[:, :, i].astype(np.float64), 1)
+            series[name] = [[None if np.isnan(value) else value for value in sample] for sample in column.tolist()]
+        return {
+            "start": round(float(times[0]), 3) if len(times) else 0.0,
+            "interval_s": self.interval_s,
+            "gpus": int(values.shape[1]),
+            "fields": FIELDS,
+            "offsets_s": np.round(times - times[0], 1).tolist() if len(times) else [],
+            "series": series,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+# python3 gpu_telemetry.py {log file}, to parse the rocm-smi output saved in a log, e.g. the test results
+if __name__ == "__main__":
+    with open(sys.argv[1], errors="replace") as f:
+        for row in Parse_Rocm_Smi(f.read()):
+            print(row)
@@ -1,8 +1,22 @@
 import os
-import subprocess
+import sys
+import gzip
+import json
+import fcntl
+import shutil
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 load_dotenv()
+try:
+    import zstandard
+except ImportError: # Not in every image, the logs are then compressed with gzip
+    zstandard = None
 
 # Access to DO Spaces
 SPACES_URL    = os.getenv("AWS_ENDPOINT_URL", "")
@@ -10,56 +24,448 @@ SPACES_REGION = os.getenv("AWS_REGION", "")
 SPACES_ID     = os.getenv("AWS_ACCESS_KEY_ID", "")
 SPACES_KEY    = os.getenv("AWS_SECRET_ACCESS_KEY", "")
 
-# Create the configuration file for rclone
+# The endpoint may be given without a scheme, e.g. "atl1.digitaloceanspaces.com"
+# A local S3-compatible stand-in can be used for testing, e.g. AWS_ENDPOINT_URL=http://127.0.0.1:9000
+if SPACES_URL and "://" not in SPACES_URL:
+    SPACES_URL = "https://" + SPACES_URL
+
+# The HTTP connection pool is shared by all transfers in the process, so it should be >= the largest concurrency used
+MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "64"))
+READ_BLOCK_SIZE      = 1024 * 1024   # Bytes per read from a response body or a local file
+MIN_PART_SIZE        = 5 * 1024 * 1024 # S3 minimum size of a multipart part (except the last one)
+MAX_PARTS            = 10000           # S3 maximum number of parts in a multipart upload
+HASH_WORKERS         = int(os.getenv("HASH_WORKERS", "4")) # Threads verifying the downloaded files, one file at a time each
+
+# The compression of the uploaded logs: "zstd" (gzip if the zstandard package is not installed), "gzip" or "none"
+# A log uploaded to {key} is stored as {key}.zst or {key}.gz, with its Content-Encoding, and the analysis tools read
+# either as they read the plain logs (log_utils.open_log); the repeated SMI blocks and the Megatron/vLLM logs compress ~10x
+LOG_COMPRESSION  = os.getenv("LOG_COMPRESSION", "zstd")
+ZSTD_LEVEL       = 3
+COMPRESSION_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+# The statistics of the last Uploader/Downloader call, including the timing of each part
+# {"direction", "files", "bytes", "duration_s", "throughput_Gbps", "parts": [{"key", "offset", "size", "duration_s"}, ...]}
+TRANSFER_STATS = {}
+
+_client = None
+_client_lock = threading.Lock()
+
+# One client (and one pooled set of HTTP connections) per process, created on first use
+# The client is thread-safe and shared by all worker threads
+def Get_S3_Client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = Config(
+                max_pool_connections=MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 5, "mode": "standard"},
+                tcp_keepalive=True,
+            )
+            _client = boto3.session.Session().client(
+                "s3",
+                endpoint_url=SPACES_URL or None,
+                region_name=SPACES_REGION or None,
+                aws_access_key_id=SPACES_ID or None,
+                aws_secret_access_key=SPACES_KEY or None,
+                config=config,
+            )
+    return _client
+
+# Create the configuration file for rclone, which is still used for manual transfers on the Test Worker
 # https://developers.cloudflare.com/r2/examples/rclone/
-filename = os.path.expanduser("~")+"/.config/rclone/rclone.conf"
-with open(filename,'w') as f:
-    f.write("[ds]\n")
-    f.write("type = s3\n")
-    f.write("provider = DigitalOcean\n")
-    f.write("access_key_id = {}\n".format(SPACES_ID))
-    f.write("secret_access_key = {}\n".format(SPACES_KEY))
-    f.write("region = {}\n".format(SPACES_REGION))
-    f.write("endpoint = {}\n".format(SPACES_URL))
-    f.write("bucket_acl = private")
+def Write_Rclone_Config():
+    filename = os.path.expanduser("~")+"/.config/rclone/rclone.conf"
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename,'w') as f:
+        f.write("[ds]\n")
+        f.write("type = s3\n")
+        f.write("provider = DigitalOcean\n")
+        f.write("access_key_id = {}\n".format(SPACES_ID))
+        f.write("secret_access_key = {}\n".format(SPACES_KEY))
+        f.write("region = {}\n".format(SPACES_REGION))
+        f.write("endpoint = {}\n".format(os.getenv("AWS_ENDPOINT_URL", "")))
+        f.write("bucket_acl = private")
+    print(f"The rclone configuration file is written to {filename}", flush=True)
+
+# "10M" -> 10485760, the same binary units as rclone (K, M, G), or a plain number of bytes
+def Parse_Size(size):
+    text = str(size).strip().upper().rstrip("IB")
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+# Split an object into byte ranges: [(offset, size), ...]
+def _Split_Parts(total_size, part_size):
+    part_size = max(part_size, MIN_PART_SIZE)
+    if total_size > part_size * MAX_PARTS: # Keep the number of parts within the S3 limit
+        part_size = -(-total_size // MAX_PARTS)
+    if total_size == 0:
+        return [(0, 0)]
+    return [(offset, min(part_size, total_size - offset)) for offset in range(0, total_size, part_size)]
+
+def _Start_Stats(direction):
+    TRANSFER_STATS.clear()
+    TRANSFER_STATS.update({"direction": direction, "files": 0, "bytes": 0, "duration_s": 0.0, "throughput_Gbps": 0.0, "parts": []})
+    return time.perf_counter()
+
+def _Finish_Stats(start):
+    TRANSFER_STATS['duration_s'] = round(time.perf_counter() - start, 3)
+    if TRANSFER_STATS['duration_s'] > 0:
+        TRANSFER_STATS['throughput_Gbps'] = round(TRANSFER_STATS['bytes'] * 8 / TRANSFER_STATS['duration_s'] / 1_000_000_000, 3)
+
+def _Record_Part(key, offset, size, start):
+    TRANSFER_STATS['parts'].append({"key": key, "offset": offset, "size": size, "duration_s": round(time.perf_counter() - start, 3)})
+
+# List the objects under a key: [{"key", "size", "etag"}, ...]
+# A key matching a single object returns that object, otherwise the key is handled as a folder
+def List_Cloud_Objects(bucket, key):
+    client = Get_S3_Client()
+    key = key.strip("/")
+    try:
+        head = client.head_object(Bucket=bucket, Key=key)
+        return [{"key": key, "size": head['ContentLength'], "etag": head['ETag'].strip('"')}]
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ("404", "NoSuchKey", "NotFound"):
+            raise
+    objects = []
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=key + "/"):
+        for item in page.get('Contents', []):
+            objects.append({"key": item['Key'], "size": item['Size'], "etag": item['ETag'].strip('"')})
+    return objects
+
+# Download one byte range of an object straight into its offset in the local file
+def _Download_Part(bucket, key, fd, offset, size, whole):
+    start = time.perf_counter()
+    client = Get_S3_Client()
+    if whole:
+        response = client.get_object(Bucket=bucket, Key=key)
+    else:
+        response = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={offset}-{offset + size - 1}")
+    position = offset
+    for chunk in response['Body'].iter_chunks(READ_BLOCK_SIZE):
+        os.pwrite(fd, chunk, position)
+        position += len(chunk)
+    if position - offset != size:
+        raise IOError(f"Short read of {key} at offset {offset}: {position - offset} of {size} bytes")
+    _Record_Part(key, offset, size, start)
+    return size
+
+# Verify a file while it is downloaded, against the SHA in its blob name (sha256, or git sha1 for the small files)
+# The parts are hashed in offset order as soon as they are contiguous, reading them back from the page cache right
+# after they are written, so the hashing runs in parallel with the transfer and the file is never read again from disk
+# A SHA-256 state cannot be combined from independent per-part digests, so one hasher per file consumes the parts in order
+class _Stream_Verifier:
+    def __init__(self, fd, size, blob):
+        self.fd = fd
+        self.blob = blob
+        self.position = 0
+        self.pending = {}   # offset -> size, the parts written but not hashed yet
+        self.lock = threading.Lock()
+        self.hash_lock = threading.Lock()
+        self.duration_s = 0.0
+        if len(blob) == 64:
+            self.digest = hashlib.sha256()
+        else:
+            self.digest = hashlib.sha1(f"blob {size}\0".encode())
+
+    def part_done(self, offset, size):
+        with self.lock:
+            self.pending[offset] = size
+
+    def advance(self):
+        with self.hash_lock:
+            while True:
+                with self.lock:
+                    size = self.pending.pop(self.position, None)
+                if size is None:
+                    return
+                start = time.perf_counter()
+                end = self.position + size
+                while self.position < end:
+                    block = os.pread(self.fd, min(READ_BLOCK_SIZE, end - self.position), self.position)
+                    if not block:
+                        raise IOError(f"Short read while verifying blob {self.blob}")
+                    self.digest.update(block)
+                    self.position += len(block)
+                self.duration_s += time.perf_counter() - start
+
+    def is_valid(self):
+        return self.digest.hexdigest() == self.blob
+
+def _Can_Verify(blob):
+    return blob is not None and len(blob) in (40, 64) and all(c in "0123456789abcdef" for c in blob)
+
+# Download a list of objects [(object, local file, blob or None), ...] with ranged GETs running in parallel across all files
+# Each file is written to "<local file>.partial" first and renamed when all its parts are complete
+# Files with a blob name are verified while streaming, and the corrupt ones are deleted and returned
+def _Download_Objects(bucket, targets, part_size, concurrency):
+    files = []
+    corrupt = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool, ThreadPoolExecutor(max_workers=HASH_WORKERS) as hash_pool:
+            futures = {}
+            for item, local_file, blob in targets:
+                os.makedirs(os.path.dirname(local_file) or ".", exist_ok=True)
+                temp_file = local_file + ".partial"
+                fd = os.open(temp_file, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+                verifier = _Stream_Verifier(fd, item['size'], blob) if _Can_Verify(blob) else None
+                files.append((fd, temp_file, local_file, verifier))
+                os.ftruncate(fd, item['size'])
+                parts = _Split_Parts(item['size'], part_size)
+                for offset, size in parts:
+                    if size > 0:
+                        futures[pool.submit(_Download_Part, bucket, item['key'], fd, offset, size, len(parts) == 1)] = (verifier, offset)
+            hashes = []
+            try:
+                for future in as_completed(futures):
+                    TRANSFER_STATS['bytes'] += future.result()
+                    verifier, offset = futures[future]
+                    if verifier is not None:
+                        verifier.part_done(offset, future.result())
+                        hashes.append(hash_pool.submit(verifier.advance))
+            except Exception:
+                pool.shutdown(wait=True, cancel_futures=True) # Stop the queued parts before closing the files
+                raise
+            transfer_end = time.perf_counter()
+            for future in hashes:
+                future.result()
+            if hashes:
+                TRANSFER_STATS['verify tail_s'] = round(TRANSFER_STATS.get('verify tail_s', 0) + time.perf_counter() - transfer_end, 3)
+    finally:
+        for fd, _, _, _ in files:
+            os.close(fd)
+    for _, temp_file, local_file, verifier in files:
+        if verifier is not None:
+            TRANSFER_STATS['verify time_s'] = round(TRANSFER_STATS.get('verify time_s', 0) + verifier.duration_s, 3)
+            TRANSFER_STATS['verified files'] = TRANSFER_STATS.get('verified files', 0) + 1
+            if not verifier.is_valid():
+                print(f"Corrupt blob {verifier.blob}: {local_file}", flush=True)
+                os.remove(temp_file)
+                corrupt.append(verifier.blob)
+                continue
+        os.replace(temp_file, local_file)
+    TRANSFER_STATS['files'] += len(files)
+    return corrupt
+
+# download_cloud_to_local, a file or directory
+def Downloader(bucket, key, local, chunk_size_mbype="10M", concurrency="10"):
+    print(f"Download ds:{bucket}/{key} -> {local}, part size {chunk_size_mbype}, concurrency {concurrency}", flush=True)
+    start = _Start_Stats("download")
+    try:
+        objects = List_Cloud_Objects(bucket, key)
+        if len(objects) == 0:
+            raise FileNotFoundError(f"ds:{bucket}/{key} does not exist or is empty")
+        if len(objects) == 1 and objects[0]['key'] == key.strip("/"): # A single file
+            targets = [(objects[0], local, None)]
+        else: # A folder
+            prefix = key.strip("/") + "/"
+            targets = [(item, os.path.join(local, item['key'][len(prefix):]), None) for item in objects]
+        _Download_Objects(bucket, targets, Parse_Size(chunk_size_mbype), int(concurrency))
+    except (BotoCoreError, ClientError, OSError) as e:
+        print(f"The error message: {e}", flush=True)
+        return 0
+    finally:
+        _Finish_Stats(start)
+    print(f"Downloaded {TRANSFER_STATS['files']} files, {TRANSFER_STATS['bytes']} bytes in {TRANSFER_STATS['duration_s']} seconds", flush=True)
+    return 1
+
+# Download some objects of the folder {key}, as listed by List_Cloud_Objects(), e.g. only those changed since the last download
+def Download_Object_List(bucket, key, objects, local, chunk_size_mbype="10M", concurrency="10"):
+    start = _Start_Stats("download")
+    try:
+        prefix = key.strip("/") + "/"
+        targets = [(item, os.path.join(local, item['key'][len(prefix):]), None) for item in objects]
+        _Download_Objects(bucket, targets, Parse_Size(chunk_size_mbype), int(concurrency))
+    except (BotoCoreError, ClientError, OSError) as e:
+        print(f"The error message: {e}", flush=True)
+        return 0
+    finally:
+        _Finish_Stats(start)
+    return 1
+
+# The codec of the uploaded logs, or None to upload them plain
+def Log_Codec():
+    if LOG_COMPRESSION == "zstd" and zstandard is None:
+        return "gzip"
+    return LOG_COMPRESSION if LOG_COMPRESSION in COMPRESSION_SUFFIXES else None
+
+# Compress a local file into {target}, streaming it in READ_BLOCK_SIZE blocks
+def Compress_File(local_file, target, codec):
+    with open(local_file, "rb") as src, open(target, "wb") as dst:
+        if codec == "zstd":
+            with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(dst, closefd=False) as writer:
+                shutil.copyfileobj(src, writer, READ_BLOCK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=dst, mode="wb", mtime=0) as writer:
+                shutil.copyfileobj(src, writer, READ_BLOCK_SIZE)
+    return target
+
+def Compress_Bytes(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, mtime=0)
+
+# Upload one byte range of a local file as a part of a multipart upload
+def _Upload_Part(bucket, key, upload_id, number, local_file, offset, size):
+    start = time.perf_counter()
+    with open(local_file, "rb") as f:
+        f.seek(offset)
+        body = f.read(size)
+    response = Get_S3_Client().upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body)
+    _Record_Part(key, offset, size, start)
+    return {"PartNumber": number, "ETag": response['ETag']}
+
+# Upload a whole local file with a single PUT
+def _Upload_Object(bucket, key, local_file, size, extra_args):
+    start = time.perf_counter()
+    with open(local_file, "rb") as f:
+        Get_S3_Client().put_object(Bucket=bucket, Key=key, Body=f, **extra_args)
+    _Record_Part(key, 0, size, start)
+    return size
+
+# Upload a list of local files [(local file, key), ...] with parts running in parallel across all files
+# Symlinks are resolved, so the target files are uploaded
+def _Upload_Files(bucket, targets, part_size, concurrency, extra_args=None):
+    extra_args = extra_args or {}
+    client = Get_S3_Client()
+    uploads = [] # [(key, upload id, size, [futures])], the multipart uploads not completed yet
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            singles = []
+            for local_file, key in targets:
+                size = os.path.getsize(local_file)
+                parts = _Split_Parts(size, part_size)
+                if len(parts) == 1:
+                    singles.append(pool.submit(_Upload_Object, bucket, key, local_file, size, extra_args))
+                    continue
+                upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)['UploadId']
+                futures = [pool.submit(_Upload_Part, bucket, key, upload_id, number, local_file, offset, length)
+                           for number, (offset, length) in enumerate(parts, start=1)]
+                uploads.append((key, upload_id, size, futures))
+            for future in singles:
+                TRANSFER_STATS['bytes'] += future.result()
+            while uploads:
+                key, upload_id, size, futures = uploads[0]
+                parts = [future.result() for future in futures]
+                client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+                TRANSFER_STATS['bytes'] += size
+                uploads.pop(0)
+    except Exception:
+        for key, upload_id, _, _ in uploads: # Do not leave incomplete uploads behind, which are billed as storage
+            try:
+                client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            except (BotoCoreError, ClientError):
+                pass
+        raise
+    TRANSFER_STATS['files'] += len(targets)
 
 # upload_local_to_cloud, a file or directory
-# https://rclone.org/commands/rclone_copyto/
-def Uploader(local, bucket, key, chunk_size_mbype="10M", concurrency="10"):    
-    cmd = f'rclone copyto {local} ds:{bucket}/{key} --s3-chunk-size={chunk_size_mbype} --transfers={concurrency} --ignore-times'
-    print(cmd, flush=True)
-    try:                                      
-        subprocess.run(cmd, shell=True, check=True, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
+# compress=True: the files are compressed with Log_Codec() on the way, each uploaded to {key}.zst (or .gz)
+# TRANSFER_STATS['bytes'] then counts the compressed bytes, and 'raw bytes' the bytes of the local files
+def Uploader(local, bucket, key, chunk_size_mbype="10M", concurrency="10", compress=False):
+    codec = Log_Codec() if compress else None
+    suffix = COMPRESSION_SUFFIXES.get(codec, "")
+    print(f"Upload {local} -> ds:{bucket}/{key}{suffix}, part size {chunk_size_mbype}, concurrency {concurrency}", flush=True)
+    start = _Start_Stats("upload")
+    compressed = []
+    try:
+        if os.path.isdir(local):
+            targets = []
+            for root, dirs, files in os.walk(local):
+                for file in files:
+                    local_file = os.path.join(root, file)
+                    relative = os.path.relpath(local_file, local).replace(os.sep, "/")
+                    targets.append((local_file, f"{key.strip('/')}/{relative}"))
+        else:
+            targets = [(local, key.strip("/"))]
+        if codec is not None: # Next to the local files, while they are not written
+            TRANSFER_STATS['raw bytes'] = sum(os.path.getsize(local_file) for local_file, _ in targets)
+            for index, (local_file, target_key) in enumerate(targets):
+                compressed.append(Compress_File(local_file, f"{local_file}{suffix}.upload", codec))
+                targets[index] = (compressed[-1], target_key + suffix)
+        _Upload_Files(bucket, targets, Parse_Size(chunk_size_mbype), int(concurrency), {"ContentEncoding": codec} if codec else None)
+    except (BotoCoreError, ClientError, OSError) as e:
         print(f"The error message: {e}", flush=True)
         return 0
+    finally:
+        _Finish_Stats(start)
+        for compressed_file in compressed:
+            if os.path.exists(compressed_file):
+                os.remove(compressed_file)
     return 1
 
-# download_cloud_to_local, a file or directory
-# https://rclone.org/commands/rclone_copyto/
-def Downloader(bucket, key, local, chunk_size_mbype="10M", concurrency="10"):    
-    cmd = f'rclone copyto ds:{bucket}/{key} {local} --s3-chunk-size={chunk_size_mbype} --transfers={concurrency} --ignore-times'
-    print(cmd, flush=True)
-    try:                                      
-        subprocess.run(cmd, shell=True, check=True, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
+# Upload bytes from memory with a single PUT
+def Upload_Bytes(data, bucket, key, content_encoding=None):
+    try:
+        Get_S3_Client().put_object(Bucket=bucket, Key=key, Body=data, **({"ContentEncoding": content_encoding} if content_encoding else {}))
+    except (BotoCoreError, ClientError) as e:
         print(f"The error message: {e}", flush=True)
         return 0
     return 1
 
+# Ship a growing local log file as numbered segments: ds:{bucket}/{prefix}/000001.log, 000002.log, ...
+# Each call reads and uploads only the bytes appended since the last successful call, so the cost does not grow with the log
+# A failed upload is retried from the same offset by the next call
+# With LOG_COMPRESSION, each segment is compressed on its own: 000001.log.zst, ...
+# The numbering continues after the segments already in {prefix}, e.g. shipped before a container restart, so they are
+# never overwritten and the logs of the two processes follow each other
+class Log_Shipper:
+    def __init__(self, local_file, bucket, prefix, max_segment_bytes=8 * 1024 * 1024):
+        self.local_file = local_file
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.max_segment_bytes = max_segment_bytes
+        self.codec = Log_Codec()
+        self.offset = 0     # The bytes of the local file already shipped
+        self.segments = 0   # The segments already shipped, by this process
+        self.first = self._Last_Segment() + 1
+
+    def _Last_Segment(self):
+        try:
+            names = [item['key'][len(self.prefix) + 1:] for item in List_Cloud_Objects(self.bucket, self.prefix)]
+        except (BotoCoreError, ClientError) as e:
+            print(f"The error message: {e}", flush=True)
+            print(f"Attention: the segments in ds:{self.bucket}/{self.prefix} are unknown, numbering from 000001", flush=True)
+            return 0
+        numbers = [int(name.split(".")[0]) for name in names if name.split(".")[0].isdigit()]
+        return max(numbers, default=0)
+
+    def ship(self):
+        if not os.path.isfile(self.local_file):
+            return 0
+        if os.path.getsize(self.local_file) < self.offset: # The file was truncated, ship it again from the start
+            self.offset = 0
+        shipped = 0
+        with open(self.local_file, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(self.max_segment_bytes)
+                if not data:
+                    break
+                key = f"{self.prefix}/{self.first + self.segments:06d}.log"
+                if self.codec is not None:
+                    if not Upload_Bytes(Compress_Bytes(data, self.codec), self.bucket, key + COMPRESSION_SUFFIXES[self.codec], self.codec):
+                        break
+                elif not Upload_Bytes(data, self.bucket, key):
+                    break
+                self.segments += 1
+                self.offset += len(data)
+                shipped += 1
+        return shipped
+
 # Check the folder in Cloud
 def Check_Cloud_Folder(bucket, model_folder):
-    cmd = f'rclone ls ds:{bucket}/{model_folder}'
-    print(cmd, flush=True)    
-    try:                                      
-        result = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        file_list = result.stdout.splitlines()
+    print(f"List ds:{bucket}/{model_folder}", flush=True)
+    try:
+        file_list = List_Cloud_Objects(bucket, model_folder)
         print(f"The number of files in {bucket}/{model_folder}: {len(file_list)}", flush=True)
         return len(file_list) # 0 or more
-    except subprocess.CalledProcessError as e:
+    except (BotoCoreError, ClientError) as e:
         print(f"The error message: {e}", flush=True)
         return 0
-    
+
 # Check the local folder
 def Check_Local_Folder(local_path):
     try:
@@ -73,13 +479,431 @@ def Check_Local_Folder(local_path):
     except Exception as e:
         print(f"The error message: {e}", flush=True)
         return 0
-    
+
 # For the download/upload throughput calculation
 def Get_Folder_Size(path):
     total_size = 0
+    seen = set()
     for dirpath, dirnames, filenames in os.walk(path):
         for f in filenames:
-            fp = os.path.join(dirpath, f)
-            if os.path.isfile(fp):  # Make sure it's a file
+            fp = os.path.realpath(os.path.join(dirpath, f))
+            if os.path.isfile(fp) and fp not in seen:  # Make sure it's a file, and count each blob once, whichever symlinks (snapshots, host blob cache) point at it
+                seen.add(fp)
                 total_size += os.path.getsize(fp)
     return total_size
+
+# Readiness markers, the hand-over between the containers of a pod, e.g. the model loaded alongside the training
+# The folder is an emptyDir shared by the containers, so it lives as long as the pod, and survives the container restarts
+MARKER_DIR = os.getenv("MARKER_DIR", "/markers")
+
+def Write_Marker(name, data):
+    try:
+        os.makedirs(MARKER_DIR, exist_ok=True)
+        path = os.path.join(MARKER_DIR, f"{name}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(path + ".tmp", path) # Never seen half-written
+        return 1
+    except OSError as e:
+        print(f"The error message: {e}", flush=True)
+        return 0
+
+# The marker, or None if not written (yet)
+def Read_Marker(name):
+    try:
+        with open(os.path.join(MARKER_DIR, f"{name}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Removes the marker of a previous container run, so it is not taken for the one of this run
+def Clear_Marker(name):
+    try:
+        os.remove(os.path.join(MARKER_DIR, f"{name}.json"))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"The error message: {e}", flush=True)
+
+# The Hugging Face cache layout of a model folder:
+#   blobs/{SHA}                     the content, named by its SHA (sha256 for LFS files, git sha1 for the others)
+#   snapshots/{REVISION}/{FILE}  -> ../../blobs/{SHA}
+#   refs/main                       the revision
+# The model is saved in the bucket with the symlinks resolved (no blobs), so a manifest saved next to the files
+# maps each snapshot file to its blob: {"refs": {"main": REVISION}, "files": {"snapshots/{REVISION}/{FILE}": {"blob": SHA, "size": N}}}
+MANIFEST_NAME   = "manifest.json"
+SYNC_STATE_NAME = ".sync_state.json"   # The ETags of the files synced without a manifest
+
+def _Sha256_File(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Build the manifest of a local model folder, using the snapshot symlinks or hashing the files already resolved
+def Build_Model_Manifest(local_path):
+    manifest = {"refs": {}, "files": {}}
+    refs_path = os.path.join(local_path, "refs")
+    for root, dirs, files in os.walk(refs_path):
+        for file in files:
+            with open(os.path.join(root, file)) as f:
+                manifest['refs'][os.path.relpath(os.path.join(root, file), refs_path)] = f.read().strip()
+    for root, dirs, files in os.walk(os.path.join(local_path, "snapshots")):
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            relative = os.path.relpath(path, local_path).replace(os.sep, "/")
+            if os.path.islink(path) and os.path.basename(os.path.dirname(os.readlink(path))) == "blobs":
+                blob = os.path.basename(os.readlink(path))
+            else:
+                blob = _Sha256_File(path)
+            manifest['files'][relative] = {"blob": blob, "size": os.path.getsize(path)}
+    return manifest
+
+def _Read_Cloud_Manifest(bucket, key):
+    response = Get_S3_Client().get_object(Bucket=bucket, Key=key)
+    return json.loads(response['Body'].read())
+
+# Point a snapshot file at its blob, replacing a regular file or a stale symlink
+def _Link_Blob(file_path, blob_path):
+    target = os.path.relpath(blob_path, os.path.dirname(file_path))
+    if os.path.islink(file_path) and os.readlink(file_path) == target:
+        return
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if os.path.lexists(file_path):
+        os.remove(file_path)
+    os.symlink(target, file_path)
+
+# Host-wide blob cache, shared by the model folders and the pods of a host: {cache}/{sha}, one file per blob whichever
+# models contain it, and {model folder}/blobs/{sha} a symlink to it, so a model sharing blobs with one loaded before
+# (e.g. the tokenizer files of Llama 8B and 70B) fetches only the others
+# A loader holds a shared lock on {cache}/.lock from the first check to the last link, and the eviction an exclusive one,
+# so a blob is never evicted between its check and its link; a loader also holds an exclusive lock on {cache}/.locks/{sha}
+# while it fetches the blob, so the concurrent loaders of a host fetch each blob once
+# The mtime of a blob is its last use (the access time is not kept by every mount), for the least-recently-used eviction
+BLOB_CACHE_LOCK   = ".lock"
+BLOB_LOCK_FOLDER  = ".locks"
+
+def _Lock_File(path, mode, blocking=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, mode | (0 if blocking else fcntl.LOCK_NB))
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+def _Blob_Complete(blob_path, size):
+    return os.path.isfile(blob_path) and os.path.getsize(blob_path) == size
+
+# Lock the blobs to fetch: [(object, blob path, blob), ...] -> the ones locked and still missing, and the ones another loader is fetching
+# The blobs fetched by another loader in the meantime are counted as skipped and 'shared files'
+def _Claim_Blobs(blob_cache, targets, locks, blocking):
+    claimed, busy = [], []
+    for item, blob_path, blob in targets:
+        if blob is None:
+            claimed.append((item, blob_path, blob))
+            continue
+        fd = _Lock_File(os.path.join(blob_cache, BLOB_LOCK_FOLDER, blob), fcntl.LOCK_EX, blocking)
+        if fd is None:
+            busy.append((item, blob_path, blob))
+            continue
+        locks.append(fd)
+        if _Blob_Complete(blob_path, item['size']):
+            TRANSFER_STATS['skipped files'] += 1
+            TRANSFER_STATS['skipped bytes'] += item['size']
+            TRANSFER_STATS['shared files'] += 1
+        else:
+            claimed.append((item, blob_path, blob))
+    return claimed, busy
+
+# Download and verify, fetching again only the blobs that failed the verification, once
+def _Fetch_Verified(bucket, targets, part_size, concurrency):
+    corrupt = _Download_Objects(bucket, targets, part_size, concurrency)
+    if corrupt:
+        corrupt = _Download_Objects(bucket, [target for target in targets if target[2] in corrupt], part_size, concurrency)
+    return corrupt
+
+# Evict the least recently used blobs of the host cache until it fits in budget_bytes, except the blobs in keep (the model just loaded)
+# and the blobs used in the last grace_s, e.g. synced by another pod whose vLLM has not read the weights yet
+# The model folders linking an evicted blob fetch it again on their next sync
+# Skipped (returns None) while a loader of the host is running, the last one to finish evicts
+# Returns {"blobs", "bytes", "evicted files", "evicted bytes"}
+def Evict_Blob_Cache(blob_cache, budget_bytes, keep=(), grace_s=0):
+    fd = _Lock_File(os.path.join(blob_cache, BLOB_CACHE_LOCK), fcntl.LOCK_EX, blocking=False)
+    if fd is None:
+        print(f"Attention: another loader is using {blob_cache}, the eviction is left to it", flush=True)
+        return None
+    try:
+        blobs = []
+        for entry in os.scandir(blob_cache):
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.name.endswith(".partial"): # Left by a loader which stopped during a fetch
+                os.remove(entry.path)
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            blobs.append((stat.st_mtime, entry.name, stat.st_size))
+        stats = {"blobs": len(blobs), "bytes": sum(size for _, _, size in blobs), "evicted files": 0, "evicted bytes": 0}
+        recent = time.time() - grace_s
+        for used, blob, size in sorted(blobs):
+            if stats['bytes'] <= budget_bytes or used > recent: # The blobs after it are more recent still
+                break
+            if blob in keep:
+                continue
+            os.remove(os.path.join(blob_cache, blob))
+            lock_path = os.path.join(blob_cache, BLOB_LOCK_FOLDER, blob)
+            if os.path.exists(lock_path): # Nobody holds it under the exclusive cache lock
+                os.remove(lock_path)
+            stats['blobs'] -= 1
+            stats['bytes'] -= size
+            stats['evicted files'] += 1
+            stats['evicted bytes'] += size
+        if stats['bytes'] > budget_bytes:
+            print(f"Attention: the blobs in use ({stats['bytes']} bytes) exceed the blob cache budget ({budget_bytes} bytes)", flush=True)
+        print(f"Blob cache {blob_cache}: {stats['blobs']} blobs, {stats['bytes']} bytes, evicted {stats['evicted files']} blobs, {stats['evicted bytes']} bytes", flush=True)
+        return stats
+    finally:
+        os.close(fd)
+
+# Incremental download of a model folder in the Hugging Face cache layout
+# With a manifest in the bucket, only the blobs missing or truncated in {local}/blobs are fetched and the snapshot symlinks are rebuilt
+# Without a manifest, only the files missing, truncated or changed (ETag) are fetched
+# With a blob_cache, the blobs are kept in the host cache instead, and {local}/blobs links them; the blobs of the model folder
+# synced before the cache was used are moved into it
+# TRANSFER_STATS['bytes'] counts the bytes actually transferred, and 'skipped bytes' the bytes already on the host
+# ('shared files': the blobs another loader of the host fetched while this one waited for them)
+# The blobs are verified against their SHA while streaming: 'verify time_s' is the hashing time (overlapped with the transfer),
+# 'verify tail_s' the hashing left after the last byte arrived, and 'corrupt blobs' the blobs still corrupt after one re-fetch
+def Sync_Model(bucket, key, local, chunk_size_mbype="10M", concurrency="10", blob_cache=None):
+    print(f"Sync ds:{bucket}/{key} -> {local}, part size {chunk_size_mbype}, concurrency {concurrency}" + (f", blob cache {blob_cache}" if blob_cache else ""), flush=True)
+    start = _Start_Stats("download")
+    TRANSFER_STATS.update({"skipped files": 0, "skipped bytes": 0, "shared files": 0, "verified files": 0, "verify time_s": 0.0, "verify tail_s": 0.0, "corrupt blobs": []})
+    prefix = key.strip("/") + "/"
+    cache_lock = None
+    try:
+        objects = {item['key'][len(prefix):]: item for item in List_Cloud_Objects(bucket, key) if item['key'].startswith(prefix)}
+        if len(objects) == 0:
+            raise FileNotFoundError(f"ds:{bucket}/{key} does not exist or is empty")
+        manifest = _Read_Cloud_Manifest(bucket, prefix + MANIFEST_NAME) if MANIFEST_NAME in objects else {"refs": {}, "files": {}}
+        objects.pop(MANIFEST_NAME, None)
+        if blob_cache:
+            cache_lock = _Lock_File(os.path.join(blob_cache, BLOB_CACHE_LOCK), fcntl.LOCK_SH) # Waits for a running eviction
+        blob_root = blob_cache or os.path.join(local, "blobs")
+
+        # Content-addressed files: one download per missing blob, whichever snapshot file it comes from
+        targets = []
+        blobs = {}
+        for relative, entry in manifest['files'].items():
+            if relative in objects:
+                blobs.setdefault(entry['blob'], (objects.pop(relative), entry['size'], os.path.join(local, relative)))
+        for blob, (item, size, file_path) in blobs.items():
+            blob_path = os.path.join(blob_root, blob)
+            # Adopt a file resolved by an earlier full download, or a blob of the model folder kept before the cache
+            for earlier in (file_path, os.path.join(local, "blobs", blob)):
+                if earlier != blob_path and os.path.isfile(earlier) and not os.path.islink(earlier) and os.path.getsize(earlier) == size:
+                    if _Blob_Complete(blob_path, size):
+                        os.remove(earlier) # Already in the cache, from another model
+                    else:
+                        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                        os.replace(earlier, blob_path)
+            if _Blob_Complete(blob_path, size):
+                TRANSFER_STATS['skipped files'] += 1
+                TRANSFER_STATS['skipped bytes'] += size
+                if blob_cache:
+                    os.utime(blob_path) # Used, for the eviction
+            else:
+                targets.append((item, blob_path, blob))
+
+        # Other files, e.g. refs/main or a model saved without a manifest, compared by size and ETag
+        state_file = os.path.join(local, SYNC_STATE_NAME)
+        state = {}
+        if os.path.isfile(state_file):
+            with open(state_file) as f:
+                state = json.load(f)
+        for relative, item in objects.items():
+            file_path = os.path.join(local, relative)
+            if os.path.isfile(file_path) and os.path.getsize(file_path) == item['size'] and state.get(relative, item['etag']) == item['etag']:
+                TRANSFER_STATS['skipped files'] += 1
+                TRANSFER_STATS['skipped bytes'] += item['size']
+            else:
+                if os.path.islink(file_path):
+                    os.remove(file_path) # Never write through a symlink into a shared blob
+                targets.append((item, file_path, None))
+            state[relative] = item['etag']
+
+        # With the cache: fetch the blobs no other loader is fetching first, then wait for the others, and fetch those still missing
+        # The locks of a pass are released before the next one, and the blobs are locked in SHA order, so the loaders of
+        # models sharing several blobs never wait for each other in a cycle
+        corrupt = []
+        blocking = False
+        targets.sort(key=lambda target: target[2] or "")
+        while targets:
+            locks = []
+            try:
+                claimed, targets = _Claim_Blobs(blob_cache, targets, locks, blocking) if blob_cache else (targets, [])
+                corrupt += _Fetch_Verified(bucket, claimed, Parse_Size(chunk_size_mbype), int(concurrency))
+            finally:
+                for fd in locks:
+                    os.close(fd)
+            blocking = True
+        TRANSFER_STATS['corrupt blobs'] = corrupt
+        if corrupt:
+            raise ValueError(f"{len(corrupt)} blobs failed the SHA verification twice: {corrupt}")
+
+        for relative, entry in manifest['files'].items():
+            if blob_cache and os.path.isfile(os.path.join(blob_cache, entry['blob'])):
+                _Link_Blob(os.path.join(local, "blobs", entry['blob']), os.path.join(blob_cache, entry['blob']))
+            _Link_Blob(os.path.join(local, relative), os.path.join(local, "blobs", entry['blob']))
+        for name, revision in manifest['refs'].items():
+            os.makedirs(os.path.dirname(os.path.join(local, "refs", name)), exist_ok=True)
+            with open(os.path.join(local, "refs", name), "w") as f:
+                f.write(revision)
+        os.makedirs(local, exist_ok=True)
+        with open(state_file, "w") as f:
+            json.dump(state, f, indent=2)
+    except (BotoCoreError, ClientError, OSError, ValueError, KeyError) as e:
+        print(f"The error message: {e}", flush=True)
+        return 0
+    finally:
+        if cache_lock is not None:
+            os.close(cache_lock)
+        _Finish_Stats(start)
+    print(f"Synced {TRANSFER_STATS['files']} files, {TRANSFER_STATS['bytes']} bytes in {TRANSFER_STATS['duration_s']} seconds, skipped {TRANSFER_STATS['skipped files']} files, {TRANSFER_STATS['skipped bytes']} bytes", flush=True)
+    return 1
+
+# Read a local model folder back in parallel: a local disk read benchmark, and a page cache warm-up for vLLM
+# The pages of each file are dropped first (written back, then POSIX_FADV_DONTNEED), so the reads come from the disk,
+# even right after the download; the files are then read sequentially in WARM_UP_PART_SIZE ranges, with sequential
+# readahead requested on the descriptor of each range, and stay in the page cache, where the vLLM weight loading finds them
+# Each blob is read once, whichever snapshot symlinks point at it
+# Returns {"files", "bytes", "duration_s", "read_GBps"}
+WARM_UP_PART_SIZE = 64 * 1024 * 1024
+
+def _Read_Range(path, offset, size, buffer):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL) # Kept per open file, so on the descriptor of the reads
+        os.posix_fadvise(fd, offset, size, os.POSIX_FADV_WILLNEED)
+        view = memoryview(buffer)
+        done = 0
+        while done < size:
+            count = os.preadv(fd, [view[:min(len(view), size - done)]], offset + done)
+            if count == 0:
+                break
+            done += count
+        return done
+    finally:
+        os.close(fd)
+
+def Warm_Page_Cache(local_path, concurrency=8):
+    files = {}
+    for root, dirs, names in os.walk(local_path):
+        for name in names:
+            path = os.path.realpath(os.path.join(root, name))
+            if os.path.isfile(path):
+                files[path] = os.path.getsize(path)
+    for path in files: # From the disk, not from the pages written by the download
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    parts = [(path, offset, min(WARM_UP_PART_SIZE, size - offset)) for path, size in sorted(files.items()) for offset in range(0, size, WARM_UP_PART_SIZE)]
+    buffers = threading.local()
+
+    def read_part(part):
+        if not hasattr(buffers, "buffer"):
+            buffers.buffer = bytearray(READ_BLOCK_SIZE * 8)
+        return _Read_Range(*part, buffers.buffer)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        total = sum(pool.map(read_part, parts))
+    duration = time.perf_counter() - start
+    stats = {"files": len(files), "bytes": total, "duration_s": round(duration, 3),
+             "read_GBps": round(total / duration / 1_000_000_000, 3) if duration > 0 else 0.0}
+    print(f"Read {stats['files']} files, {total} bytes in {stats['duration_s']} seconds, {stats['read_GBps']} GB/s, from {local_path}", flush=True)
+    return stats
+
+# Sweep the transfer parameters of a node, part size x concurrency, each setting downloading the same sample of {key}
+# The sample is the head of the largest objects (the weight shards, which make most of a model), sample_bytes in all,
+# written into {scratch} like a real load and deleted after each setting; one untimed pass first opens the connections
+# and warms the bucket side, so the first setting is not at a disadvantage
+# Returns {"sample size_GB", "matrix": [{"part size", "concurrency", "throughput_Gbps", "cpu_pct", "cpu_s per GB", "part p50_s", "part max_s"}, ...], "best"}
+# The best is the cheapest setting (CPU) within SWEEP_TOLERANCE of the highest throughput
+SWEEP_TOLERANCE = 0.05
+
+def _Sample_Objects(objects, sample_bytes):
+    sample = []
+    for item in sorted(objects, key=lambda item: item['size'], reverse=True):
+        if sample_bytes <= 0 or item['size'] == 0:
+            break
+        sample.append((item, min(item['size'], sample_bytes)))
+        sample_bytes -= sample[-1][1]
+    return sample
+
+def _Sweep_Trial(bucket, sample, scratch, part_size, concurrency):
+    start = _Start_Stats("sweep")
+    cpu_start = time.process_time()
+    files = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = []
+            for index, (item, size) in enumerate(sample):
+                path = os.path.join(scratch, f"sample-{index}")
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+                files.append((fd, path))
+                os.ftruncate(fd, size)
+                futures += [pool.submit(_Download_Part, bucket, item['key'], fd, offset, length, False) for offset, length in _Split_Parts(size, part_size)]
+            for future in as_completed(futures):
+                TRANSFER_STATS['bytes'] += future.result()
+    finally:
+        for fd, path in files:
+            os.close(fd)
+            os.remove(path)
+    _Finish_Stats(start)
+    cpu_s = time.process_time() - cpu_start
+    durations = sorted(part['duration_s'] for part in TRANSFER_STATS['parts'])
+    return {"part size": part_size, "concurrency": concurrency, "throughput_Gbps": TRANSFER_STATS['throughput_Gbps'],
+            "cpu_pct": round(cpu_s / TRANSFER_STATS['duration_s'] * 100, 1) if TRANSFER_STATS['duration_s'] > 0 else 0.0,
+            "cpu_s per GB": round(cpu_s / (TRANSFER_STATS['bytes'] / 1_000_000_000), 3) if TRANSFER_STATS['bytes'] else 0.0,
+            "part p50_s": durations[len(durations) // 2] if durations else 0.0, "part max_s": durations[-1] if durations else 0.0}
+
+def Sweep_Transfer(bucket, key, part_sizes, concurrencies, sample_size, scratch):
+    sample = _Sample_Objects(List_Cloud_Objects(bucket, key), Parse_Size(sample_size))
+    if len(sample) == 0:
+        raise FileNotFoundError(f"ds:{bucket}/{key} does not exist or is empty")
+    if max(concurrencies) > MAX_POOL_CONNECTIONS:
+        print(f"Attention: the concurrency is limited to the {MAX_POOL_CONNECTIONS} pooled connections (S3_MAX_POOL_CONNECTIONS)", flush=True)
+        concurrencies = sorted({min(concurrency, MAX_POOL_CONNECTIONS) for concurrency in concurrencies})
+    os.makedirs(scratch, exist_ok=True)
+    sample_GB = round(sum(size for _, size in sample) / 1_000_000_000, 3)
+    print(f"Sweep ds:{bucket}/{key}, {sample_GB} GB from {len(sample)} objects, part sizes {part_sizes}, concurrencies {concurrencies}", flush=True)
+    _Sweep_Trial(bucket, sample, scratch, Parse_Size(part_sizes[0]), max(concurrencies))
+    matrix = []
+    for part_size in part_sizes:
+        for concurrency in concurrencies:
+            trial = _Sweep_Trial(bucket, sample, scratch, Parse_Size(part_size), concurrency)
+            trial['part size'] = part_size
+            matrix.append(trial)
+            print(f"Part size {part_size}, concurrency {concurrency}: {trial['throughput_Gbps']} Gbps, CPU {trial['cpu_pct']}%, {trial['cpu_s per GB']} CPU seconds per GB", flush=True)
+    fastest = max(trial['throughput_Gbps'] for trial in matrix)
+    best = min((trial for trial in matrix if trial['throughput_Gbps'] >= fastest * (1 - SWEEP_TOLERANCE)), key=lambda trial: (trial['cpu_s per GB'], trial['concurrency']))
+    print(f"Best: part size {best['part size']}, concurrency {best['concurrency']}, {best['throughput_Gbps']} Gbps", flush=True)
+    return {"sample size_GB": sample_GB, "matrix": matrix, "best": {field: best[field] for field in ("part size", "concurrency", "throughput_Gbps", "cpu_s per GB")}}
+
+# python3 helper.py, to generate the rclone configuration file for manual transfers
+# python3 helper.py manifest {LOCAL_PATH} {BUCKET} {KEY}, to build the manifest of a local model folder and upload it to ds:{BUCKET}/{KEY}/manifest.json
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "manifest":
+        local_path, bucket, key = sys.argv[2:5]
+        manifest = Build_Model_Manifest(local_path)
+        manifest_file = os.path.join(local_path, MANIFEST_NAME)
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"The manifest of {local_path}: {len(manifest['files'])} files", flush=True)
+        sys.exit(0 if Uploader(manifest_file, bucket, f"{key.strip('/')}/{MANIFEST_NAME}") else 1)
+    Write_Rclone_Config()
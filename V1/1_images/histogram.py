@@ -0,0 +1,84 @@
+import math
+
+# Fixed-memory histogram with log-spaced buckets, for latencies and rates on the hot path
+# Bucket i holds the values in [MIN_VALUE * GROWTH^i, MIN_VALUE * GROWTH^(i+1)), so a percentile is within GROWTH-1 (2%)
+# of the true value, whatever the number of samples
+# The buckets are serialized sparsely, and histograms from many nodes are merged by adding the bucket counts
+GROWTH    = 1.02
+MIN_VALUE = 1e-4   # Smaller values (and 0) go to the first bucket
+MAX_VALUE = 1e6    # Larger values go to the last bucket
+BUCKETS   = int(math.ceil(math.log(MAX_VALUE / MIN_VALUE) / math.log(GROWTH))) + 1
+_LOG_GROWTH = math.log(GROWTH)
+
+class Log_Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    # O(1)
+    def add(self, value):
+        if value <= MIN_VALUE:
+            index = 0
+        else:
+            index = min(int(math.log(value / MIN_VALUE) / _LOG_GROWTH), BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    # The geometric middle of the bucket holding the p-th percentile, clamped to the observed min/max
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                value = MIN_VALUE * GROWTH ** (index + 0.5)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        counts = list(self.counts) # A snapshot, the histogram may be updated by another thread
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(self.percentile(50), 6),
+            "p90": round(self.percentile(90), 6),
+            "p99": round(self.percentile(99), 6),
+            "max": round(self.max, 6),
+            "min": round(self.min, 6) if self.count else 0.0,
+            "growth": GROWTH,
+            "min value": MIN_VALUE,
+            "buckets": {str(index): count for index, count in enumerate(counts) if count},
+        }
+
+    @staticmethod
+    def from_dict(data):
+        if data.get('growth') != GROWTH or data.get('min value') != MIN_VALUE:
+            raise ValueError(f"Incompatible histogram layout: growth {data.get('growth')}, min value {data.get('min value')}")
+        histogram = Log_Histogram()
+        for index, count in data['buckets'].items():
+            histogram.counts[int(index)] += count
+        histogram.count = data['count']
+        histogram.total = data['mean'] * data['count']
+        histogram.min = data['min'] if data['count'] else math.inf
+        histogram.max = data['max']
+        return histogram
@@ -0,0 +1,251 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import aiohttp
+from histogram import Log_Histogram
+
+# Concurrent load generator for an OpenAI-compatible chat completions endpoint (vLLM)
+# Each worker keeps one request in flight over a pooled keep-alive connection, and consumes the streamed (SSE) response
+# to measure the time to first token (TTFT), the inter-token latency (ITL) and the output tokens per second
+# The URL can point to a local fake server for testing (fake_vllm.py)
+
+# The summary of the load since the start: {"requests", "failures", "total tokens", "output tokens", "ttft_s", "itl_ms", ...}
+def New_Load_Stats():
+    return {
+        "requests": 0,            # Successful requests
+        "failures": 0,
+        "total tokens": 0,        # Prompt + output tokens, as reported in the usage
+        "output tokens": 0,
+        "ttft_s sum": 0.0,
+        "itl_s sum": 0.0,
+        "itl count": 0,
+        "latency_s sum": 0.0,
+        # Fixed-memory distributions, updated per request (per token for the ITL)
+        "histograms": {
+            "latency_s": Log_Histogram(),
+            "ttft_s": Log_Histogram(),
+            "itl_s": Log_Histogram(),
+            "output tokens per second": Log_Histogram(), # Per request, over its decode phase
+        },
+    }
+
+# The per-request metrics of one streamed completion: {"latency_s", "ttft_s", "itl_s": [...], "output tokens", "total tokens"}
+async def Stream_Chat_Completion(session, url, payload, timeout_s=600):
+    body = dict(payload)
+    body['stream'] = True
+    body['stream_options'] = {"include_usage": True}
+    start = time.perf_counter()
+    first = None
+    last = None
+    itl = []
+    chunks = 0
+    usage = {}
+    async with session.post(url, json=body, timeout=aiohttp.ClientTimeout(total=timeout_s)) as response:
+        if response.status != 200:
+            raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status, message=await response.text())
+        async for line in response.content: # One SSE event per "data: ..." line
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            event = json.loads(data)
+            if event.get('usage'):
+                usage = event['usage']
+            choices = event.get('choices') or []
+            if choices and (choices[0].get('delta') or {}).get('content'):
+                now = time.perf_counter()
+                if first is None:
+                    first = now
+                else:
+                    itl.append(now - last)
+                last = now
+                chunks += 1
+    end = time.perf_counter()
+    return {
+        "latency_s": end - start,
+        "ttft_s": (first - start) if first is not None else end - start,
+        "itl_s": itl,
+        "output tokens": usage.get('completion_tokens', chunks),
+        "total tokens": usage.get('total_tokens', chunks),
+    }
+
+def _Update_Stats(stats, result):
+    stats['requests'] += 1
+    stats['total tokens'] += result['total tokens']
+    stats['output tokens'] += result['output tokens']
+    stats['ttft_s sum'] += result['ttft_s']
+    stats['itl_s sum'] += sum(result['itl_s'])
+    stats['itl count'] += len(result['itl_s'])
+    stats['latency_s sum'] += result['latency_s']
+    histograms = stats['histograms']
+    histograms['latency_s'].add(result['latency_s'])
+    histograms['ttft_s'].add(result['ttft_s'])
+    for value in result['itl_s']:
+        histograms['itl_s'].add(value)
+    decode_s = result['latency_s'] - result['ttft_s']
+    if decode_s > 0:
+        histograms['output tokens per second'].add(result['output tokens'] / decode_s)
+
+async def _Worker(session, url, payload, stats, stop, on_result):
+    while not stop.is_set():
+        try:
+            result = await Stream_Chat_Completion(session, url, payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            stats['failures'] += 1
+            print(f"Error: {e}", flush=True)
+            await asyncio.sleep(1) # Do not spin on a server that is down
+            continue
+        _Update_Stats(stats, result)
+        if on_result is not None:
+            on_result(result)
+
+# Keep {concurrency} requests in flight until {duration_s} elapses (None: forever)
+# The requests in flight at the end are completed and counted
+def Run_Load(url, payload, concurrency, stats, duration_s=None, on_result=None):
+    async def main():
+        stop_event = asyncio.Event()
+        connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            workers = [asyncio.create_task(_Worker(session, url, payload, stats, stop_event, on_result)) for _ in range(concurrency)]
+            if duration_s is None:
+                await asyncio.gather(*workers)
+            else:
+                await asyncio.sleep(duration_s)
+                stop_event.set()
+                await asyncio.gather(*workers)
+    asyncio.run(main())
+    return stats
+
+# Open-loop load at {rate} requests per second for {duration_s}, the arrivals spread as a Poisson process
+# Unlike Run_Load, a slow server does not slow the arrivals down, so the latencies include the queueing of an overloaded server
+# At most {max_concurrency} requests are in flight (the connection pool), the wait for a connection counts in the TTFT
+# The requests still in flight {drain_s} after the end are cancelled and counted as failures
+def Run_Rate(url, payload, rate, max_concurrency, duration_s, stats, drain_s=60, seed=0):
+    async def request(session):
+        try:
+            result = await Stream_Chat_Completion(session, url, payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            stats['failures'] += 1
+            print(f"Error: {e}", flush=True)
+            return
+        _Update_Stats(stats, result)
+
+    async def main():
+        rng = random.Random(seed)
+        connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            tasks = []
+            start = time.perf_counter()
+            arrival = rng.expovariate(rate)
+            while arrival < duration_s:
+                await asyncio.sleep(max(0.0, start + arrival - time.perf_counter()))
+                tasks.append(asyncio.create_task(request(session)))
+                arrival += rng.expovariate(rate)
+            if not tasks:
+                return
+            _, pending = await asyncio.wait(tasks, timeout=drain_s)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            stats['failures'] += len(pending)
+    asyncio.run(main())
+    return stats
+
+# The goodput of a server: the highest request rate at which the p99 TTFT and the p99 ITL stay within their SLOs
+# The rate doubles from start_rate until a step misses the SLOs (or max_rate), then the last passing and the first failing
+# rates are bisected until they are within GOODPUT_TOLERANCE, or max_steps steps in all
+# If start_rate already misses the SLOs, the rate halves down to min_rate until a step passes, then the bisection goes on
+# as above; a goodput of 0 is reported only if min_rate misses them too (e.g. an unloaded ITL above the SLO)
+# A step runs for step_s (longer at a low rate, for min_requests requests, up to max_step_s), and passes with at most
+# GOODPUT_MAX_FAILURES failed
+# Returns {"goodput_rps", "output tokens per second", "concurrency", "ttft_s p99", "itl_ms p99" (at the goodput), "slo", "steps"}
+# The concurrency is the mean number of requests in flight (Little's law), the one the server sustains within the SLOs
+GOODPUT_TOLERANCE    = 0.05
+GOODPUT_MAX_FAILURES = 0.01
+
+def _Goodput_Step(url, payload, rate, ttft_slo_s, itl_slo_ms, max_concurrency, step_s, min_requests, max_step_s):
+    stats = New_Load_Stats()
+    duration_s = min(max(step_s, min_requests / rate), max(step_s, max_step_s))
+    start = time.perf_counter()
+    Run_Rate(url, payload, rate, max_concurrency, duration_s, stats)
+    elapsed = time.perf_counter() - start
+    histograms = stats['histograms']
+    step = {
+        "rate_rps": round(rate, 3),
+        "requests": stats['requests'],
+        "failures": stats['failures'],
+        "achieved_rps": round(stats['requests'] / duration_s, 3),
+        "concurrency": round(stats['latency_s sum'] / elapsed, 1),
+        "output tokens per second": round(stats['output tokens'] / elapsed, 2),
+        "ttft_s p99": round(histograms['ttft_s'].percentile(99), 4),
+        "itl_ms p99": round(histograms['itl_s'].percentile(99) * 1000, 3),
+    }
+    step['passed'] = stats['requests'] > 0 and stats['failures'] <= GOODPUT_MAX_FAILURES * (stats['requests'] + stats['failures']) \
+        and step['ttft_s p99'] <= ttft_slo_s and step['itl_ms p99'] <= itl_slo_ms
+    print(f"Goodput step: {step['rate_rps']} requests/s, p99 TTFT {step['ttft_s p99']} seconds, p99 ITL {step['itl_ms p99']} ms, "
+          f"{step['requests']} requests, {step['failures']} failures, concurrency {step['concurrency']}: {'passed' if step['passed'] else 'failed'}", flush=True)
+    return step
+
+def Find_Goodput(url, payload, ttft_slo_s, itl_slo_ms, start_rate=1.0, max_rate=64.0, max_concurrency=256, step_s=60, min_requests=50, max_steps=12,
+                 min_rate=0.25, max_step_s=300):
+    steps = []
+    good = None
+    bad = None
+    rate = max(start_rate, min_rate)
+    while len(steps) < max_steps:
+        step = _Goodput_Step(url, payload, rate, ttft_slo_s, itl_slo_ms, max_concurrency, step_s, min_requests, max_step_s)
+        steps.append(step)
+        if step['passed']:
+            good = step
+        else:
+            bad = step
+        if good is None:
+            if rate <= min_rate:
+                print(f"Attention: the SLOs are missed at the lowest rate tried, {step['rate_rps']} requests/s", flush=True)
+                break
+            rate = max(rate / 2, min_rate)
+            continue
+        if bad is None:
+            if rate >= max_rate:
+                break
+            rate = min(rate * 2, max_rate)
+            continue
+        if bad['rate_rps'] - good['rate_rps'] <= GOODPUT_TOLERANCE * bad['rate_rps']:
+            break
+        rate = (good['rate_rps'] + bad['rate_rps']) / 2
+    result = {"goodput_rps": 0.0, "output tokens per second": 0.0, "concurrency": 0.0, "ttft_s p99": None, "itl_ms p99": None}
+    if good is not None:
+        result.update({"goodput_rps": good['rate_rps'], "output tokens per second": good['output tokens per second'], "concurrency": good['concurrency'],
+                       "ttft_s p99": good['ttft_s p99'], "itl_ms p99": good['itl_ms p99']})
+    result['slo'] = {"ttft_s p99": ttft_slo_s, "itl_ms p99": itl_slo_ms}
+    result['steps'] = steps
+    if good is not None and bad is None:
+        print(f"Attention: the SLOs are met up to the highest rate tried, {max_rate} requests/s", flush=True)
+    print(f"Goodput: {result['goodput_rps']} requests/s, {result['output tokens per second']} output tokens/s, concurrency {result['concurrency']}", flush=True)
+    return result
+
+# The averages and the histograms (p50/p90/p99/max and buckets, to be merged across nodes) reported in RESULT
+def Summarize_Load(stats, running_time_s):
+    requests = max(stats['requests'], 1)
+    return {
+        "ttft_s mean": round(stats['ttft_s sum'] / requests, 4),
+        "itl_ms mean": round(stats['itl_s sum'] * 1000 / max(stats['itl count'], 1), 3),
+        "latency_s mean": round(stats['latency_s sum'] / requests, 3),
+        "output tokens per second": round(stats['output tokens'] / running_time_s, 2) if running_time_s > 0 else 0.0,
+        "histograms": {name: histogram.to_dict() for name, histogram in stats['histograms'].items()},
+    }
+
+
+# A goodput search on its own, e.g. against fake_vllm.py
+#   python3 load_generator.py {URL} {p99 TTFT SLO seconds} {p99 ITL SLO ms} [{STEP seconds}]
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python3 load_generator.py {URL} {p99 TTFT SLO seconds} {p99 ITL SLO ms} [{STEP seconds}]")
+        sys.exit(1)
+    payload = {"model": "", "messages": [{"role": "user", "content": "Who are you?"}], "max_tokens": 128}
+    result = Find_Goodput(sys.argv[1], payload, float(sys.argv[2]), float(sys.argv[3]), step_s=float(sys.argv[4]) if len(sys.argv) > 4 else 60)
+    print(json.dumps(result, indent=2), flush=True)
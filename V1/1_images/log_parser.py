@@ -0,0 +1,153 @@
+import re
+import statistics
+
+# Single-pass streaming parsers for the training and inference logs, shared by the test workloads and the analysis tools
+
+# Megatron iteration lines:
+#  [2025-12-14 22:41:40] iteration        2/      12 | consumed samples:          240 | elapsed time per iteration (ms): 66869.4 | mem usages: 0.8521 | throughput per GPU (TFLOP/s/GPU): 408.4 | ... | number of nan iterations:   0 |
+# Megatron memory lines, one per rank:
+# [Rank 1] (after 1 iterations) memory (MB) | allocated: 148561.61328125 | max allocated: 148561.62548828125 | reserved: 159262.0 | max reserved: 159262.0
+ITERATION_PATTERN = re.compile(r"(?:\[([\d\- :]+)\] )?iteration\s+(\d+)/\s*(\d+) \|(.*)")
+MEMORY_PATTERN    = re.compile(r"\[Rank (\d+)\] \(after (\d+) iterations\) memory \(MB\) \| allocated: ([\d.]+) \| max allocated: ([\d.]+) \| reserved: ([\d.]+) \| max reserved: ([\d.]+)")
+
+# Column name -> (label in the iteration line, type)
+ITERATION_COLUMNS = {
+    "consumed samples":  ("consumed samples", int),
+    "elapsed_ms":        ("elapsed time per iteration (ms)", float),
+    "mem usages":        ("mem usages", float),
+    "tflops per gpu":    ("throughput per GPU (TFLOP/s/GPU)", float),
+    "learning rate":     ("learning rate", float),
+    "global batch size": ("global batch size", int),
+    "lm loss":           ("lm loss", float),
+    "loss scale":        ("loss scale", float),
+    "grad norm":         ("grad norm", float),
+    "skipped iterations": ("number of skipped iterations", int),
+    "nan iterations":    ("number of nan iterations", int),
+}
+_LABELS = {label: (name, kind) for name, (label, kind) in ITERATION_COLUMNS.items()}
+
+def Parse_Iteration_Line(line):
+    match = ITERATION_PATTERN.search(line)
+    if match is None:
+        return None
+    record = {"timestamp": match.group(1), "iteration": int(match.group(2)), "total iterations": int(match.group(3))}
+    for field in match.group(4).split("|"):
+        label, _, value = field.partition(":")
+        label = label.strip()
+        if label in _LABELS:
+            name, kind = _LABELS[label]
+            try:
+                record[name] = kind(value.strip())
+            except ValueError: # e.g. "nan"
+                record[name] = float("nan")
+    return record
+
+# Feed the lines one by one; the iterations are kept as typed columns, one list per column, in iteration order
+# The Megatron output repeats the iteration lines at the end of the run, so an iteration is kept only once
+class Megatron_Parser:
+    def __init__(self):
+        self.columns = {"iteration": [], "timestamp": []}
+        self.columns.update({name: [] for name in ITERATION_COLUMNS})
+        self.total_iterations = 0
+        self.memory = {} # rank -> {"allocated_mb", "max allocated_mb", "reserved_mb", "max reserved_mb"}, the peaks
+        self._seen = set()
+
+    # Returns the iteration record of an iteration line seen for the first time, otherwise None
+    def feed(self, line):
+        if "iteration" not in line: # Fast path for the other lines
+            return None
+        if "memory (MB)" in line:
+            for match in MEMORY_PATTERN.finditer(line): # The ranks write concurrently, so several may share a line
+                peak = self.memory.setdefault(int(match.group(1)), {"allocated_mb": 0.0, "max allocated_mb": 0.0, "reserved_mb": 0.0, "max reserved_mb": 0.0})
+                for name, value in zip(peak, match.groups()[2:]):
+                    peak[name] = max(peak[name], float(value))
+        record = Parse_Iteration_Line(line)
+        if record is None or record['iteration'] in self._seen:
+            return None
+        self._seen.add(record['iteration'])
+        self.total_iterations = record['total iterations']
+        for name, values in self.columns.items():
+            values.append(record.get(name))
+        return record
+
+    def __len__(self):
+        return len(self.columns['iteration'])
+
+def Parse_Megatron_Lines(lines):
+    parser = Megatron_Parser()
+    for line in lines:
+        parser.feed(line)
+    return parser
+
+# The steady-state metrics of a training run, excluding the warm-up iterations
+def Summarize_Training(parser, warmup_iterations=2):
+    columns = parser.columns
+    steady = [i for i, iteration in enumerate(columns['iteration']) if iteration > warmup_iterations]
+    tflops = [columns['tflops per gpu'][i] for i in steady if columns['tflops per gpu'][i] is not None]
+    elapsed = [columns['elapsed_ms'][i] for i in steady if columns['elapsed_ms'][i] is not None]
+    return {
+        "iterations": len(parser),
+        "steady iterations": len(steady),
+        "tflops per gpu": statistics.fmean(tflops) if tflops else 0.0,
+        "elapsed_ms mean": statistics.fmean(elapsed) if elapsed else 0.0,
+        "elapsed_ms stdev": statistics.stdev(elapsed) if len(elapsed) > 1 else 0.0,
+        "max allocated_mb": max((peak['max allocated_mb'] for peak in parser.memory.values()), default=0.0),
+        "max reserved_mb": max((peak['max reserved_mb'] for peak in parser.memory.values()), default=0.0),
+        "memory": parser.memory,
+    }
+
+# vLLM start-up milestones, in order, and the substring marking each one in vllm_server.log (vLLM 0.11, V1 engine):
+#   (APIServer pid=1) INFO 12-14 22:41:40 [api_server.py:1839] vLLM API server version 0.11.1
+#   (Worker_TP0 pid=301) INFO 12-14 22:41:58 [gpu_model_runner.py:2602] Starting to load model meta-llama/Llama-3.1-8B-Instruct...
+#   (Worker_TP0 pid=301) INFO 12-14 22:42:03 [gpu_model_runner.py:2653] Model loading took 1.9 GiB and 4.2 seconds
+#   (EngineCore_DP0 pid=180) INFO 12-14 22:42:21 [core.py:210] init engine (profile, create kv cache, warmup model) took 17.9 seconds
+#   (APIServer pid=1) INFO:     Application startup complete.
+# The tensor-parallel workers print the weight loading lines once each, so a milestone is the last of its lines
+# before the next milestone
+VLLM_MILESTONES = [
+    ("launched",       "vLLM API server version"),
+    ("loading model",  "Starting to load model"),
+    ("model loaded",   "Model loading took"),
+    ("engine ready",   "init engine (profile, create kv cache, warmup model)"),
+    ("api ready",      "Application startup complete"),
+]
+# Phase -> the milestone ending it; each phase starts at the previous milestone seen, or at the launch of the process
+VLLM_PHASES = {
+    "process launch":     "launched",      # Python imports, argument parsing
+    "engine init":        "loading model", # Workers, distributed and GPU initialization
+    "weight loading":     "model loaded",  # From the local disk (page cache) to the GPUs
+    "kv cache profiling": "engine ready",  # Memory profiling, KV cache allocation, warm-up
+    "api ready":          "api ready",     # The API server up
+}
+
+# Feed the lines of vllm_server.log as they are written, with the time each one was seen
+class Vllm_Startup_Parser:
+    def __init__(self):
+        self.milestones = {} # name -> seconds
+        self.index = 0       # The milestones before it are passed
+
+    # Returns the name of a milestone reached by the line, otherwise None
+    def feed(self, line, seconds):
+        for index in range(max(self.index - 1, 0), len(VLLM_MILESTONES)):
+            name, marker = VLLM_MILESTONES[index]
+            if marker in line:
+                first = name not in self.milestones
+                self.milestones[name] = seconds
+                self.index = max(self.index, index + 1)
+                return name if first else None
+        return None
+
+    # {phase: seconds or None}; a phase without its milestone in the log is merged into the next one
+    def phases(self, ready_seconds=None):
+        milestones = dict(self.milestones)
+        if ready_seconds is not None:
+            milestones['api ready'] = ready_seconds # The health check passed, the end of the start-up
+        result = {}
+        previous = 0.0
+        for phase, milestone in VLLM_PHASES.items():
+            if milestone in milestones:
+                result[phase] = round(milestones[milestone] - previous, 3)
+                previous = milestones[milestone]
+            else:
+                result[phase] = None
+        return result
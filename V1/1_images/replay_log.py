@@ -0,0 +1,32 @@
+import re
+import sys
+import time
+from datetime import datetime
+
+# Replay a recorded training log as if Megatron were running, for testing test_training.py without GPUs
+#   TRAINING_COMMAND="python3 replay_log.py megatron.log [SPEED]" python3 test_training.py
+# The lines are printed with the delays between the timestamps of the iteration lines, divided by SPEED (default 100)
+# A results file (RESULT, then the SMI output, then the training logs) is replayed from its "> Training Logs" section
+TIMESTAMP_PATTERN = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] iteration")
+TRAINING_LOGS = "> Training Logs"
+
+if __name__ == "__main__":
+    log_file = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    with open(log_file, errors="replace") as f:
+        lines = f.readlines()
+    for index, line in enumerate(lines):
+        if line.rstrip().endswith(TRAINING_LOGS):
+            lines = lines[index + 1:]
+            break
+
+    last = None
+    for line in lines:
+        match = TIMESTAMP_PATTERN.match(line)
+        if match:
+            now = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+            if last is not None and now > last:
+                time.sleep((now - last).total_seconds() / speed)
+            last = now
+        sys.stdout.write(line)
+        sys.stdout.flush()
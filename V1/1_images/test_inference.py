@@ -5,7 +5,10 @@ import os
 import requests
 import threading
 import sys
-from helper import Uploader
+from helper import Uploader, Upload_Bytes, Log_Shipper, Read_Marker
+from gpu_telemetry import GPU_Sampler
+from log_parser import Vllm_Startup_Parser
+from load_generator import New_Load_Stats, Run_Load, Summarize_Load, Find_Goodput
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
@@ -23,6 +26,19 @@ MODEL   = os.getenv("MODEL", "")
 
 INPUT_PROMPT = "Who are you? Please tell me how to learn AI and ML, using 1000+ words"
 PAYLOAD = { "model": MODEL, "messages": [{"role": "user", "content": INPUT_PROMPT}] }
+CONCURRENCY  = int(os.getenv("CONCURRENCY", "32")) # Requests in flight, each one streamed over a pooled connection
+
+# '1': before the continuous load, search the highest request rate the node sustains within the p99 TTFT and ITL SLOs
+# (see load_generator.Find_Goodput), reported as RESULT['goodput_rps'], the capacity of the node
+GOODPUT                 = int(os.getenv("GOODPUT", "0"))
+SLO_TTFT_S              = float(os.getenv("SLO_TTFT_S", "2.0"))
+SLO_ITL_MS              = float(os.getenv("SLO_ITL_MS", "100"))
+GOODPUT_STEP_S          = float(os.getenv("GOODPUT_STEP_S", "60"))
+GOODPUT_MAX_RATE        = float(os.getenv("GOODPUT_MAX_RATE", "64"))
+GOODPUT_MIN_RATE        = float(os.getenv("GOODPUT_MIN_RATE", "0.25")) # The floor of the search
+GOODPUT_MAX_STEP_S      = float(os.getenv("GOODPUT_MAX_STEP_S", "300"))
+GOODPUT_MAX_CONCURRENCY = int(os.getenv("GOODPUT_MAX_CONCURRENCY", "256")) # --max-num-seqs
+GOODPUT_MAX_TOKENS      = int(os.getenv("GOODPUT_MAX_TOKENS", "256")) # Shorter answers, so a step completes enough requests
 
 
 TASK_NAME   = os.getenv("TASK_NAME", "")
@@ -32,6 +48,7 @@ SUB_FOLDER  = "llama"
 NODE_NAME = os.getenv("NODE_NAME", "") # DOKS WOKER NAME
 LOCAL_LOG_FILE = "/app/final.log"
 temp_log_file = "/app/vllm_server.log"
+TELEMETRY_INTERVAL_S = float(os.getenv("TELEMETRY_INTERVAL_S", "10")) # GPU power, temperature, clocks, VRAM% and GPU% sampled in the background
 
 
 RESULT = {}
@@ -44,9 +61,31 @@ RESULT['inference server']       = "vllm 0.11.1"
 RESULT['state']                  = "pending"  # "pending", "running", "restarted"
 RESULT['message']                = "" 
 RESULT['startup time_s']         = 9999.9999 
+RESULT['startup phases_s']       = {} # Process launch, engine init, weight loading, KV cache profiling and API ready, from the server log
 RESULT['running time_s']        = 0.0
+RESULT['concurrency']            = CONCURRENCY
 RESULT['inference number']       = 0
-RESULT['generated token number'] = 0
+RESULT['generated token number'] = 0 # Prompt + output tokens
+RESULT['output token number']    = 0
+RESULT['failed inference number'] = 0
+RESULT['ttft_s mean']            = 0.0 # Time to first token
+RESULT['itl_ms mean']            = 0.0 # Inter-token latency
+RESULT['latency_s mean']         = 0.0
+RESULT['output tokens per second'] = 0.0 # All requests together
+RESULT['goodput_rps']            = 0.0 # Requests/s within the SLOs, 0 without the search (GOODPUT)
+RESULT['goodput']                = {} # Output tokens/s, concurrency and p99s at the goodput, the SLOs and the steps of the search
+RESULT['goodput time_s']         = 0.0 # Excluded from the continuous load
+RESULT['histograms']             = {} # Latency, TTFT, ITL and tokens/s per request: p50/p90/p99/max and log-spaced buckets
+RESULT['gpu telemetry']          = {} # Mean and max per field over the ring buffer; the series are shipped as {NODE_NAME}.telemetry.json
+RESULT['log segments']           = 0 # The inference logs are shipped as {NODE_NAME}.segments/000001.log.zst, 000002.log.zst, ...
+RESULT['log size_bytes']         = 0
+RESULT['model loading']          = {} # From the readiness marker: mode, state, duration, overlapped and critical-path times
+
+
+# The hand-over from the model loading, in this pod
+MARKER = Read_Marker("model_loading")
+if MARKER is not None:
+    RESULT['model loading'] = {name: MARKER.get(name) for name in ("mode", "state", "duration_s", "overlapped time_s", "critical path_s")}
 
 
 # Report the initial state to cloud storage
@@ -54,7 +93,7 @@ print("Report the initial state...", flush=True)
 print(json.dumps(RESULT, indent=2), flush=True)
 with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
     json.dump(RESULT, f, indent=2)
-Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")    
+Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)    
 
 
 # Start the vLLM inference server
@@ -89,73 +128,107 @@ print(f"vLLM server started with PID {process.pid}")
 
 
 # Health Check
+# The server log is tailed every TAIL_INTERVAL_S while waiting, for the start-up milestones, and /health is polled adaptively:
+# fast at first and once the engine is ready, backing off in between, so the start-up time is accurate to HEALTH_MIN_S
 HEALTH_ENDPOINT = f"http://0.0.0.0:8000/health"  # some vLLM endpoints may have /health
-RETRY_INTERVAL = 5  # seconds
-MAX_RETRIES = 180   # try for up to 15 minutes
+TAIL_INTERVAL_S = 0.1
+HEALTH_MIN_S    = 0.1
+HEALTH_MAX_S    = 2.0
+MAX_WAIT_S      = 900 # 15 minutes
+STARTUP = Vllm_Startup_Parser()
 
 def check_vllm_ready():
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            response = requests.get(HEALTH_ENDPOINT, timeout=2)
-            if response.status_code == 200:
-                print("vLLM server is ready!", flush=True)
-                return True
-        except requests.RequestException:
-            pass  # server not ready yet
-
-        print(f"Attempt {attempt}: vLLM server not ready, retrying in {RETRY_INTERVAL}s...", flush=True)
-        time.sleep(RETRY_INTERVAL)
+    health_interval_s = HEALTH_MIN_S
+    next_health = 0.0
+    last_report = 0.0
+    session = requests.Session()
+    with open(temp_log_file, "r", errors="replace") as log:
+        partial = ""
+        while time.perf_counter() - START < MAX_WAIT_S:
+            elapsed = time.perf_counter() - START
+            lines = (partial + log.read()).split("\n")
+            partial = lines.pop() # Not complete yet
+            for line in lines:
+                milestone = STARTUP.feed(line, elapsed)
+                if milestone is not None:
+                    print(f"vLLM start-up: {milestone} after {round(elapsed, 3)} seconds", flush=True)
+                    if milestone == "engine ready" or milestone == "api ready": # The API server is about to be up
+                        health_interval_s = HEALTH_MIN_S
+                        next_health = elapsed
+            if elapsed >= next_health:
+                try:
+                    response = session.get(HEALTH_ENDPOINT, timeout=2)
+                    if response.status_code == 200:
+                        print("vLLM server is ready!", flush=True)
+                        return True
+                except requests.RequestException:
+                    pass  # server not ready yet
+                next_health = time.perf_counter() - START + health_interval_s
+                health_interval_s = min(health_interval_s * 1.5, HEALTH_MAX_S)
+            if process.poll() is not None:
+                print(f"vLLM server exited with return code {process.returncode}", flush=True)
+                return False
+            if elapsed - last_report >= 30:
+                print(f"vLLM server not ready after {round(elapsed)} seconds, retrying...", flush=True)
+                last_report = elapsed
+            time.sleep(TAIL_INTERVAL_S)
 
     print("vLLM server did not become ready within the timeout period.", flush=True)
     return False
 
 if not check_vllm_ready(): # Wait until vLLM server is ready.
     RESULT['state'] = "restarted" 
-    RESULT['message'] = "Cannot start in 15 minutes" 
+    RESULT['message'] = "Cannot start in 15 minutes" if process.poll() is None else f"vLLM exited with return code {process.returncode}"
+    RESULT['startup phases_s'] = STARTUP.phases()
 else:
     END = time.perf_counter()
     RESULT['state'] = "running"
     RESULT['startup time_s'] = round(END - START,3)
+    RESULT['startup phases_s'] = STARTUP.phases(RESULT['startup time_s'])
+    print(f"vLLM start-up phases: {RESULT['startup phases_s']}", flush=True)
 
 # Report the running state to cloud storage
 print("Report the running state...", flush=True)
 print(json.dumps(RESULT, indent=2), flush=True)
 with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
     json.dump(RESULT, f, indent=2)
-Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")  
+Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)  
 
 # Many instances running concurrently may generate too many model download requests, which could be throttled by Hugging Face.
 # If the vLLM server fails due to model download issues, restart the pod after some time (15 minutes).
-# Run 10 instances every 10 minutes (for Llama 3 8B).
+# Run 10 instances every 10 minutes (for Llama 3 8B), or let 37_admission.py admit the model loading of the nodes (ADMISSION '1').
 # Improvement: pre-load the model to the host first.
 if RESULT['state'] != "running":
     print("vLLM not ready in 15 minutes. Exiting to trigger container restart...", flush=True)
     sys.exit(1)  # Exit with non-zero code
 
 
-# Inference function
-def run_inference():
-    
-    while True:
-        try:
-            response = requests.post(URL, json=PAYLOAD, headers=HEADERS, timeout=600)
-
-            if response.status_code == 200:
-                data = response.json()
-                tokens = data.get('usage', {}).get('total_tokens', 'N/A')
-                print(f"Success, tokens returned: {tokens}", flush=True)
-            else:
-                print(f"Failed with status code {response.status_code}", flush=True)
+# Capacity search, with an open-loop load, before the continuous load
+if GOODPUT == 1:
+    goodput_start = time.perf_counter()
+    payload = dict(PAYLOAD, max_tokens=GOODPUT_MAX_TOKENS)
+    RESULT['goodput'] = Find_Goodput(URL, payload, SLO_TTFT_S, SLO_ITL_MS, max_rate=GOODPUT_MAX_RATE,
+                                     max_concurrency=GOODPUT_MAX_CONCURRENCY, step_s=GOODPUT_STEP_S,
+                                     min_rate=GOODPUT_MIN_RATE, max_step_s=GOODPUT_MAX_STEP_S)
+    RESULT['goodput_rps'] = RESULT['goodput']['goodput_rps']
+    RESULT['goodput time_s'] = round(time.perf_counter() - goodput_start, 3)
+    with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
+        json.dump(RESULT, f, indent=2)
+    Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)
 
-        except requests.RequestException as e:
-            print(f"Error: {e}", flush=True)
+# Inference function, keeping CONCURRENCY streamed requests in flight
+LOAD_STATS = New_Load_Stats()
 
-        END = time.perf_counter()
-        RESULT['running time_s'] = round(END - START,3)
-        RESULT['inference number'] = RESULT['inference number'] + 1
-        RESULT['generated token number'] = RESULT['generated token number'] + tokens if tokens != 'N/A' else 0
+def update_result(result=None):
+    END = time.perf_counter()
+    RESULT['running time_s'] = round(END - START,3)
+    RESULT['inference number'] = LOAD_STATS['requests']
+    RESULT['generated token number'] = LOAD_STATS['total tokens']
+    RESULT['output token number'] = LOAD_STATS['output tokens']
+    RESULT['failed inference number'] = LOAD_STATS['failures']
 
-        time.sleep(2)
+def run_inference():
+    Run_Load(URL, PAYLOAD, CONCURRENCY, LOAD_STATS, on_result=update_result)
 
 
 # Create and start a thread
@@ -165,42 +238,52 @@ inference_thread.start()
 # Main thread can continue doing other things
 print("Inference thread started and running in the background...")
 
+# GPU State Info, sampled in the background instead of once per upload
+GPU_SAMPLER = GPU_Sampler(TELEMETRY_INTERVAL_S).start()
+
+# GPU Driver and Product Info, which do not change while running
+SMI_VERSION = subprocess.run( ["amd-smi", "version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True).stdout
+SMI_PRODUCT = subprocess.run( ["rocm-smi", "--showproduct"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True).stdout
+
+# Only the bytes appended to the inference logs since the last upload are shipped
+LOG_SHIPPER = Log_Shipper(temp_log_file, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.segments")
+
 # Upload log file every X minutes
 while True:
 
     time.sleep(120)
 
+    # Inference Logs, the new bytes only
+    LOG_SHIPPER.ship()
+
+    update_result()
+    RESULT.update(Summarize_Load(LOAD_STATS, RESULT['running time_s'] - RESULT['startup time_s'] - RESULT['goodput time_s']))
+    RESULT['log segments'] = LOG_SHIPPER.first - 1 + LOG_SHIPPER.segments # With those of the earlier processes
+    RESULT['log size_bytes'] = LOG_SHIPPER.offset
+    RESULT['gpu telemetry'] = GPU_SAMPLER.summary()
     with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
         json.dump(RESULT, f, indent=2)
 
-    # GPU State Info
-    temp = subprocess.run( ["rocm-smi"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True)
+    # GPU State Info, the last sample
     with open(LOCAL_LOG_FILE, "a") as f:
         f.write("\n\n") 
         f.write("-" * 40 + "> rocm-smi\n") 
-        f.write(temp.stdout)    
+        f.write(GPU_SAMPLER.last_text)
 
     # GPU Driver Info
-    temp = subprocess.run( ["amd-smi", "version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True)
     with open(LOCAL_LOG_FILE, "a") as f:
         f.write("\n\n") 
         f.write("-" * 40 + "> amd-smi version\n") 
-        f.write(temp.stdout)
+        f.write(SMI_VERSION)
 
     # GPU Product Info
-    temp = subprocess.run( ["rocm-smi", "--showproduct"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True)
     with open(LOCAL_LOG_FILE, "a") as f:
         f.write("\n\n") 
         f.write("-" * 40 + "> rocm-smi --showproduct\n") 
-        f.write(temp.stdout)
-
-    # Inference Logs
-    with open(LOCAL_LOG_FILE, "a") as f1, open(temp_log_file, "r") as f2:
-        f1.write("\n\n")  
-        f1.write("-" * 40 + "> Inference Logs\n") 
-        f1.write(f2.read())
+        f.write(SMI_PRODUCT)
 
-    Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")
+    Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)
+    Upload_Bytes(GPU_SAMPLER.to_json().encode(), BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.telemetry.json")
 
     print("Running...", flush=True)
     print(json.dumps(RESULT, indent=2), flush=True)
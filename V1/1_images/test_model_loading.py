@@ -1,19 +1,27 @@
 import os
 import sys
 import json
-import shutil
-from helper import Downloader, Uploader, Check_Cloud_Folder, Check_Local_Folder, Get_Folder_Size
+import helper
+from admission import Request_Admission, Report_Done
+from helper import Sync_Model, Uploader, Check_Cloud_Folder, Check_Local_Folder, Get_Folder_Size, Write_Marker, Read_Marker, Warm_Page_Cache, Sweep_Transfer, Evict_Blob_Cache, Parse_Size
 import time
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 load_dotenv()
 
-# environment variables: TASK_NAME, NODE_NAME, BUCKET, FOLDER, MODEL, MODEL_FOLDER, OVERRIDE
+# environment variables: TASK_NAME, NODE_NAME, BUCKET, FOLDER, MODEL, MODEL_FOLDER, OVERRIDE, NODE_TEST_MODE, ADMISSION, WARM_UP,
+#                        PART_SIZE, CONCURRENCY, TRANSFER_SWEEP, BLOB_CACHE, BLOB_CACHE_BUDGET
 
 TASK_NAME         = os.getenv("TASK_NAME", "test-model-loading-2025")
 NODE_NAME         = os.getenv("NODE_NAME", "test-node")
-LOCAL_LOG_FILE    = "./final.log"
+LOG_DIR           = os.getenv("LOG_DIR", ".")
+LOCAL_LOG_FILE    = os.path.join(LOG_DIR, "final.log")
+
+# "sequential": in its own init container, after the training
+# "overlap": started by test_node.py alongside the training, in the training container (see test_node.py)
+NODE_TEST_MODE    = os.getenv("NODE_TEST_MODE", "sequential")
 
 # Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results 
 # ds:{BUCKET}/{FOLDER}/megatron
@@ -32,6 +40,35 @@ LOCAL_PATH        = os.path.join(HF_CACHE_FOLDER, MODEL_FOLDER)
 
 OVERRIDE          = int(os.getenv("OVERRIDE", "1"))       # Optional, hardcoded at this time
 
+# The host-wide blob cache, shared by all the models and pods of the host (see helper.Sync_Model), on the same hostPath as the
+# Hugging Face cache; "": the blobs are kept in each model folder
+# Within BLOB_CACHE_BUDGET, the least recently used blobs of the other models are evicted after the download; "0": no limit
+BLOB_CACHE        = os.getenv("BLOB_CACHE", os.path.join(os.path.dirname(HF_CACHE_FOLDER), "blobs"))
+BLOB_CACHE_BUDGET = Parse_Size(os.getenv("BLOB_CACHE_BUDGET", "0"))
+BLOB_CACHE_GRACE_S = int(os.getenv("BLOB_CACHE_GRACE_S", "21600")) # The blobs used in the last 6 hours are kept, e.g. synced by
+                                                                  # another pod whose vLLM (or its restart) has not read them yet
+
+# '1': wait for the admission by the fleet coordinator (37_admission.py) before downloading, instead of a fixed stagger
+ADMISSION           = int(os.getenv("ADMISSION", "0"))
+ADMISSION_TIMEOUT_S = int(os.getenv("ADMISSION_TIMEOUT_S", "3600")) # Then download anyway, e.g. no coordinator running
+
+# '1': read the model back after the download, into the page cache, and measure the local disk read throughput
+WARM_UP             = int(os.getenv("WARM_UP", "1"))
+WARM_UP_CONCURRENCY = int(os.getenv("WARM_UP_CONCURRENCY", "8"))
+
+# The transfer parameters of the download; "auto": the best setting of the sweep, from this run or saved on the host by an earlier one
+PART_SIZE           = os.getenv("PART_SIZE", "100M")
+CONCURRENCY         = os.getenv("CONCURRENCY", "10")
+DEFAULT_PART_SIZE   = "100M"
+DEFAULT_CONCURRENCY = "10"
+TRANSFER_SETTING_FILE = os.path.join(HF_CACHE_FOLDER, ".transfer_setting.json") # Kept on the host with the models
+
+# '1': sweep the part size x concurrency over a sample of the model before the download (see helper.Sweep_Transfer)
+TRANSFER_SWEEP      = int(os.getenv("TRANSFER_SWEEP", "0"))
+SWEEP_PART_SIZES    = os.getenv("SWEEP_PART_SIZES", "8M,32M,100M,256M").split(",")
+SWEEP_CONCURRENCIES = [int(value) for value in os.getenv("SWEEP_CONCURRENCIES", "4,10,16,32,64").split(",")]
+SWEEP_SAMPLE_SIZE   = os.getenv("SWEEP_SAMPLE_SIZE", "2G")
+
 # To keep benchamrk results
 RESULT = {}
 RESULT['task name']           = TASK_NAME
@@ -39,11 +76,46 @@ RESULT['node name']           = NODE_NAME
 RESULT['type']                = "model_loading"
 RESULT['online utc']          = datetime.now(ZoneInfo("UTC")).strftime("%Y-%m-%d %H:%M:%S")
 RESULT['state']               = "pending" # "pending", "success", "failure"
+RESULT['mode']                = NODE_TEST_MODE
 RESULT['duration_s']          = 9999.9999
+RESULT['overlapped time_s']   = 0.0 # While the training was running, hidden from the node wall-clock
+RESULT['critical path_s']     = 0.0 # After the training, added to the node wall-clock
+RESULT['admission wait_s']    = 0.0 # Excluded from the duration and the throughput
+RESULT['warm-up time_s']      = 0.0 # Reading the model back from the disk, after the download
+RESULT['warm-up size_GB']     = 0
+RESULT['disk read_GBps']      = 0 # Local disk sequential read throughput, not from the page cache
+RESULT['sweep time_s']        = 0.0 # Excluded from the duration and the throughput
+RESULT['transfer sweep']      = {} # {"sample size_GB", "matrix", "best"}
+RESULT['part size']           = PART_SIZE
+RESULT['concurrency']         = CONCURRENCY
+RESULT['blob cache']          = {} # {"path", "budget_GB", "size_GB", "shared files", "evicted files", "evicted size_GB"}
 RESULT['data size_GB']        = 0
+RESULT['transferred size_GB'] = 0 # Only the missing or truncated files are downloaded
 RESULT['dl_throughput_Gbps']  = 0
+RESULT['transfer time_s']     = 0.0 # The sync time, excluding the verification left after the last byte arrived
+RESULT['verify time_s']       = 0.0 # The SHA verification time, overlapped with the transfer
+RESULT['verified files']      = 0
+RESULT['corrupt blobs']       = [] # Deleted, so only these are fetched again by the next run
 RESULT['message']             = "" 
 START = time.perf_counter()
+START_TIME = time.time() # Compared with the training marker
+
+# Already loaded alongside the training, in the same pod; loaded again here if that failed
+MARKER = Read_Marker("model_loading")
+if NODE_TEST_MODE == "sequential" and MARKER is not None and MARKER.get('mode') == "overlap" \
+        and MARKER.get('state') == "success" and MARKER.get('model folder') == MODEL_FOLDER:
+    print(f"The model was loaded alongside the training in {MARKER['duration_s']} seconds, {MARKER['critical path_s']} seconds on the critical path", flush=True)
+    print("Exiting with exit code 0...", flush=True)
+    sys.exit(0)
+
+# Wait for a download slot
+ATTEMPT = None
+if RESULT['state'] == "pending" and ADMISSION == 1:
+    admission = Request_Admission(BUCKET, FOLDER, NODE_NAME, ADMISSION_TIMEOUT_S)
+    RESULT['admission wait_s'] = round(time.time() - START_TIME, 3)
+    if admission is not None:
+        ATTEMPT = admission[0]
+    START = time.perf_counter()
 
 # Test Case
 # BUCKET            = "rs-validation-test1"
@@ -51,7 +123,6 @@ START = time.perf_counter()
 # MODEL_FOLDER      = "models--meta-llama--Llama-3.1-8B-Instruct11"
 
 if RESULT['state'] == "pending":
-    # We don't check the integrity of the model files at this time
     temp = Check_Cloud_Folder(BUCKET, f'{MODEL_PREFIX}/{MODEL_FOLDER}') 
     if temp == 0:
         RESULT['state'] = "failure"
@@ -59,20 +130,51 @@ if RESULT['state'] == "pending":
         print(RESULT['message'], flush=True)
 
 if RESULT['state'] == "pending":
-    # We don't check the integrity of the model files at this time
+    # We don't check the integrity of the existing model files at this time
     temp = Check_Local_Folder(LOCAL_PATH)
     if temp != 0 and OVERRIDE == 0:
         RESULT['state'] = "success"
         RESULT['message'] = f"The local model folder {HF_CACHE_FOLDER}/{MODEL_FOLDER} already exists!"
         print(RESULT['message'], flush=True)
 
+# Benchmark mode: find the best transfer parameters of this node, within the admission slot, before the download
+if RESULT['state'] == "pending" and TRANSFER_SWEEP == 1:
+    sweep_start = time.perf_counter()
+    try:
+        RESULT['transfer sweep'] = Sweep_Transfer(BUCKET, f'{MODEL_PREFIX}/{MODEL_FOLDER}', SWEEP_PART_SIZES, SWEEP_CONCURRENCIES,
+                                                  SWEEP_SAMPLE_SIZE, os.path.join(HF_CACHE_FOLDER, ".transfer_sweep"))
+        os.makedirs(HF_CACHE_FOLDER, exist_ok=True)
+        with open(TRANSFER_SETTING_FILE, "w") as f:
+            json.dump(RESULT['transfer sweep']['best'], f, indent=2)
+    except (BotoCoreError, ClientError, OSError) as e: # The download goes on with the other settings
+        print(f"The error message: {e}", flush=True)
+    RESULT['sweep time_s'] = round(time.perf_counter() - sweep_start, 3)
+    START = time.perf_counter()
+
+if "auto" in (PART_SIZE, CONCURRENCY):
+    best = RESULT['transfer sweep'].get('best')
+    if best is None and os.path.isfile(TRANSFER_SETTING_FILE):
+        with open(TRANSFER_SETTING_FILE) as f:
+            best = json.load(f)
+    if best is None:
+        print(f"Attention: no transfer sweep on this host, using part size {DEFAULT_PART_SIZE} and concurrency {DEFAULT_CONCURRENCY}", flush=True)
+        best = {"part size": DEFAULT_PART_SIZE, "concurrency": DEFAULT_CONCURRENCY}
+    RESULT['part size']   = best['part size'] if PART_SIZE == "auto" else PART_SIZE
+    RESULT['concurrency'] = str(best['concurrency']) if CONCURRENCY == "auto" else CONCURRENCY
+
 if RESULT['state'] == "pending":
-    if os.path.exists(LOCAL_PATH) and os.path.isdir(LOCAL_PATH):
-        shutil.rmtree(LOCAL_PATH)
-    temp = Downloader(BUCKET, f'{MODEL_PREFIX}/{MODEL_FOLDER}', LOCAL_PATH, chunk_size_mbype="100M", concurrency="10")  
+    # Keep the blobs already on the host and fetch only the missing or truncated ones, verifying their SHA while streaming
+    temp = Sync_Model(BUCKET, f'{MODEL_PREFIX}/{MODEL_FOLDER}', LOCAL_PATH, chunk_size_mbype=RESULT['part size'], concurrency=RESULT['concurrency'],
+                      blob_cache=BLOB_CACHE or None)
+    RESULT['transfer time_s'] = round(helper.TRANSFER_STATS['duration_s'] - helper.TRANSFER_STATS.get('verify tail_s', 0), 3)
+    RESULT['verify time_s']   = helper.TRANSFER_STATS.get('verify time_s', 0.0)
+    RESULT['verified files']  = helper.TRANSFER_STATS.get('verified files', 0)
+    RESULT['corrupt blobs']   = helper.TRANSFER_STATS.get('corrupt blobs', [])
     if temp == 0:
         RESULT['state'] = "failure"
         RESULT['message'] = f"Failed to download the model folder ds:{BUCKET}/{MODEL_PREFIX}/{MODEL_FOLDER} to local path {LOCAL_PATH}!"
+        if RESULT['corrupt blobs']:
+            RESULT['message'] += f" {len(RESULT['corrupt blobs'])} blobs are corrupt."
         print(RESULT['message'], flush=True)
 
 if RESULT['state'] == "pending": 
@@ -91,11 +193,62 @@ RESULT['duration_s'] = round(END - START,3)
 
 if RESULT['state'] == "success":
     RESULT['data size_GB']  = round(Get_Folder_Size(LOCAL_PATH)/1_000_000_000, 3)  # GB 
-    RESULT['dl_throughput_Gbps']  = round(RESULT['data size_GB'] * 8/RESULT['duration_s'], 3)  # Gbps 
+    RESULT['transferred size_GB'] = round(helper.TRANSFER_STATS.get('bytes', 0)/1_000_000_000, 3)  # GB 
+    RESULT['dl_throughput_Gbps']  = round(RESULT['transferred size_GB'] * 8/RESULT['duration_s'], 3)  # Gbps 
+
+# Free the download slot, and tune the admissions with the throughput
+if ATTEMPT is not None:
+    Report_Done(BUCKET, FOLDER, NODE_NAME, ATTEMPT, {key: RESULT[key] for key in ("state", "duration_s", "transferred size_GB", "dl_throughput_Gbps")})
+
+# Keep the blob cache within its budget, the blobs of this model aside, after the download slot is freed
+if RESULT['state'] == "success" and BLOB_CACHE:
+    RESULT['blob cache'] = {"path": BLOB_CACHE, "budget_GB": round(BLOB_CACHE_BUDGET/1_000_000_000, 3),
+                            "shared files": helper.TRANSFER_STATS.get('shared files', 0)}
+    try:
+        blobs_path = os.path.join(LOCAL_PATH, "blobs")
+        keep = set(os.listdir(blobs_path)) if os.path.isdir(blobs_path) else set()
+        cache_stats = Evict_Blob_Cache(BLOB_CACHE, BLOB_CACHE_BUDGET if BLOB_CACHE_BUDGET > 0 else float("inf"), keep, BLOB_CACHE_GRACE_S)
+        if cache_stats is not None:
+            RESULT['blob cache']['size_GB'] = round(cache_stats['bytes']/1_000_000_000, 3)
+            RESULT['blob cache']['evicted files'] = cache_stats['evicted files']
+            RESULT['blob cache']['evicted size_GB'] = round(cache_stats['evicted bytes']/1_000_000_000, 3)
+    except OSError as e:
+        print(f"The error message: {e}", flush=True)
+
+# Read the model back from the local disk in parallel, which measures the disk and leaves the model in the page cache
+# for the vLLM weight loading
+if RESULT['state'] == "success" and WARM_UP == 1:
+    try:
+        stats = Warm_Page_Cache(LOCAL_PATH, WARM_UP_CONCURRENCY)
+        RESULT['warm-up time_s'] = stats['duration_s']
+        RESULT['warm-up size_GB'] = round(stats['bytes']/1_000_000_000, 3)
+        RESULT['disk read_GBps'] = stats['read_GBps']
+    except OSError as e:
+        print(f"The error message: {e}", flush=True)
+
+# The part of the loading (with the admission wait, the sweep and the warm-up) after the end of the training is on the critical path of the node
+TOTAL_S = RESULT['duration_s'] + RESULT['admission wait_s'] + RESULT['sweep time_s'] + RESULT['warm-up time_s']
+TRAINING = Read_Marker("training")
+if NODE_TEST_MODE == "overlap" and TRAINING is not None:
+    RESULT['overlapped time_s'] = round(min(max(TRAINING['end'] - START_TIME, 0.0), TOTAL_S), 3)
+elif NODE_TEST_MODE == "overlap":
+    RESULT['overlapped time_s'] = round(TOTAL_S, 3) # The training is still running
+RESULT['critical path_s'] = round(TOTAL_S - RESULT['overlapped time_s'], 3)
 
 with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
     json.dump(RESULT, f, indent=2)
-Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")
+Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)
+
+# The readiness marker, for the model loader container and the inference
+Write_Marker("model_loading", {
+    "mode": NODE_TEST_MODE,
+    "state": RESULT['state'],
+    "model folder": MODEL_FOLDER,
+    "end": time.time(),
+    "duration_s": RESULT['duration_s'],
+    "overlapped time_s": RESULT['overlapped time_s'],
+    "critical path_s": RESULT['critical path_s'],
+})
 
 print(json.dumps(RESULT, indent=2), flush=True)
 
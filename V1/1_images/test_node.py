@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import subprocess
+from helper import Write_Marker, Read_Marker, Clear_Marker
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# The node test runner, in the training init container
+#   NODE_TEST_MODE=sequential   the training only, the model is loaded by the model loader init container after it
+#   NODE_TEST_MODE=overlap      the model is loaded alongside the training, which barely uses the network,
+#                               so the download is hidden from the node wall-clock instead of following the training
+# The hand-over is a readiness marker in MARKER_DIR (helper.py): the model loader init container skips the download
+# if the model was already loaded successfully here, and loads it again otherwise, so the test coverage is the same
+
+
+NODE_TEST_MODE = os.getenv("NODE_TEST_MODE", "sequential")
+MODEL_LOADING_LOG_DIR = "/tmp/model_loading" # Its own final.log, not the one of the training
+
+
+# The markers outlive a restart of this container, so the ones of the previous run are removed first
+for name in ("training", "model_loading"):
+    Clear_Marker(name)
+
+loader = None
+if NODE_TEST_MODE == "overlap":
+    print("Starting the model loading alongside the training...", flush=True)
+    os.makedirs(MODEL_LOADING_LOG_DIR, exist_ok=True)
+    env = os.environ.copy()
+    env["LOG_DIR"] = MODEL_LOADING_LOG_DIR
+    loader = subprocess.Popen([sys.executable, "test_model_loading.py"], env=env)
+
+START = time.time()
+retcode = subprocess.run([sys.executable, "test_training.py"]).returncode
+END = time.time()
+Write_Marker("training", {"start": START, "end": END, "returncode": retcode})
+print(f"The training finished in {round(END - START, 3)} seconds with return code {retcode}", flush=True)
+
+if loader is not None:
+    print("Waiting for the model loading...", flush=True)
+    loader.wait()
+    marker = Read_Marker("model_loading")
+    if marker is None:
+        print(f"Attention: the model loading exited with return code {loader.returncode} and no readiness marker", flush=True)
+    else:
+        print(f"The model loading: {marker['state']} in {marker['duration_s']} seconds, "
+              f"overlapped {marker['overlapped time_s']} seconds, critical path {marker['critical path_s']} seconds", flush=True)
+    print(f"Node wall-clock: {round(time.time() - START, 3)} seconds", flush=True)
+
+# Like the training, it exits with 0; a failed model loading is retried by the model loader init container
+print("Exiting...", flush=True)
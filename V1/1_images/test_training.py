@@ -2,7 +2,14 @@ import time
 import subprocess
 import json
 import os
-from helper import Uploader
+import math
+import shlex
+import shutil
+import signal
+import threading
+from helper import Uploader, Upload_Bytes
+from gpu_telemetry import GPU_Sampler
+from log_parser import Megatron_Parser, Summarize_Training
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
@@ -17,8 +24,20 @@ BUCKET      = os.getenv("BUCKET", "")
 FOLDER      = os.getenv("FOLDER", "")
 SUB_FOLDER  = "megatron"
 NODE_NAME   = os.getenv("NODE_NAME", "") # DOKS WOKER NAME
-LOCAL_LOG_FILE = "/workspace/Megatron-LM/final.log"
-temp_log_file = "/workspace/Megatron-LM/megatron.log"
+LOG_DIR     = os.getenv("LOG_DIR", "/workspace/Megatron-LM")
+LOCAL_LOG_FILE = os.path.join(LOG_DIR, "final.log")
+temp_log_file = os.path.join(LOG_DIR, "megatron.log")
+TELEMETRY_INTERVAL_S = float(os.getenv("TELEMETRY_INTERVAL_S", "10")) # GPU power, temperature, clocks, VRAM% and GPU% sampled in the background
+
+# The training command, e.g. replaced by "python3 replay_log.py megatron.log" to replay a recorded run
+TRAINING_COMMAND = os.getenv("TRAINING_COMMAND", "bash examples/llama/train_llama2.sh")
+PROGRESS_INTERVAL_S = float(os.getenv("PROGRESS_INTERVAL_S", "60")) # RESULT uploaded while training
+
+# Early abort, so a broken node does not hold the GPUs until the end of the run
+WARMUP_ITERATIONS       = int(os.getenv("WARMUP_ITERATIONS", "2"))
+EXPECTED_TFLOPS_PER_GPU = float(os.getenv("EXPECTED_TFLOPS_PER_GPU", "0"))  # 0: no throughput check, e.g. 600 for MI350X, 420 for MI325X
+MIN_THROUGHPUT_RATIO    = float(os.getenv("MIN_THROUGHPUT_RATIO", "0.5"))   # Abort below this fraction of the expected TFLOP/s
+SLOW_ITERATIONS         = int(os.getenv("SLOW_ITERATIONS", "2"))            # in a row, after the warm-up
 
 
 RESULT = {}
@@ -26,10 +45,19 @@ RESULT['node name']        = NODE_NAME
 RESULT['task name']        = TASK_NAME
 RESULT['type']             = "training"
 RESULT['online utc']       = datetime.now(ZoneInfo("UTC")).strftime("%Y-%m-%d %H:%M:%S")
-RESULT['command']          = "MOCK_DATA=1 TEE_OUTPUT=1 MBS=5 BS=120 TP=8 TE_FP8=0 NO_TORCH_COMPILE=1 SEQ_LENGTH=4096 TOTAL_ITERS=12 bash /workspace/Megatron-LM/examples/llama/train_llama2.sh"
-RESULT['state']            = "pending" # "pending", "success", "failure"
+RESULT['command']          = f"MOCK_DATA=1 TEE_OUTPUT=1 MBS=5 BS=120 TP=8 TE_FP8=0 NO_TORCH_COMPILE=1 SEQ_LENGTH=4096 TOTAL_ITERS=12 {TRAINING_COMMAND}"
+RESULT['state']            = "pending" # "pending", "running", "success", "failure"
 RESULT['duration_s']       = 0.0
 RESULT['message']          = "" 
+# Updated from the Megatron output while training
+RESULT['iteration']        = 0
+RESULT['total iterations'] = 0
+RESULT['lm loss']          = 0.0
+RESULT['tflops per gpu']   = 0.0 # The mean of the steady iterations, after the warm-up
+RESULT['elapsed_ms mean']  = 0.0
+RESULT['elapsed_ms stdev'] = 0.0
+RESULT['max reserved_mb']  = 0.0
+RESULT['gpu telemetry']    = {} # Mean and max per field; the series are shipped as {NODE_NAME}.telemetry.json
 
 
 # Report the initial state to cloud storage
@@ -37,11 +65,12 @@ print("Report the initial state...", flush=True)
 print(json.dumps(RESULT, indent=2), flush=True)
 with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
     json.dump(RESULT, f, indent=2)
-Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")    
+Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)    
 
 
 # Start training
 START = time.perf_counter()
+GPU_SAMPLER = GPU_Sampler(TELEMETRY_INTERVAL_S).start()
 
 print("Starting training...", flush=True)
 env = os.environ.copy() # Set environment variables
@@ -56,21 +85,91 @@ env.update({
     "SEQ_LENGTH": "4096",
     "TOTAL_ITERS": "12",
 })
-cmd = [ "bash", "examples/llama/train_llama2.sh" ]
-
-with open(temp_log_file, "w") as f: # Open log file for both stdout and stderr
+cmd = shlex.split(TRAINING_COMMAND)
+
+# Returns the reason to abort the run, or None
+SLOW = [0] # Slow steady iterations in a row
+def check_iteration(record):
+    if record.get('nan iterations') or record.get('skipped iterations'):
+        return f"{record.get('nan iterations') or 0} NaN and {record.get('skipped iterations') or 0} skipped iterations at iteration {record['iteration']}"
+    if isinstance(record.get('lm loss'), float) and math.isnan(record['lm loss']):
+        return f"NaN loss at iteration {record['iteration']}"
+    if EXPECTED_TFLOPS_PER_GPU > 0 and record['iteration'] > WARMUP_ITERATIONS and record.get('tflops per gpu') is not None:
+        if record['tflops per gpu'] < EXPECTED_TFLOPS_PER_GPU * MIN_THROUGHPUT_RATIO:
+            SLOW[0] += 1
+            if SLOW[0] >= SLOW_ITERATIONS:
+                return f"{record['tflops per gpu']} TFLOP/s/GPU at iteration {record['iteration']}, expected {EXPECTED_TFLOPS_PER_GPU}"
+        else:
+            SLOW[0] = 0
+    return None
+
+def report_progress():
+    with open(LOCAL_LOG_FILE, 'w') as f: # Write the RESULT to the log file
+        json.dump(RESULT, f, indent=2)
+    Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)
+
+# Upload RESULT at intervals, also when the output stalls
+def progress_loop(stop_event):
+    while not stop_event.wait(PROGRESS_INTERVAL_S):
+        RESULT['duration_s'] = round(time.perf_counter() - START, 3)
+        report_progress()
+
+RESULT['state'] = "running"
+report_progress()
+progress_stop = threading.Event()
+progress_thread = threading.Thread(target=progress_loop, args=(progress_stop,), daemon=True)
+progress_thread.start()
+
+# The output is parsed line by line as it is written, and saved to the log file
+PARSER = Megatron_Parser()
+abort_reason = None
+with open(temp_log_file, "w") as f:
     process = subprocess.Popen(
         cmd,
         env=env,
-        stdout=f,
-        stderr=subprocess.STDOUT  # redirect stderr → same file
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,  # redirect stderr → same pipe
+        text=True,
+        errors="replace",
+        bufsize=1,
+        start_new_session=True     # Its own process group, to stop the training processes it spawns
     )
+    for line in process.stdout:
+        f.write(line)
+        record = PARSER.feed(line)
+        if record is None:
+            continue
+        RESULT['iteration'] = record['iteration']
+        RESULT['total iterations'] = record['total iterations']
+        RESULT['lm loss'] = None if isinstance(record.get('lm loss'), float) and math.isnan(record['lm loss']) else record.get('lm loss')
+        RESULT.update({name: round(value, 3) for name, value in Summarize_Training(PARSER, WARMUP_ITERATIONS).items() if name in RESULT})
+        print(f"Iteration {record['iteration']}/{record['total iterations']}, TFLOP/s/GPU: {record.get('tflops per gpu')}, Loss: {record.get('lm loss')}", flush=True)
+        abort_reason = check_iteration(record)
+        if abort_reason is not None:
+            print(f"Aborting the training: {abort_reason}", flush=True)
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError: # Already exited
+                pass
+            break
     retcode = process.wait()
+progress_stop.set()
+progress_thread.join()
 
 END = time.perf_counter()
 RESULT['duration_s'] = round(END - START,3)
+GPU_SAMPLER.stop()
+GPU_SAMPLER.sample() # The GPU state at the end, also written to the log
+RESULT['gpu telemetry'] = GPU_SAMPLER.summary()
 
-if retcode == 0:
+if abort_reason is not None:
+    RESULT['state'] = "failure"
+    RESULT['message'] = f"The training was aborted: {abort_reason}"
+    print(RESULT['message'], flush=True)
+elif retcode == 0:
     print("Successful!", flush=True)
     RESULT['state'] = "success"
 else:
@@ -91,12 +190,11 @@ with open(LOCAL_LOG_FILE, "a") as f:
     f.write("-" * 40 + "> amd-smi version\n") 
     f.write(temp.stdout)
 
-# GPU State Info
-temp = subprocess.run( ["rocm-smi"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True)
+# GPU State Info, the last sample
 with open(LOCAL_LOG_FILE, "a") as f:
     f.write("\n\n") 
     f.write("-" * 40 + "> rocm-smi\n") 
-    f.write(temp.stdout)
+    f.write(GPU_SAMPLER.last_text)
 
 # GPU Product Info
 temp = subprocess.run( ["rocm-smi", "--showproduct"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,text=True)
@@ -109,9 +207,10 @@ with open(LOCAL_LOG_FILE, "a") as f:
 with open(LOCAL_LOG_FILE, "a") as f1, open(temp_log_file, "r") as f2:
     f1.write("\n\n")  
     f1.write("-" * 40 + "> Training Logs\n") 
-    f1.write(f2.read())
+    shutil.copyfileobj(f2, f1) # In blocks, not the whole log in memory
 
-Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log")
+Uploader(LOCAL_LOG_FILE, BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.log", compress=True)
+Upload_Bytes(GPU_SAMPLER.to_json().encode(), BUCKET, f"{FOLDER}/{SUB_FOLDER}/{NODE_NAME}.telemetry.json")
 
 print(json.dumps(RESULT, indent=2), flush=True)
 print("Exiting...", flush=True)
\ No newline at end of file
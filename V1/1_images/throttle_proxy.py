@@ -0,0 +1,75 @@
+import sys
+import time
+import asyncio
+
+# A bandwidth-limited local S3 stand-in: a TCP proxy in front of a local S3 server (e.g. moto_server or MinIO),
+# for testing the transfers (e.g. TRANSFER_SWEEP in test_model_loading.py) without the cloud
+#   python3 throttle_proxy.py {LISTEN PORT} {UPSTREAM HOST:PORT} {TOTAL Gbps} [{PER-CONNECTION Gbps}]
+#   AWS_ENDPOINT_URL=http://127.0.0.1:{LISTEN PORT} python3 test_model_loading.py
+# The responses share a token bucket of TOTAL Gbps, like the bucket bandwidth, and each connection has its own of
+# PER-CONNECTION Gbps, like the per-connection limit of the object store, so the concurrency matters as it does in the cloud
+CHUNK_SIZE = 64 * 1024
+BURST_S    = 0.05 # The seconds of traffic a bucket can hold, and at least one CHUNK_SIZE read, so a low rate never stalls
+
+class Token_Bucket:
+    def __init__(self, Gbps):
+        self.rate = Gbps * 1_000_000_000 / 8 # Bytes per second
+        self.capacity = max(self.rate * BURST_S, CHUNK_SIZE)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self, size):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.capacity)
+                self.updated = now
+                if self.tokens >= size:
+                    self.tokens -= size
+                    return
+                await asyncio.sleep((size - self.tokens) / self.rate)
+
+async def pipe(reader, writer, buckets):
+    try:
+        while True:
+            data = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            for bucket in buckets:
+                await bucket.take(len(data))
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(port, upstream, total_Gbps, connection_Gbps):
+    host, upstream_port = upstream.rsplit(":", 1)
+    total = Token_Bucket(total_Gbps)
+
+    async def handle(client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, int(upstream_port))
+        except OSError as e:
+            print(f"The error message: {e}", flush=True)
+            client_writer.close()
+            return
+        buckets = [total] + ([Token_Bucket(connection_Gbps)] if connection_Gbps else [])
+        await asyncio.gather(pipe(client_reader, upstream_writer, []), pipe(upstream_reader, client_writer, buckets))
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port)
+    print(f"Listening on 127.0.0.1:{port} -> {upstream}, {total_Gbps} Gbps in all, {connection_Gbps or 'no limit'} Gbps per connection", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python3 throttle_proxy.py {LISTEN PORT} {UPSTREAM HOST:PORT} {TOTAL Gbps} [{PER-CONNECTION Gbps}]")
+        sys.exit(1)
+    try:
+        asyncio.run(serve(int(sys.argv[1]), sys.argv[2], float(sys.argv[3]), float(sys.argv[4]) if len(sys.argv) > 4 else 0.0))
+    except KeyboardInterrupt:
+        print("\nStopped", flush=True)
@@ -1,29 +1,95 @@
-import subprocess
 import os
+import sys
+import json
+import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 load_dotenv()
 
-# Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results 
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from helper import List_Cloud_Objects, Download_Object_List, TRANSFER_STATS
+from log_utils import SEGMENTS_SUFFIX
+
+# Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results
 # ds:{BUCKET}/{FOLDER}/megatron
 # ds:{BUCKET}/{FOLDER}/llama
 # ds:{BUCKET}/{FOLDER}/benchmark/model_loading
 BUCKET = os.getenv("BUCKET")
 FOLDER = os.getenv("FOLDER")
 
+# python3 31_download.py                     download the files changed since the last run
+# python3 31_download.py --watch [SECONDS]   and again every SECONDS, while the test runs
+WATCH_INTERVAL_S = int(os.getenv("WATCH_INTERVAL_S", "60"))
+CONCURRENCY      = os.getenv("DOWNLOAD_CONCURRENCY", "16")
+
+# {relative path: {"etag", "size"}}, the objects already downloaded, so a poll lists the folder once and only downloads the changes
+MANIFEST_FILE = os.path.join(FOLDER, ".download_manifest.json")
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    with open(MANIFEST_FILE + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
+
+# The changed node files, with the new log segments counted per node
+def print_changes(changed):
+    segments = {}
+    for path in sorted(changed):
+        folder = os.path.dirname(path)
+        if folder.endswith(SEGMENTS_SUFFIX):
+            segments[folder] = segments.get(folder, 0) + 1
+        else:
+            print(f"Changed: {path}")
+    for folder, count in segments.items():
+        print(f"Changed: {folder[:-len(SEGMENTS_SUFFIX)]}, {count} new log segments")
+
+def sync(manifest):
+    prefix = FOLDER.strip("/") + "/"
+    objects = List_Cloud_Objects(BUCKET, FOLDER)
+    changed = []
+    for item in objects:
+        path = item['key'][len(prefix):]
+        if manifest.get(path) != {"etag": item['etag'], "size": item['size']} or not os.path.exists(os.path.join(FOLDER, path)):
+            changed.append(item)
+    if len(changed) == 0:
+        print(f"Objects: {len(objects)}, no change")
+        return 1
+
+    if Download_Object_List(BUCKET, FOLDER, changed, FOLDER, "10M", CONCURRENCY) == 0:
+        return 0 # Downloaded again on the next poll
+    for item in changed:
+        manifest[item['key'][len(prefix):]] = {"etag": item['etag'], "size": item['size']}
+    save_manifest(manifest)
+    print(f"Objects: {len(objects)}, Downloaded: {len(changed)} files, {TRANSFER_STATS['bytes']} bytes in {TRANSFER_STATS['duration_s']} seconds")
+    print_changes(item['key'][len(prefix):] for item in changed)
+    return 1
+
+
 # Ensure the local folder exists
 os.makedirs(FOLDER, exist_ok=True)
 
-# Build the command
-cmd = ["rclone", "copy", f"ds:{BUCKET}/{FOLDER}", FOLDER]
-print(" ".join(cmd), flush=True)    
+watch = len(sys.argv) > 1 and sys.argv[1] == "--watch"
+interval_s = int(sys.argv[2]) if watch and len(sys.argv) > 2 else WATCH_INTERVAL_S
 
-# Run the command
+manifest = load_manifest()
 try:
-    subprocess.run(cmd, check=True)
-    print(f"Copied ds:{BUCKET}/{FOLDER} -> {FOLDER} successfully")
-except subprocess.CalledProcessError as e:
-    print(f"Error copying files: {e}")
-
-
+    while True:
+        print(f"\n----> {datetime.now(ZoneInfo('UTC')).strftime('%Y-%m-%d %H:%M:%S')} Download ds:{BUCKET}/{FOLDER} -> {FOLDER}", flush=True)
+        start_time = time.time()
+        try:
+            sync(manifest)
+        except (BotoCoreError, ClientError) as e: # e.g. a network error, retried on the next poll
+            print(f"The error message: {e}", flush=True)
+        if not watch:
+            break
+        time.sleep(max(interval_s - (time.time() - start_time), 0))
+except KeyboardInterrupt:
+    print("\nStopped watching")
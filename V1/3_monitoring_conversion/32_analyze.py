@@ -1,8 +1,15 @@
-import json
 import os
+import sys
+import statistics
 from dotenv import load_dotenv
 load_dotenv()
 
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from histogram import Log_Histogram
+from log_utils import SEGMENTS_SUFFIX, scan_headers, is_log, split_log_name, open_log, list_logs as list_node_logs
+from log_parser import Parse_Megatron_Lines, Summarize_Training
+
 # Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results 
 # ds:{BUCKET}/{FOLDER}/megatron
 # ds:{BUCKET}/{FOLDER}/llama
@@ -13,57 +20,122 @@ SUBFOLDE_MEGATRON                = "megatron"
 SUBFOLDE_BENCHMARK_MODEL_LOADING = "benchmark/model_loading"
 SUBFOLDE_LLAMA                   = "llama"
 
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", "2")) # Excluded from the steady-state training metrics
+
+# Summarized from RESULT['gpu telemetry']
+TELEMETRY_FIELDS = [("Power W", "power_w"), ("Temp °C", "temp_c"), ("SCLK Mhz", "sclk_mhz"), ("VRAM%", "vram_pct"), ("GPU%", "gpu_pct")]
+
 def count_files(path):
     if not os.path.exists(path):
         return 0
 
     total = 0
     for root, dirs, files in os.walk(path):
-        total += len(files)
+        dirs[:] = [d for d in dirs if not d.endswith(SEGMENTS_SUFFIX)] # The log segments belong to the node files
+        total += len([f for f in files if is_log(f)]) # Not the telemetry files, plain or compressed
     return total
 
 
-def analyze_logs(folder, subfolder):
+def list_logs(folder, subfolder):
+    return list_node_logs(os.path.join(folder, subfolder))
+
+# {headers}: {log_path: (header, error)}, from scan_headers()
+def analyze_logs(folder, subfolder, headers):
     path = os.path.join(folder, subfolder)
     count = count_files(path)
     print(f"Files in {path}: {count}")
+    records = []
     if count == 0:
-        return
+        return records
     
-    log_files = [f for f in os.listdir(path) if f.endswith(".log")]
-    for log_file in log_files:
-        json_lines = []
-        with open(os.path.join(path, log_file)) as f:
-            for line in f:
-                if line.strip() == "":  
-                    break
-                json_lines.append(line)
-        json_text = "".join(json_lines)
-        data = json.loads(json_text)
+    for log_path in list_logs(folder, subfolder):
+        data, error = headers[log_path]
+        if data is None:
+            print(f"Attention: {os.path.basename(log_path)} has a malformed header. The error message: {error}")
+            continue
+        records.append(data)
         if data['state'] != "running" and data['state'] !="success":
             print('Attention: ', data['node name'], data['state'], data['message'])
         else:
             if data["type"] == "training":
                 print(f"Node: {data['node name']}, Training Time: {data['duration_s']} seconds")
             elif data["type"] == "model_loading":
-                print(f"Node: {data['node name']}, Data Size: {data['data size_GB']} GB, Duration: {data['duration_s']} seconds, Throughput: {data['dl_throughput_Gbps']} Gbps")
+                print(f"Node: {data['node name']}, Data Size: {data['data size_GB']} GB, Duration: {data['duration_s']} seconds, Throughput: {data['dl_throughput_Gbps']} Gbps, Disk Read: {data.get('disk read_GBps', 'N/A')} GB/s")
+                best = (data.get('transfer sweep') or {}).get('best')
+                if best:
+                    print(f"    Sweep: Best Part Size: {best['part size']}, Concurrency: {best['concurrency']}, Throughput: {best['throughput_Gbps']} Gbps, CPU: {best['cpu_s per GB']} seconds per GB, "
+                          f"Settings: {len(data['transfer sweep']['matrix'])}, Loaded With: {data.get('part size')}/{data.get('concurrency')}")
+                cache = data.get('blob cache') or {}
+                if cache:
+                    print(f"    Blob Cache: {cache.get('size_GB', 'N/A')} GB (Budget: {cache['budget_GB'] or 'No Limit'} GB), Shared Files: {cache['shared files']}, "
+                          f"Evicted: {cache.get('evicted files', 'N/A')} files, {cache.get('evicted size_GB', 'N/A')} GB")
             elif data["type"] == "inference":
-                print(f"Node: {data['node name']}, Startup Time: {data['startup time_s']} seconds, Running Time: {data['running time_s']} seconds, Inference Number: {data['inference number']}, Generated Token Number: {data['generated token number']}")
+                print(f"Node: {data['node name']}, Startup Time: {data['startup time_s']} seconds, Running Time: {data['running time_s']} seconds, Inference Number: {data['inference number']}, Generated Token Number: {data['generated token number']}, Output Tokens/s: {data.get('output tokens per second', 'N/A')}, Mean TTFT: {data.get('ttft_s mean', 'N/A')} seconds")
+                phases = data.get('startup phases_s') or {}
+                if phases:
+                    print("    Startup: " + ", ".join(f"{phase}: {seconds if seconds is not None else 'N/A'}" for phase, seconds in phases.items()) + " (seconds)")
+                goodput = data.get('goodput') or {}
+                if goodput:
+                    print(f"    Goodput: {goodput['goodput_rps']} requests/s, Output Tokens/s: {goodput['output tokens per second']}, Concurrency: {goodput['concurrency']}, "
+                          f"p99 TTFT: {goodput['ttft_s p99']} seconds, p99 ITL: {goodput['itl_ms p99']} ms, "
+                          f"SLOs: {goodput['slo']['ttft_s p99']} seconds / {goodput['slo']['itl_ms p99']} ms, Steps: {len(goodput['steps'])}")
             else: # Others
                 pass
-
-
-print("\n---------> Analyze the megatron log files...")
-analyze_logs(FOLDER, SUBFOLDE_MEGATRON)
-
-print("\n---------> Analyze the model loading log files...")
-analyze_logs(FOLDER, SUBFOLDE_BENCHMARK_MODEL_LOADING)
-
-print("\n---------> Analyze the llama log files...")
-analyze_logs(FOLDER, SUBFOLDE_LLAMA)
-
-
-
-
-
-
+            telemetry = data.get('gpu telemetry') or {}
+            if telemetry.get('samples'):
+                fields = [(name, field) for name, field in TELEMETRY_FIELDS if field in telemetry]
+                print(f"    GPU: Samples: {telemetry['samples']}, " + ", ".join(f"{name}: {telemetry[field]['mean']}/{telemetry[field]['max']}" for name, field in fields) + " (mean/max)")
+    return records
+
+# Fleet-wide percentiles, merging the histograms reported by the nodes
+def merge_histograms(records):
+    fleet = {}
+    for data in records:
+        for name, histogram in data.get('histograms', {}).items():
+            fleet.setdefault(name, Log_Histogram()).merge(Log_Histogram.from_dict(histogram))
+    for name, histogram in fleet.items():
+        print(f"Fleet {name}: Count: {histogram.count}, p50: {histogram.percentile(50):.4f}, p90: {histogram.percentile(90):.4f}, p99: {histogram.percentile(99):.4f}, Max: {histogram.max:.4f}")
+    return fleet
+
+
+# Parse the iteration and memory lines of every training log in one pass, and report the fleet training performance
+def training_report(folder, subfolder):
+    path = os.path.join(folder, subfolder)
+    if not os.path.isdir(path):
+        return {}
+    summaries = {}
+    for log_path in list_node_logs(path):
+        with open_log(log_path, text=True) as f:
+            parser = Parse_Megatron_Lines(f)
+        if len(parser) > 0:
+            summaries[split_log_name(os.path.basename(log_path))[0]] = Summarize_Training(parser, WARMUP_ITERATIONS)
+    if len(summaries) == 0:
+        return summaries
+
+    for node, summary in sorted(summaries.items(), key=lambda item: item[1]['tflops per gpu']):
+        cv = summary['elapsed_ms stdev'] / summary['elapsed_ms mean'] * 100 if summary['elapsed_ms mean'] else 0.0
+        ranks = ", ".join(f"{rank}: {peak['max allocated_mb']:.0f}/{peak['max reserved_mb']:.0f}" for rank, peak in sorted(summary['memory'].items()))
+        print(f"Node: {node}, Steady TFLOP/s/GPU: {summary['tflops per gpu']:.1f}, Iteration Time: {summary['elapsed_ms mean']:.1f} ms (CV {cv:.2f}%), "
+              f"Iterations: {summary['steady iterations']}/{summary['iterations']}, Peak Allocated/Reserved MB per Rank: {{{ranks}}}")
+    tflops = [summary['tflops per gpu'] for summary in summaries.values()]
+    median = statistics.median(tflops)
+    print(f"Fleet: Nodes: {len(tflops)}, Steady TFLOP/s/GPU median: {median:.1f}, min: {min(tflops):.1f}, max: {max(tflops):.1f}, "
+          f"Peak Reserved: {max(summary['max reserved_mb'] for summary in summaries.values()):.0f} MB")
+    return summaries
+
+
+if __name__ == "__main__":
+    # Only the headers are read, in parallel, for the three kinds of logs at once
+    headers = scan_headers([log_path for subfolder in (SUBFOLDE_MEGATRON, SUBFOLDE_BENCHMARK_MODEL_LOADING, SUBFOLDE_LLAMA)
+                            for log_path in list_logs(FOLDER, subfolder)])
+
+    print("\n---------> Analyze the megatron log files...")
+    analyze_logs(FOLDER, SUBFOLDE_MEGATRON, headers)
+    training_report(FOLDER, SUBFOLDE_MEGATRON)
+
+    print("\n---------> Analyze the model loading log files...")
+    analyze_logs(FOLDER, SUBFOLDE_BENCHMARK_MODEL_LOADING, headers)
+
+    print("\n---------> Analyze the llama log files...")
+    llama_records = analyze_logs(FOLDER, SUBFOLDE_LLAMA, headers)
+    merge_histograms(llama_records)
@@ -1,16 +1,20 @@
 import os
+import json
+import errno
+import fcntl
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
-# Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results 
+from log_utils import segments_path, telemetry_path, read_mapping, is_log, split_log_name
+
+# Unique folder for each validation test, ds:{BUCKET}/{FOLDER}, and save the test results (megatron & llama) and the benchmark results
 # ds:{BUCKET}/{FOLDER}/megatron
 # ds:{BUCKET}/{FOLDER}/llama
 # ds:{BUCKET}/{FOLDER}/benchmark/model_loading
 FOLDER = os.getenv("FOLDER")
 
-mapping = {}
-
 mapping_file = "mapping.txt"
 
 removed_values = ["atl1node59999", "atl1node59998", "atl1node59997"] # Exceptions
@@ -21,6 +25,9 @@ SUBFOLDE_MEGATRON                = "megatron"
 SUBFOLDE_BENCHMARK_MODEL_LOADING = "benchmark/model_loading"
 SUBFOLDE_LLAMA                   = "llama"
 
+MANIFEST_FILE = "conversion_manifest.json" # In {OUTPUT_FOLDER}, {source path: {"output", "size", "mtime_ns", "method"}}
+FICLONE = 0x40049409 # ioctl, reflink on btrfs/xfs
+
 # Ensure the local folder exists
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs(os.path.join(OUTPUT_FOLDER, SUBFOLDE_MEGATRON), exist_ok=True)
@@ -28,44 +35,126 @@ os.makedirs(os.path.join(OUTPUT_FOLDER, SUBFOLDE_BENCHMARK_MODEL_LOADING), exist
 os.makedirs(os.path.join(OUTPUT_FOLDER, SUBFOLDE_LLAMA), exist_ok=True)
 
 # Generate the mapping dictionary using both the mapping file and exceptions
-with open(mapping_file, "r") as f:
-    for line in f:
-        # Remove leading/trailing whitespace and split by '|'
-        parts = [p.strip() for p in line.strip().split("|")]
-        if len(parts) == 5:
-            _, _, key, value, _ = parts
-            mapping[key] = value
+mapping = read_mapping(mapping_file)
 print("\n----> The number of mappings:", len(mapping))
 
 #for k, v in mapping.items():
 #    print(k, "=>", v)
 
-def convert_file(source, destinaion, subfolder, mapping):
+# Hardlink when on the same filesystem, then reflink, then copy_file_range in the kernel, and last a plain copy
+# The downloads replace the files (new inode) rather than rewrite them, so a hardlink never sees a later change
+def link_or_copy(source, destination):
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        pass
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            method = "reflink"
+        except OSError:
+            method = "copy_file_range"
+            try:
+                size = os.fstat(src.fileno()).st_size
+                offset = 0
+                while offset < size:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), size - offset, offset, offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+            except (AttributeError, OSError) as e: # Not Linux, or not supported between these filesystems
+                if isinstance(e, OSError) and e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+                shutil.copyfileobj(src, dst)
+                method = "copy"
+    shutil.copystat(source, destination)
+    return method
+
+# Returns True if {destination} was (re)created, False if unchanged since the last run
+def convert_one(source, destination, old_manifest, manifest, counts):
+    stat = os.stat(source)
+    entry = old_manifest.get(source)
+    if entry and entry['output'] == destination and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns and os.path.exists(destination):
+        manifest[source] = entry
+        counts['unchanged'] += 1
+        return False
+    method = link_or_copy(source, destination)
+    manifest[source] = {"output": destination, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "method": method}
+    counts[method] = counts.get(method, 0) + 1
+    return True
+
+# Returns the lines to print, printed once the subfolder is done as the subfolders are converted in parallel
+def convert_file(source, destinaion, subfolder, mapping, old_manifest, manifest, counts):
     source_path = os.path.join(source, subfolder)
     destination_path = os.path.join(destinaion, subfolder)
+    lines = []
 
-    log_files = [f for f in os.listdir(source_path) if f.endswith(".log")]
+    log_files = [f for f in os.listdir(source_path) if is_log(f)] if os.path.isdir(source_path) else []
     for log_file in log_files:
-        base_name = log_file[:-4]  # Extract the base name without ".log"
+        base_name, suffix = split_log_name(log_file)  # The base name without ".log", ".log.zst" or ".log.gz"
         if base_name in mapping:
-            print(f"{log_file} → Found in mapping: {mapping[base_name]}", end="")
+            line = f"{log_file} → Found in mapping: {mapping[base_name]}"
 
             if mapping[base_name] in removed_values:
-                print(f", which is in the removed values. Skipping...")
+                line += ", which is in the removed values. Skipping..."
             else:
-                converted_log_file = os.path.join(destination_path, mapping[base_name] + ".log")
-                shutil.copyfile(os.path.join(source_path, log_file), converted_log_file)
-                print()
+                converted_log_file = os.path.join(destination_path, mapping[base_name] + suffix) # Compressed as it was uploaded
+                if not convert_one(os.path.join(source_path, log_file), converted_log_file, old_manifest, manifest, counts):
+                    line += ", unchanged"
+                if os.path.exists(telemetry_path(os.path.join(source_path, log_file))): # The GPU telemetry, if any
+                    convert_one(telemetry_path(os.path.join(source_path, log_file)), telemetry_path(converted_log_file), old_manifest, manifest, counts)
+                source_segments = segments_path(os.path.join(source_path, log_file))
+                if os.path.isdir(source_segments): # The log segments, if any, append-only so mostly unchanged
+                    converted_segments = segments_path(converted_log_file)
+                    os.makedirs(converted_segments, exist_ok=True)
+                    for segment in sorted(os.listdir(source_segments)):
+                        convert_one(os.path.join(source_segments, segment), os.path.join(converted_segments, segment), old_manifest, manifest, counts)
+            lines.append(line)
         else:
-            print(f"{log_file} → NOT found in mapping. Skipping...")
-
-
-print("\n----> Convert the megatron log files...")
-convert_file(FOLDER, OUTPUT_FOLDER, SUBFOLDE_MEGATRON, mapping)
-
-print("\n----> Convert the model loading log files...")
-convert_file(FOLDER, OUTPUT_FOLDER, SUBFOLDE_BENCHMARK_MODEL_LOADING, mapping)
-
-print("\n----> Convert the llama log files...")
-convert_file(FOLDER, OUTPUT_FOLDER, SUBFOLDE_LLAMA, mapping)
-
+            lines.append(f"{log_file} → NOT found in mapping. Skipping...")
+    return lines
+
+
+# Later runs only link or copy the files changed (size, mtime) since the manifest was written
+manifest_path = os.path.join(OUTPUT_FOLDER, MANIFEST_FILE)
+old_manifest = {}
+if os.path.exists(manifest_path):
+    with open(manifest_path) as f:
+        old_manifest = json.load(f)
+
+subfolders = [("megatron", SUBFOLDE_MEGATRON), ("model loading", SUBFOLDE_BENCHMARK_MODEL_LOADING), ("llama", SUBFOLDE_LLAMA)]
+manifests = {subfolder: {} for _, subfolder in subfolders}
+counts = {subfolder: {"unchanged": 0} for _, subfolder in subfolders}
+with ThreadPoolExecutor(max_workers=len(subfolders)) as pool:
+    futures = {subfolder: pool.submit(convert_file, FOLDER, OUTPUT_FOLDER, subfolder, mapping, old_manifest, manifests[subfolder], counts[subfolder])
+               for _, subfolder in subfolders}
+    for name, subfolder in subfolders:
+        print(f"\n----> Convert the {name} log files...")
+        for line in futures[subfolder].result():
+            print(line)
+
+# Remove the outputs of the sources deleted (or no longer mapped) since the last run
+manifest = {}
+for subfolder_manifest in manifests.values():
+    manifest.update(subfolder_manifest)
+outputs = {entry['output'] for entry in manifest.values()}
+for source, entry in old_manifest.items():
+    if source not in manifest and entry['output'] not in outputs and os.path.exists(entry['output']):
+        os.remove(entry['output'])
+
+with open(manifest_path + ".tmp", "w") as f:
+    json.dump(manifest, f, indent=2)
+os.replace(manifest_path + ".tmp", manifest_path)
+
+total = {}
+for subfolder_counts in counts.values():
+    for method, count in subfolder_counts.items():
+        total[method] = total.get(method, 0) + count
+print(f"\n----> Files: {', '.join(f'{method}: {count}' for method, count in sorted(total.items()))}, Manifest: {manifest_path}")
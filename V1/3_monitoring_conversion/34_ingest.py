@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from log_utils import SUBFOLDERS, read_header, read_mapping, open_log, list_logs, split_log_name
+from log_parser import Parse_Megatron_Lines, Summarize_Training, ITERATION_COLUMNS
+
+# Fleet results store: the RESULT headers of every node, across the test runs, in one indexed SQLite file
+# A test run is a local folder downloaded by 31_download.py, e.g. test20251213 (or test20251213_converted)
+#   python3 34_ingest.py                      ingest {FOLDER}
+#   python3 34_ingest.py test20251213 ...     ingest the given folders
+#   python3 34_ingest.py query "SELECT ..."   run a query against the store
+# Only the files added or changed (size, mtime) since the last ingestion, or that failed, are parsed again
+FOLDER = os.getenv("FOLDER")
+FLEET_DB = os.getenv("FLEET_DB", "fleet.db")
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", "2")) # Excluded from the steady-state training metrics
+
+mapping_file = "mapping.txt"
+
+# RESULT key -> (column, SQL type), the metrics filtered, grouped and aggregated across the fleet
+RESULT_COLUMNS = {
+    "type":                     ("type", "TEXT"),
+    "state":                    ("state", "TEXT"),
+    "online utc":               ("online_utc", "TEXT"),
+    "duration_s":               ("duration_s", "REAL"),
+    "data size_GB":             ("data_size_gb", "REAL"),
+    "transferred size_GB":      ("transferred_size_gb", "REAL"),
+    "dl_throughput_Gbps":       ("dl_throughput_gbps", "REAL"),
+    "disk read_GBps":           ("disk_read_gbps", "REAL"),
+    "startup time_s":           ("startup_time_s", "REAL"),
+    "running time_s":           ("running_time_s", "REAL"),
+    "inference number":         ("inference_number", "INTEGER"),
+    "generated token number":   ("generated_token_number", "INTEGER"),
+    "output tokens per second": ("output_tokens_per_second", "REAL"),
+    "ttft_s mean":              ("ttft_s_mean", "REAL"),
+    "itl_ms mean":              ("itl_ms_mean", "REAL"),
+    "goodput_rps":              ("goodput_rps", "REAL"),
+    "message":                  ("message", "TEXT"),
+}
+# Summarize_Training() key -> column, for the training logs
+TRAINING_COLUMNS = {
+    "iterations":       "iterations",
+    "tflops per gpu":   "tflops_per_gpu",
+    "elapsed_ms mean":  "iteration_ms_mean",
+    "elapsed_ms stdev": "iteration_ms_stdev",
+    "max reserved_mb":  "max_reserved_mb",
+}
+ITERATION_FIELDS = {name: name.replace(" ", "_") for name in ITERATION_COLUMNS}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    path TEXT PRIMARY KEY,
+    folder TEXT,
+    subfolder TEXT,
+    node TEXT,
+    {", ".join(f"{column} {kind}" for column, kind in RESULT_COLUMNS.values())},
+    {", ".join(f"{column} REAL" for column in TRAINING_COLUMNS.values())},
+    header TEXT
+);
+CREATE INDEX IF NOT EXISTS records_folder ON records (folder, type);
+CREATE INDEX IF NOT EXISTS records_node ON records (node);
+CREATE INDEX IF NOT EXISTS records_type ON records (type, state);
+CREATE TABLE IF NOT EXISTS iterations (
+    path TEXT,
+    iteration INTEGER,
+    timestamp TEXT,
+    {", ".join(f"{column} REAL" for column in ITERATION_FIELDS.values())},
+    PRIMARY KEY (path, iteration)
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    node_id TEXT
+);
+CREATE INDEX IF NOT EXISTS nodes_node_id ON nodes (node_id);
+"""
+# Created again on every open, since "records.*" is expanded when the view is created
+VIEWS = """
+DROP VIEW IF EXISTS results;
+CREATE VIEW results AS
+    SELECT records.*, COALESCE(nodes.node_id, records.node) AS node_id
+    FROM records LEFT JOIN nodes ON nodes.node = records.node;
+"""
+
+def open_store(db_path=FLEET_DB):
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    # The columns added since the store was created, empty for the files ingested before
+    existing = {row[1] for row in connection.execute("PRAGMA table_info(records)")}
+    for column, kind in RESULT_COLUMNS.values():
+        if column not in existing:
+            connection.execute(f"ALTER TABLE records ADD COLUMN {column} {kind}")
+    connection.executescript(VIEWS)
+    return connection
+
+# The stable node IDs, so a node can be followed across runs, whatever its worker name
+def ingest_mapping(connection, mapping_file):
+    if not os.path.exists(mapping_file):
+        return 0
+    mapping = read_mapping(mapping_file)
+    connection.executemany("INSERT OR REPLACE INTO nodes (node, node_id) VALUES (?, ?)", mapping.items())
+    return len(mapping)
+
+def ingest_file(connection, folder, subfolder, log_path):
+    data = read_header(log_path)
+    row = {"path": log_path, "folder": os.path.basename(folder), "subfolder": subfolder,
+           "node": data.get('node name', split_log_name(os.path.basename(log_path))[0]), "header": json.dumps(data)}
+    for key, (column, _) in RESULT_COLUMNS.items():
+        row[column] = data.get(key)
+
+    connection.execute("DELETE FROM iterations WHERE path = ?", (log_path,))
+    if data.get('type') == "training":
+        with open_log(log_path, text=True) as f:
+            parser = Parse_Megatron_Lines(f)
+        if len(parser) > 0:
+            summary = Summarize_Training(parser, WARMUP_ITERATIONS)
+            for key, column in TRAINING_COLUMNS.items():
+                row[column] = summary[key]
+            columns = parser.columns
+            names = ["iteration", "timestamp"] + list(ITERATION_FIELDS)
+            connection.executemany(
+                f"INSERT OR REPLACE INTO iterations (path, {', '.join(['iteration', 'timestamp'] + list(ITERATION_FIELDS.values()))}) "
+                f"VALUES ({', '.join('?' * (len(names) + 1))})",
+                [[log_path] + [columns[name][i] for name in names] for i in range(len(parser))])
+
+    connection.execute(f"INSERT OR REPLACE INTO records ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+
+# Returns (parsed, unchanged, failed, removed) file counts
+def ingest_folder(connection, folder):
+    folder = os.path.normpath(folder)
+    prefix = os.path.join(folder, "")
+    # A file that failed is tried again, even unchanged
+    known = {path: (size, mtime_ns, error is None) for path, size, mtime_ns, error in
+             connection.execute("SELECT path, size, mtime_ns, error FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+    parsed = unchanged = failed = 0
+    for subfolder in SUBFOLDERS:
+        for log_path in list_logs(os.path.join(folder, subfolder)):
+            stat = os.stat(log_path)
+            if known.pop(log_path, None) == (stat.st_size, stat.st_mtime_ns, True):
+                unchanged += 1
+                continue
+            error = None
+            # Each file in a savepoint, so a failure keeps its previous records and iterations whole
+            connection.execute("SAVEPOINT ingest_file")
+            try:
+                ingest_file(connection, folder, subfolder, log_path)
+                connection.execute("RELEASE SAVEPOINT ingest_file")
+                parsed += 1
+            except (ValueError, OSError) as e: # e.g. a header being rewritten during the download
+                connection.execute("ROLLBACK TO SAVEPOINT ingest_file")
+                connection.execute("RELEASE SAVEPOINT ingest_file")
+                print(f"Attention: {log_path} not ingested. The error message: {e}", flush=True)
+                error = str(e)
+                failed += 1
+            connection.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, error) VALUES (?, ?, ?, ?)",
+                               (log_path, stat.st_size, stat.st_mtime_ns, error))
+    # The files deleted since the last ingestion
+    for log_path in known:
+        for table in ("files", "records", "iterations"):
+            connection.execute(f"DELETE FROM {table} WHERE path = ?", (log_path,))
+    return parsed, unchanged, failed, len(known)
+
+def print_rows(cursor):
+    columns = [description[0] for description in cursor.description]
+    print(" | ".join(columns))
+    for row in cursor:
+        print(" | ".join("" if value is None else str(value) for value in row))
+
+if __name__ == "__main__":
+    connection = open_store()
+
+    if len(sys.argv) > 2 and sys.argv[1] == "query":
+        start_time = time.time()
+        print_rows(connection.execute(sys.argv[2]))
+        print(f"\n----> Query time: {time.time() - start_time:.3f} seconds")
+        sys.exit(0)
+
+    folders = sys.argv[1:] or [FOLDER]
+    start_time = time.time()
+    with connection: # One transaction
+        print(f"\n----> The number of mappings: {ingest_mapping(connection, mapping_file)}")
+        for folder in folders:
+            parsed, unchanged, failed, removed = ingest_folder(connection, folder)
+            print(f"----> {folder}: Parsed: {parsed}, Unchanged: {unchanged}, Failed: {failed}, Removed: {removed}")
+    print(f"----> Ingestion time: {time.time() - start_time:.3f} seconds, Store: {FLEET_DB}")
+
+    print("\n----> Summary by test run and type...")
+    print_rows(connection.execute("""
+        SELECT folder, type, COUNT(*) AS nodes,
+               SUM(state = 'success' OR state = 'running') AS healthy,
+               ROUND(AVG(duration_s), 3) AS duration_s,
+               ROUND(AVG(dl_throughput_gbps), 3) AS dl_throughput_gbps,
+               ROUND(AVG(tflops_per_gpu), 1) AS tflops_per_gpu,
+               ROUND(AVG(output_tokens_per_second), 2) AS output_tokens_per_second
+        FROM results GROUP BY folder, type ORDER BY folder, type"""))
+    connection.close()
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from helper import Get_S3_Client, List_Cloud_Objects
+from log_utils import HEADER_BLOCK_SIZE, MAX_HEADER_BYTES, read_header, parse_header_bytes, is_log, split_log_name
+
+# Live monitor of the test: a state machine per node and per kind of test, updated from the changed log files only
+#   python3 35_monitor.py                    watch the local folder {FOLDER}, e.g. kept up to date by 31_download.py --watch
+#   python3 35_monitor.py --s3               watch ds:{BUCKET}/{FOLDER} directly
+#   python3 35_monitor.py --once             a single report
+#   python3 35_monitor.py --interval 30      seconds between the polls
+BUCKET = os.getenv("BUCKET")
+FOLDER = os.getenv("FOLDER")
+
+MONITOR_INTERVAL_S = int(os.getenv("MONITOR_INTERVAL_S", "60"))
+STUCK_THRESHOLD_S  = int(os.getenv("STUCK_THRESHOLD_S", "1800")) # In a transient state (pending, running training, restarted) for longer
+SILENT_THRESHOLD_S = int(os.getenv("SILENT_THRESHOLD_S", "600"))  # A running inference node reports every 120 seconds
+
+# Subfolder -> kind of test, the same as RESULT['type']
+KINDS = {"megatron": "training", "benchmark/model_loading": "model_loading", "llama": "inference"}
+STATES = ["pending", "running", "restarted", "success", "failure"]
+
+# The state of every node, and the time spent in each state (phase)
+# Each update is O(1), and the counts per state are kept up to date, so the cost of a poll is the number of changed files
+class State_Tracker:
+    def __init__(self, stuck_threshold_s=STUCK_THRESHOLD_S, silent_threshold_s=SILENT_THRESHOLD_S):
+        self.stuck_threshold_s = stuck_threshold_s
+        self.silent_threshold_s = silent_threshold_s
+        self.nodes = {}   # (kind, node) -> {"state", "since", "updated", "message"}
+        self.counts = {}  # kind -> {state: number of nodes}
+        self.phases = {}  # (kind, state) -> [seconds], the completed phases
+        self.active = set() # The nodes in a transient state, checked for being stuck
+
+    @staticmethod
+    def is_final(kind, state):
+        return state in ("success", "failure") or (kind == "inference" and state == "running")
+
+    def _count(self, kind, state, delta):
+        counts = self.counts.setdefault(kind, {})
+        counts[state] = counts.get(state, 0) + delta
+
+    # Returns the transition (old state, new state, seconds in the old state), old state None for a new node, or None
+    def update(self, kind, node, header, now):
+        state = header.get('state', "unknown")
+        entry = self.nodes.get((kind, node))
+        if entry is not None:
+            entry['updated'] = now
+            if entry['state'] == state:
+                return None
+            old_state = entry['state']
+            duration = now - entry['since']
+            self.phases.setdefault((kind, old_state), []).append(duration)
+            self._count(kind, old_state, -1)
+        else:
+            old_state = None
+            duration = 0.0
+            entry = {"since": now, "updated": now}
+            if state == "pending" and header.get('online utc'): # The container start time
+                online = datetime.strptime(header['online utc'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=ZoneInfo("UTC")).timestamp()
+                entry['since'] = min(online, now)
+            self.nodes[(kind, node)] = entry
+        entry.update(state=state, message=header.get('message', ""))
+        if old_state is not None:
+            entry['since'] = now
+        self._count(kind, state, 1)
+        if self.is_final(kind, state):
+            self.active.discard((kind, node))
+        else:
+            self.active.add((kind, node))
+        return (old_state, state, duration)
+
+    def remove(self, kind, node):
+        entry = self.nodes.pop((kind, node), None)
+        if entry is not None:
+            self._count(kind, entry['state'], -1)
+            self.active.discard((kind, node))
+
+    # [(kind, node, state, seconds)], the nodes in a transient state for longer than the threshold
+    def stuck(self, now):
+        stuck = []
+        for kind, node in self.active:
+            entry = self.nodes[(kind, node)]
+            if now - entry['since'] > self.stuck_threshold_s:
+                stuck.append((kind, node, entry['state'], now - entry['since']))
+        return sorted(stuck, key=lambda item: -item[3])
+
+    # [(node, seconds)], the running inference nodes which stopped reporting
+    def silent(self, now):
+        silent = []
+        for (kind, node), entry in self.nodes.items():
+            if kind == "inference" and entry['state'] == "running" and now - entry['updated'] > self.silent_threshold_s:
+                silent.append((node, now - entry['updated']))
+        return sorted(silent, key=lambda item: -item[1])
+
+    # {kind: {state: {"nodes", "mean_s", "max_s"}}}, the time spent so far in the current state
+    def current(self, now):
+        summary = {}
+        for (kind, node), entry in self.nodes.items():
+            stats = summary.setdefault(kind, {}).setdefault(entry['state'], {"nodes": 0, "total_s": 0.0, "max_s": 0.0})
+            stats['nodes'] += 1
+            stats['total_s'] += now - entry['since']
+            stats['max_s'] = max(stats['max_s'], now - entry['since'])
+        for states in summary.values():
+            for stats in states.values():
+                stats['mean_s'] = stats.pop('total_s') / stats['nodes']
+        return summary
+
+# The node logs in a local folder; a file is read again only when its size or mtime changes
+class Local_Source:
+    def __init__(self, folder):
+        self.folder = folder
+        self.known = {} # path -> (size, mtime_ns)
+
+    # Returns ([(kind, node, header or None, error)], [(kind, node)] removed)
+    def poll(self):
+        changed = []
+        seen = set()
+        for subfolder, kind in KINDS.items():
+            path = os.path.join(self.folder, subfolder)
+            if not os.path.isdir(path):
+                continue
+            for entry in os.scandir(path):
+                if not is_log(entry.name) or not entry.is_file():
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                if self.known.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                try:
+                    changed.append((kind, split_log_name(entry.name)[0], read_header(entry.path), None))
+                    self.known[entry.path] = (stat.st_size, stat.st_mtime_ns) # Read again on the next poll if it failed
+                except (ValueError, OSError) as e: # e.g. being rewritten
+                    changed.append((kind, split_log_name(entry.name)[0], None, str(e)))
+        removed = []
+        for path in set(self.known) - seen:
+            del self.known[path]
+            subfolder, log_file = os.path.split(os.path.relpath(path, self.folder))
+            removed.append((KINDS[subfolder], split_log_name(log_file)[0]))
+        return changed, removed
+
+# The node logs in the bucket; the folder is listed once per poll, and only the headers of the changed objects are
+# fetched, with ranged GETs running in parallel
+class S3_Source:
+    def __init__(self, bucket, folder, concurrency=16):
+        self.bucket = bucket
+        self.folder = folder.strip("/")
+        self.concurrency = concurrency
+        self.known = {} # key -> etag
+
+    def _fetch_header(self, key, size):
+        client = Get_S3_Client()
+        end = min(size, HEADER_BLOCK_SIZE)
+        while True:
+            data = client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{end - 1}")['Body'].read() if end > 0 else b""
+            header = parse_header_bytes(data, complete=end >= size)
+            if header is not None:
+                return header
+            if end >= MAX_HEADER_BYTES:
+                raise ValueError(f"No end of header in the first {MAX_HEADER_BYTES} bytes")
+            end = min(size, end * 4)
+
+    def _read(self, kind, node, item):
+        try:
+            return kind, node, self._fetch_header(item['key'], item['size']), None
+        except (ValueError, BotoCoreError, ClientError) as e:
+            return kind, node, None, str(e)
+
+    def poll(self):
+        targets = []
+        seen = set()
+        for item in List_Cloud_Objects(self.bucket, self.folder):
+            subfolder, log_file = os.path.split(item['key'][len(self.folder) + 1:])
+            if subfolder not in KINDS or not is_log(log_file): # e.g. the log segments
+                continue
+            seen.add(item['key'])
+            if self.known.get(item['key']) == item['etag']:
+                continue
+            targets.append((KINDS[subfolder], split_log_name(log_file)[0], item))
+        changed = []
+        if targets:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                changed = list(pool.map(lambda target: self._read(*target), targets))
+        for (_, _, item), (_, _, header, _) in zip(targets, changed):
+            if header is not None: # Fetched again on the next poll if it failed
+                self.known[item['key']] = item['etag']
+        removed = []
+        for key in set(self.known) - seen:
+            del self.known[key]
+            subfolder, log_file = os.path.split(key[len(self.folder) + 1:])
+            removed.append((KINDS[subfolder], split_log_name(log_file)[0]))
+        return changed, removed
+
+def report(tracker, now):
+    current = tracker.current(now)
+    for kind in KINDS.values():
+        if not tracker.counts.get(kind):
+            continue
+        states = []
+        for state, count in sorted(tracker.counts[kind].items(), key=lambda item: STATES.index(item[0]) if item[0] in STATES else len(STATES)):
+            if count == 0:
+                continue
+            stats = current[kind][state]
+            states.append(f"{state}: {count} (mean {stats['mean_s']:.0f} s, max {stats['max_s']:.0f} s)")
+        print(f"{kind}: Nodes: {sum(tracker.counts[kind].values())}, {', '.join(states)}")
+        phases = [f"{state}: mean {sum(durations) / len(durations):.0f} s, max {max(durations):.0f} s ({len(durations)} nodes)"
+                  for (phase_kind, state), durations in sorted(tracker.phases.items()) if phase_kind == kind]
+        if phases:
+            print(f"{kind} phases: {', '.join(phases)}")
+    for kind, node, state, duration_s in tracker.stuck(now):
+        print(f"Attention: {node}, {kind} {state} for {duration_s:.0f} seconds")
+    for node, duration_s in tracker.silent(now):
+        print(f"Attention: {node}, inference running, no update for {duration_s:.0f} seconds")
+
+
+if __name__ == "__main__":
+    interval_s = int(sys.argv[sys.argv.index("--interval") + 1]) if "--interval" in sys.argv else MONITOR_INTERVAL_S
+    if "--s3" in sys.argv:
+        source = S3_Source(BUCKET, FOLDER)
+        print(f"\n----> Monitor ds:{BUCKET}/{FOLDER}", flush=True)
+    else:
+        source = Local_Source(FOLDER)
+        print(f"\n----> Monitor {FOLDER}", flush=True)
+
+    tracker = State_Tracker()
+    try:
+        while True:
+            start_time = time.time()
+            print(f"\n----> {datetime.now(ZoneInfo('UTC')).strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
+            try:
+                changed, removed = source.poll()
+            except (BotoCoreError, ClientError) as e: # Retried on the next poll
+                print(f"The error message: {e}", flush=True)
+                changed, removed = [], []
+            now = time.time()
+            for kind, node, header, error in changed:
+                if header is None:
+                    print(f"Attention: {node}, {kind} log not readable. The error message: {error}")
+                    continue
+                transition = tracker.update(kind, node, header, now)
+                if transition is not None:
+                    old_state, state, duration_s = transition
+                    if old_state is None:
+                        print(f"Node: {node}, {kind}: {state}")
+                    else:
+                        print(f"Node: {node}, {kind}: {old_state} -> {state} after {duration_s:.0f} seconds")
+                    if state == "failure" or state == "restarted":
+                        print(f"Attention: {node}, {kind} {state}: {header.get('message', '')}")
+            for kind, node in removed:
+                tracker.remove(kind, node)
+            report(tracker, now)
+            if "--once" in sys.argv:
+                break
+            time.sleep(max(interval_s - (time.time() - start_time), 0))
+    except KeyboardInterrupt:
+        print("\nStopped monitoring")
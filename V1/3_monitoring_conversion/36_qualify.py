@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from log_utils import SUBFOLDERS, scan_headers, telemetry_path, list_logs, open_log, split_log_name
+from log_parser import Parse_Megatron_Lines, Summarize_Training
+from gpu_telemetry import Parse_Rocm_Smi, Parse_Product_Info
+
+# Node qualification: the stragglers and the outliers among the nodes of the same GPU model, for every benchmark metric,
+# with robust statistics (median and MAD), and a pass/fail list written to {FOLDER}/qualification.json to drain the bad nodes
+#   python3 36_qualify.py
+FOLDER = os.getenv("FOLDER")
+
+OUTLIER_THRESHOLD  = float(os.getenv("OUTLIER_THRESHOLD", "3.5"))  # Modified z-score, |0.6745 * (x - median) / MAD|
+MIN_RELATIVE_MAD   = float(os.getenv("MIN_RELATIVE_MAD", "0.01"))  # MAD floor as a fraction of the median, for near-identical nodes
+MIN_SAMPLES        = 3  # Nodes (or GPUs) of a GPU model needed for the statistics
+WARMUP_ITERATIONS  = int(os.getenv("WARMUP_ITERATIONS", "2"))
+
+QUALIFICATION_FILE = "qualification.json"
+
+# Metric -> (subfolder, direction): "low" flags the values below the band, "high" those above, "both" either side
+NODE_METRICS = {
+    "dl_throughput_Gbps":       ("benchmark/model_loading", "low"),
+    "disk read_GBps":           ("benchmark/model_loading", "low"),   # The local NVMe, after the download
+    "training duration_s":      ("megatron", "high"),
+    "tflops per gpu":           ("megatron", "low"),  # The median of the steady iterations
+    "startup time_s":           ("llama", "high"),
+    "output tokens per second": ("llama", "low"),
+    "goodput_rps":              ("llama", "low"),  # Within the latency SLOs, with the goodput search
+}
+GPU_METRICS = {
+    "power_w": "both",
+    "temp_c":  "high",
+}
+
+# Vectorized modified z-scores; returns (z, outlier mask, median, mad)
+def robust_outliers(values, direction, threshold=OUTLIER_THRESHOLD):
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    mad = max(mad, MIN_RELATIVE_MAD * abs(median), 1e-12)
+    z = 0.6745 * (values - median) / mad
+    if direction == "low":
+        mask = z < -threshold
+    elif direction == "high":
+        mask = z > threshold
+    else:
+        mask = np.abs(z) > threshold
+    return z, mask, float(median), float(mad)
+
+# The values of the node metrics {metric: {node: value}}, the per-GPU values {(kind, metric): {(node, gpu): value}},
+# the GPU model of each node, and the nodes which did not complete a test
+def collect(folder):
+    node_values = {metric: {} for metric in NODE_METRICS}
+    gpu_values = {}
+    models = {}
+    failed = {}
+    log_paths = {subfolder: [] for subfolder in SUBFOLDERS}
+    for subfolder in SUBFOLDERS:
+        log_paths[subfolder] = list_logs(os.path.join(folder, subfolder))
+    headers = scan_headers([log_path for paths in log_paths.values() for log_path in paths])
+
+    for subfolder, paths in log_paths.items():
+        for log_path in paths:
+            node = split_log_name(os.path.basename(log_path))[0]
+            data, error = headers[log_path]
+            if data is None:
+                failed.setdefault(node, []).append({"metric": f"{subfolder} header", "message": error})
+                continue
+            if data.get('state') not in ("success", "running"):
+                failed.setdefault(node, []).append({"metric": f"{subfolder} state", "value": data.get('state'), "message": data.get('message', "")})
+                continue
+
+            if subfolder == "benchmark/model_loading":
+                node_values['dl_throughput_Gbps'][node] = data.get('dl_throughput_Gbps')
+                node_values['disk read_GBps'][node] = data.get('disk read_GBps') or None # 0 without the warm-up
+                continue
+            if subfolder == "llama":
+                node_values['startup time_s'][node] = data.get('startup time_s')
+                tokens_per_second = data.get('output tokens per second')
+                if tokens_per_second is None and data.get('running time_s', 0) - data.get('startup time_s', 0) > 0: # Before the streaming load generator
+                    tokens_per_second = data.get('generated token number', 0) / (data['running time_s'] - data['startup time_s'])
+                node_values['output tokens per second'][node] = tokens_per_second
+                node_values['goodput_rps'][node] = data.get('goodput_rps') or None # 0 without the search
+
+            with open_log(log_path, text=True) as f:
+                text = f.read()
+            if subfolder == "megatron":
+                node_values['training duration_s'][node] = data.get('duration_s')
+                parser = Parse_Megatron_Lines(text.splitlines())
+                steady = [tflops for iteration, tflops in zip(parser.columns['iteration'], parser.columns['tflops per gpu'])
+                          if iteration > WARMUP_ITERATIONS and tflops is not None]
+                if steady:
+                    node_values['tflops per gpu'][node] = float(np.median(steady))
+                elif len(parser) > 0:
+                    node_values['tflops per gpu'][node] = Summarize_Training(parser, WARMUP_ITERATIONS)['tflops per gpu']
+
+            products = Parse_Product_Info(text)
+            if products and node not in models:
+                models[node] = products[min(products)].get('Card Model', "unknown")
+
+            # Per GPU: the mean over the telemetry series if any, otherwise the rocm-smi snapshot in the log
+            kind = data.get('type', subfolder)
+            per_gpu = {}
+            if os.path.exists(telemetry_path(log_path)):
+                with open(telemetry_path(log_path)) as f:
+                    series = json.load(f)['series']
+                for metric in GPU_METRICS:
+                    samples = np.array([[np.nan if value is None else value for value in sample] for sample in series.get(metric, [])], dtype=np.float64)
+                    if samples.size:
+                        per_gpu[metric] = {gpu: value for gpu, value in enumerate(np.nanmean(samples, axis=0).tolist()) if not np.isnan(value)}
+            else:
+                rows = Parse_Rocm_Smi(text)
+                for metric in GPU_METRICS:
+                    per_gpu[metric] = {row['device']: row[metric] for row in rows if row[metric] is not None}
+            for metric, values in per_gpu.items():
+                for gpu, value in values.items():
+                    gpu_values.setdefault((kind, metric), {})[(node, gpu)] = value
+    return node_values, gpu_values, models, failed
+
+def qualify(folder):
+    node_values, gpu_values, models, failed = collect(folder)
+    all_nodes = set(failed) | {node for values in node_values.values() for node in values} | {node for values in gpu_values.values() for node, _ in values}
+    nodes = {node: {"pass": True, "gpu model": models.get(node, "unknown"), "failures": list(failed.get(node, []))} for node in sorted(all_nodes)}
+
+    statistics = {}
+    # Node metrics, within each GPU model
+    for metric, values in node_values.items():
+        direction = NODE_METRICS[metric][1]
+        for model in sorted(set(models.get(node, "unknown") for node in values)):
+            group = [(node, value) for node, value in values.items() if value is not None and models.get(node, "unknown") == model]
+            if len(group) < MIN_SAMPLES:
+                continue
+            z, mask, median, mad = robust_outliers([value for _, value in group], direction)
+            statistics.setdefault(model, {})[metric] = {"nodes": len(group), "median": round(median, 3), "mad": round(mad, 3)}
+            for index in np.flatnonzero(mask):
+                node, value = group[index]
+                nodes[node]['failures'].append({"metric": metric, "value": round(value, 3), "median": round(median, 3), "z": round(float(z[index]), 2)})
+
+    # Per-GPU metrics, across all GPUs of the same model in the same kind of test
+    for (kind, metric), values in gpu_values.items():
+        direction = GPU_METRICS[metric]
+        for model in sorted(set(models.get(node, "unknown") for node, _ in values)):
+            group = [(key, value) for key, value in values.items() if models.get(key[0], "unknown") == model]
+            if len(group) < MIN_SAMPLES:
+                continue
+            z, mask, median, mad = robust_outliers([value for _, value in group], direction)
+            statistics.setdefault(model, {})[f"{kind} gpu {metric}"] = {"gpus": len(group), "median": round(median, 3), "mad": round(mad, 3)}
+            for index in np.flatnonzero(mask):
+                (node, gpu), value = group[index]
+                nodes[node]['failures'].append({"metric": f"{kind} gpu {metric}", "gpu": gpu, "value": round(value, 3), "median": round(median, 3), "z": round(float(z[index]), 2)})
+
+    for result in nodes.values():
+        result['pass'] = len(result['failures']) == 0
+    return {
+        "folder": folder,
+        "threshold": OUTLIER_THRESHOLD,
+        "passed": sorted(node for node, result in nodes.items() if result['pass']),
+        "failed": sorted(node for node, result in nodes.items() if not result['pass']),
+        "nodes": nodes,
+        "statistics": statistics,
+    }
+
+
+if __name__ == "__main__":
+    result = qualify(FOLDER)
+    for model, metrics in result['statistics'].items():
+        print(f"\n----> GPU model {model}")
+        for metric, stats in metrics.items():
+            print(f"{metric}: median {stats['median']}, MAD {stats['mad']}, {stats.get('nodes', stats.get('gpus'))} {'nodes' if 'nodes' in stats else 'GPUs'}")
+
+    print(f"\n----> Passed: {len(result['passed'])}, Failed: {len(result['failed'])}")
+    for node in result['failed']:
+        for failure in result['nodes'][node]['failures']:
+            gpu = f" GPU {failure['gpu']}" if 'gpu' in failure else ""
+            detail = f"{failure.get('value')} (median {failure['median']}, z {failure['z']})" if 'z' in failure else f"{failure.get('value', '')} {failure.get('message', '')}"
+            print(f"Attention: {node}{gpu}, {failure['metric']}: {detail}")
+
+    output_file = os.path.join(FOLDER, QUALIFICATION_FILE)
+    with open(output_file, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n----> Saved to {output_file}")
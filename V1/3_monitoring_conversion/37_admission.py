@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from helper import Get_S3_Client, List_Cloud_Objects, READ_BLOCK_SIZE
+from admission import Admission_Controller, Admission_Coordinator, Request_Admission, Report_Done
+
+# Fleet-wide admission coordinator for the model loading, started on the Test Worker before the test workload
+# The nodes wait for it with ADMISSION '1' in the model loading container (see admission.py)
+#   python3 37_admission.py                  coordinate ds:{BUCKET}/{FOLDER}
+#   python3 37_admission.py --simulate 24    simulated nodes against the bucket, e.g. a local S3 stand-in (AWS_ENDPOINT_URL)
+BUCKET = os.getenv("BUCKET")
+FOLDER = os.getenv("FOLDER")
+MODEL_FOLDER = os.getenv("MODEL_FOLDER", "models--meta-llama--Llama-3.1-8B-Instruct")
+
+POLL_INTERVAL_S  = float(os.getenv("ADMISSION_POLL_S", "5"))
+LEASE_S          = int(os.getenv("ADMISSION_LEASE_S", "1800"))
+BANDWIDTH_Gbps   = float(os.getenv("ADMISSION_BANDWIDTH_Gbps", "0"))  # 0: measured from the Test Worker at the start
+NODE_RATE_Gbps   = float(os.getenv("ADMISSION_NODE_RATE_Gbps", "10")) # The expected throughput of a single node
+MODEL_SIZE_GB    = float(os.getenv("ADMISSION_MODEL_SIZE_GB", "16"))  # Updated from the sizes reported by the nodes
+PROBE_SECONDS    = 10
+PROBE_CONCURRENCY = 32
+
+# The aggregate download bandwidth from the model folder, with ranged GETs in parallel for a few seconds
+# Bound by the network of the Test Worker, so a lower bound of the bucket bandwidth, raised later by the node reports
+def measure_bandwidth(bucket, key, seconds=PROBE_SECONDS, concurrency=PROBE_CONCURRENCY):
+    objects = [item for item in List_Cloud_Objects(bucket, key) if item['size'] > 0]
+    if not objects:
+        return 0.0
+    client = Get_S3_Client()
+    part_size = 16 * 1024 * 1024
+    parts = [(item['key'], offset, min(part_size, item['size'] - offset)) for item in objects for offset in range(0, item['size'], part_size)]
+    deadline = time.perf_counter() + seconds
+    counted = [0]
+    lock = threading.Lock()
+
+    def read_parts(index):
+        for key, offset, size in parts[index::concurrency]:
+            if time.perf_counter() >= deadline:
+                return
+            body = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={offset}-{offset + size - 1}")['Body']
+            while time.perf_counter() < deadline:
+                data = body.read(READ_BLOCK_SIZE)
+                if not data:
+                    break
+                with lock:
+                    counted[0] += len(data)
+            body.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(read_parts, range(concurrency)))
+    return counted[0] * 8 / (time.perf_counter() - start) / 1_000_000_000
+
+def coordinate(coordinator, poll_s, stop_event):
+    try:
+        while not stop_event.is_set():
+            start_time = time.time()
+            try:
+                if coordinator.acquire(start_time) == 0:
+                    print("Attention: another coordinator holds the lock, waiting", flush=True)
+                else:
+                    for node, wait_s in coordinator.poll(time.time()):
+                        print(f"{datetime.now(ZoneInfo('UTC')).strftime('%H:%M:%S')} Admitted: {node}, after {wait_s} seconds, "
+                              f"active: {coordinator.active(time.time())}, {coordinator.controller.state()}", flush=True)
+            except (BotoCoreError, ClientError) as e: # Retried on the next poll
+                print(f"The error message: {e}", flush=True)
+            stop_event.wait(max(poll_s - (time.time() - start_time), 0))
+    except KeyboardInterrupt:
+        print("\nStopped coordinating")
+
+########## Simulation
+
+# The bucket as seen by the nodes: each node downloads up to node_rate_Gbps, and all share capacity_Gbps;
+# beyond the capacity the bucket throttles, and only delivers throttle_ratio of it
+class Simulated_Source:
+    def __init__(self, capacity_Gbps, node_rate_Gbps, throttle_ratio=0.5):
+        self.capacity_Gbps = capacity_Gbps
+        self.node_rate_Gbps = node_rate_Gbps
+        self.throttle_ratio = throttle_ratio
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def rate(self):
+        with self.lock:
+            demand = self.active * self.node_rate_Gbps
+            capacity = self.capacity_Gbps if demand <= self.capacity_Gbps else self.capacity_Gbps * self.throttle_ratio
+            return min(self.node_rate_Gbps, capacity / max(self.active, 1))
+
+    # Returns the seconds to download size_GB
+    def download(self, size_GB, step_s=0.02):
+        with self.lock:
+            self.active += 1
+        start = time.perf_counter()
+        left = size_GB * 8
+        while left > 0:
+            time.sleep(step_s)
+            left -= self.rate() * step_s
+        with self.lock:
+            self.active -= 1
+        return time.perf_counter() - start
+
+def simulate_node(source, folder, node, size_GB, admission, poll_s):
+    attempt = None
+    if admission:
+        granted = Request_Admission(BUCKET, folder, node, timeout_s=3600, poll_s=poll_s)
+        attempt = granted[0] if granted else None
+    duration_s = source.download(size_GB)
+    if attempt is not None:
+        Report_Done(BUCKET, folder, node, attempt, {"state": "success", "duration_s": round(duration_s, 3), "transferred size_GB": size_GB,
+                                                    "dl_throughput_Gbps": round(size_GB * 8 / duration_s, 3)})
+    return duration_s
+
+# The fleet completion time with the admission, and with all nodes downloading at once
+def simulate(nodes, capacity_Gbps=32.0, node_rate_Gbps=8.0, size_GB=4.0, poll_s=0.1):
+    folder = f"{FOLDER or 'simulation'}/simulation-{int(time.time())}"
+    results = {}
+    for admission in (False, True):
+        source = Simulated_Source(capacity_Gbps, node_rate_Gbps)
+        coordinator = None
+        stop_event = threading.Event()
+        if admission: # Starts from a probe at half the capacity, like one from the Test Worker, tuned by the reports
+            coordinator = Admission_Coordinator(BUCKET, folder, Admission_Controller(capacity_Gbps / 2, node_rate_Gbps, size_GB), lease_s=600, lock_s=60)
+            threading.Thread(target=coordinate, args=(coordinator, poll_s, stop_event), daemon=True).start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=nodes) as pool:
+            durations = list(pool.map(lambda i: simulate_node(source, folder, f"sim-node-{i:03d}", size_GB, admission, poll_s), range(nodes)))
+        stop_event.set()
+        results["admission" if admission else "all at once"] = {
+            "fleet completion_s": round(time.perf_counter() - start, 3),
+            "download mean_s": round(sum(durations) / len(durations), 3),
+            "throughput mean_Gbps": round(sum(size_GB * 8 / duration for duration in durations) / len(durations), 3),
+        }
+        if coordinator is not None:
+            results['admission']['controller'] = coordinator.controller.state()
+    return results
+
+
+if __name__ == "__main__":
+    if "--simulate" in sys.argv:
+        nodes = int(sys.argv[sys.argv.index("--simulate") + 1])
+        print(f"\n----> Simulate {nodes} nodes, ds:{BUCKET}", flush=True)
+        for mode, result in simulate(nodes).items():
+            print(f"{mode}: {result}", flush=True)
+        sys.exit(0)
+
+    bandwidth_Gbps = BANDWIDTH_Gbps
+    if bandwidth_Gbps <= 0:
+        print(f"\n----> Measure the bandwidth of ds:{BUCKET}/models/{MODEL_FOLDER} for {PROBE_SECONDS} seconds", flush=True)
+        bandwidth_Gbps = max(measure_bandwidth(BUCKET, f"models/{MODEL_FOLDER}"), NODE_RATE_Gbps)
+    controller = Admission_Controller(bandwidth_Gbps, NODE_RATE_Gbps, MODEL_SIZE_GB)
+    print(f"\n----> Coordinate the model loading in ds:{BUCKET}/{FOLDER}, {controller.state()}", flush=True)
+    coordinate(Admission_Coordinator(BUCKET, FOLDER, controller, LEASE_S), POLL_INTERVAL_S, threading.Event())
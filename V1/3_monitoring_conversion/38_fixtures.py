@@ -0,0 +1,129 @@
+import os
+import re
+import sys
+import json
+import gzip
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from log_utils import SUBFOLDERS, read_header, open_log, list_logs, zstandard
+
+# Synthetic test runs at any node count, to measure the post-test tools beyond the few nodes of a real run
+# Each node is a clone of a recorded node (round robin, so the mix of GPU models is kept), with its header, SMI blocks,
+# Megatron iteration lines and vLLM throughput lines varied around the recorded values
+#   python3 38_fixtures.py {NODES} {OUTPUT FOLDER} [{SOURCE FOLDER}]
+# The output folder is laid out like a downloaded one, with a mapping.txt for the conversion and the ingestion
+SOURCE_FOLDER = os.getenv("FIXTURE_SOURCE", "test20251213")
+SEED          = int(os.getenv("FIXTURE_SEED", "0"))
+NOISE         = 0.03  # The relative spread of a node around the recorded values
+STRAGGLERS    = 0.02  # The fraction of nodes 25% slower in one test, for the qualification to find
+FAILURES      = 0.01  # The fraction of nodes with a failed test
+FIXTURE_FILE  = "fixture.json" # In the output folder, the parameters it was generated with
+COMPRESSION   = os.getenv("FIXTURE_COMPRESSION", "none") # "zstd" or "gzip": the logs as uploaded with LOG_COMPRESSION
+SUFFIXES      = {"none": ".log", "zstd": ".log.zst", "gzip": ".log.gz"}
+
+# The header fields scaled by the node factor of the test: > 0 with the slowness, < 0 against it
+HEADER_FIELDS = {
+    "duration_s": 1, "startup time_s": 1, "running time_s": 0,
+    "dl_throughput_Gbps": -1, "inference number": 0, "generated token number": 0, "output tokens per second": -1,
+    "goodput_rps": -1,
+}
+
+_ELAPSED    = re.compile(r"(elapsed time per iteration \(ms\): )([\d.]+)")
+_TFLOPS     = re.compile(r"(throughput per GPU \(TFLOP/s/GPU\): )([\d.]+)")
+_GENERATION = re.compile(r"(Avg generation throughput: )([\d.]+)")
+_SMI_ROW    = re.compile(r"^(\d+\s+\d+\s+0x[0-9a-f]+,\s+\d+\s+)([\d.]+)(°C\s+)([\d.]+)(W)", re.MULTILINE)
+
+def _scale(match, factor, digits=1):
+    return f"{match.group(1)}{float(match.group(2)) * factor:.{digits}f}"
+
+# (header, body) of a recorded log, the body being everything after the header
+def load_template(log_path):
+    with open_log(log_path, text=True) as f:
+        text = f.read()
+    header = read_header(log_path)
+    end = re.search(r"\n[ \t\r]*\n", text)
+    return header, text[end.start() + 1:] if end else ""
+
+def load_templates(source):
+    templates = {}
+    for subfolder in SUBFOLDERS:
+        log_paths = list_logs(os.path.join(source, subfolder))
+        if log_paths:
+            templates[subfolder] = [load_template(log_path) for log_path in log_paths]
+    return templates
+
+def vary_header(header, node, factor, rng, failed):
+    data = dict(header, **{"node name": node})
+    for key, sign in HEADER_FIELDS.items():
+        if isinstance(data.get(key), (int, float)):
+            value = data[key] * (factor if sign > 0 else 1 / factor if sign < 0 else rng.gauss(1, NOISE))
+            data[key] = int(value) if isinstance(header[key], int) else round(value, 3)
+    if failed:
+        data['state'] = "failure"
+        data['message'] = "Synthetic failure"
+    return data
+
+def vary_body(body, factor, rng):
+    body = _ELAPSED.sub(lambda m: _scale(m, factor * rng.gauss(1, NOISE / 3)), body)
+    body = _TFLOPS.sub(lambda m: _scale(m, 1 / factor * rng.gauss(1, NOISE / 3)), body)
+    body = _GENERATION.sub(lambda m: _scale(m, 1 / factor * rng.gauss(1, NOISE / 3)), body)
+    return _SMI_ROW.sub(lambda m: f"{m.group(1)}{float(m.group(2)) + rng.gauss(0, 1.5):.1f}{m.group(3)}{float(m.group(4)) * rng.gauss(1, NOISE):.1f}{m.group(5)}", body)
+
+def node_name(index, template_node):
+    return f"{template_node.rsplit('-', 1)[0]}-syn{index:05d}"
+
+_templates = {} # In each worker, sent once rather than with every node
+
+def _init_worker(templates):
+    _templates.update(templates)
+
+# Writes the logs of one node; the factors come from the node index, so any node can be generated on its own
+def write_node(args):
+    output, index, seed, compression = args
+    templates = _templates
+    rng = random.Random(seed * 1_000_003 + index)
+    slow = rng.choice(list(templates)) if rng.random() < STRAGGLERS else None
+    failed = rng.choice(list(templates)) if rng.random() < FAILURES else None
+    node = None
+    for subfolder, choices in templates.items():
+        header, body = choices[index % len(choices)]
+        node = node or node_name(index, header['node name'])
+        factor = rng.gauss(1, NOISE) * (1.25 if subfolder == slow else 1.0)
+        text = json.dumps(vary_header(header, node, factor, rng, subfolder == failed), indent=2) + "\n" + vary_body(body, factor, rng)
+        data = text.encode()
+        if compression == "zstd":
+            data = zstandard.ZstdCompressor(level=3).compress(data)
+        elif compression == "gzip":
+            data = gzip.compress(data, mtime=0)
+        with open(os.path.join(output, subfolder, f"{node}{SUFFIXES[compression]}"), "wb") as f:
+            f.write(data)
+    return index, node
+
+# Returns the number of nodes written, generated in parallel as the regex substitutions hold the GIL
+def generate(nodes, output, source=SOURCE_FOLDER, seed=SEED, compression=COMPRESSION):
+    templates = load_templates(source)
+    if not templates:
+        raise ValueError(f"No logs in {source}")
+    for subfolder in templates:
+        os.makedirs(os.path.join(output, subfolder), exist_ok=True)
+    with ProcessPoolExecutor(initializer=_init_worker, initargs=(templates,)) as pool:
+        names = dict(pool.map(write_node, [(output, index, seed, compression) for index in range(nodes)], chunksize=max(1, nodes // 64)))
+    # | {ID} | {DOKS worker name} | {stable node ID} |, like the one of the fleet
+    with open(os.path.join(output, "mapping.txt"), "w") as f:
+        for index in range(nodes):
+            f.write(f"| {900000000 + index} | {names[index]} | synnode{index:05d} |\n")
+    with open(os.path.join(output, FIXTURE_FILE), "w") as f:
+        json.dump({"nodes": nodes, "source": os.path.abspath(source), "seed": seed, "compression": compression}, f, indent=2)
+    return nodes
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python3 38_fixtures.py {NODES} {OUTPUT FOLDER} [{SOURCE FOLDER}]")
+        sys.exit(1)
+    nodes, output = int(sys.argv[1]), sys.argv[2]
+    source = sys.argv[3] if len(sys.argv) > 3 else SOURCE_FOLDER
+    print(f"\n----> Generate {nodes} nodes from {source} into {output}", flush=True)
+    generate(nodes, output, source)
+    print(f"----> Done, FOLDER={output}", flush=True)
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+import importlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Shared with the test workloads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_images"))
+from log_utils import SUBFOLDERS, scan_headers, iter_node_log, open_log, list_logs as list_node_logs
+from log_parser import Parse_Megatron_Lines, Summarize_Training, Vllm_Startup_Parser
+
+# Benchmarks of the post-test tools on synthetic runs (38_fixtures.py), without any download, at several node counts
+# Each result is appended to BENCH_HISTORY with the commit it ran on, and compared with the last run on another commit,
+# so a slower analysis, conversion or parsing shows up on the commit which made it slower
+#   python3 39_benchmark.py                  run at BENCH_NODES, e.g. "100,1000"
+#   python3 39_benchmark.py history          the results of the past commits
+# Exits with 1 if a benchmark is slower than the previous commit by more than REGRESSION_THRESHOLD
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BENCH_NODES          = [int(nodes) for nodes in os.getenv("BENCH_NODES", "100,1000").split(",")]
+BENCH_REPEAT         = int(os.getenv("BENCH_REPEAT", "3"))   # The best of the repeats is kept, the least disturbed run
+BENCH_FIXTURES       = os.getenv("BENCH_FIXTURES", "/tmp/amd-validation-fixtures") # Reused if generated with the same parameters
+BENCH_HISTORY        = os.getenv("BENCH_HISTORY", os.path.join(HERE, "bench_history.jsonl"))
+REGRESSION_THRESHOLD = float(os.getenv("REGRESSION_THRESHOLD", "0.2"))  # 20% slower
+MIN_REGRESSION_S     = 0.05 # Below this the timings are noise
+
+fixtures = importlib.import_module("38_fixtures")
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE, capture_output=True, text=True).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def fixture_folder(nodes):
+    folder = os.path.join(BENCH_FIXTURES, f"nodes{nodes}" + ("" if fixtures.COMPRESSION == "none" else f"-{fixtures.COMPRESSION}"))
+    wanted = {"nodes": nodes, "source": os.path.abspath(os.path.join(HERE, fixtures.SOURCE_FOLDER)), "seed": fixtures.SEED, "compression": fixtures.COMPRESSION}
+    try:
+        with open(os.path.join(folder, fixtures.FIXTURE_FILE)) as f:
+            if json.load(f) == wanted:
+                return folder
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(folder, ignore_errors=True)
+    start_time = time.perf_counter()
+    fixtures.generate(nodes, folder, wanted['source'], wanted['seed'], wanted['compression'])
+    print(f"Generated {nodes} nodes in {folder}, {time.perf_counter() - start_time:.3f} seconds", flush=True)
+    return folder
+
+def list_logs(folder):
+    return [log_path for subfolder in SUBFOLDERS for log_path in list_node_logs(os.path.join(folder, subfolder))]
+
+# A post-test script as it is run, in its own process with FOLDER, and the output discarded
+def run_script(script, folder, cwd=HERE):
+    env = dict(os.environ, FOLDER=folder)
+    subprocess.run([sys.executable, os.path.join(HERE, script)], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+
+def parse_training(folder):
+    for log_path in list_logs(folder):
+        if f"{os.sep}megatron{os.sep}" in log_path:
+            with open_log(log_path, text=True) as f:
+                parser = Parse_Megatron_Lines(f)
+            if len(parser) > 0:
+                Summarize_Training(parser)
+
+def parse_startup(folder):
+    for log_path in list_logs(folder):
+        if f"{os.sep}llama{os.sep}" in log_path:
+            parser = Vllm_Startup_Parser()
+            for line in iter_node_log(log_path):
+                parser.feed(line, 0.0)
+            parser.phases()
+
+# name -> (setup, run), the setup (not timed) runs before each repeat
+def benchmarks(folder):
+    converted = folder + "_converted"
+    def clean_conversion():
+        shutil.rmtree(converted, ignore_errors=True)
+    return {
+        "scan headers":          (None, lambda: scan_headers(list_logs(folder))),
+        "parse training":        (None, lambda: parse_training(folder)),
+        "parse startup":         (None, lambda: parse_startup(folder)),
+        "analyze":               (None, lambda: run_script("32_analyze.py", folder)),
+        "qualify":               (None, lambda: run_script("36_qualify.py", folder)),
+        "convert":               (clean_conversion, lambda: run_script("33_convert.py", folder, cwd=folder)), # With its mapping.txt
+        "convert (incremental)": (None, lambda: run_script("33_convert.py", folder, cwd=folder)),                 # After "convert"
+    }
+
+def best_of(setup, run, repeat):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start_time)
+    return round(min(timings), 4)
+
+def load_history():
+    if not os.path.exists(BENCH_HISTORY):
+        return []
+    with open(BENCH_HISTORY) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# The benchmarks slower than in the last run on another commit with the same fixtures, [(nodes, name, before, after)]
+def regressions(history, record):
+    previous = next((entry for entry in reversed(history) if entry['commit'] != record['commit']
+                     and entry.get('compression', "none") == record['compression']), None)
+    if previous is None:
+        return None, []
+    slower = []
+    for nodes, results in record['results'].items():
+        for name, seconds in results.items():
+            before = previous['results'].get(nodes, {}).get(name)
+            if before and seconds - before > max(before * REGRESSION_THRESHOLD, MIN_REGRESSION_S):
+                slower.append((nodes, name, before, seconds))
+    return previous, slower
+
+def print_history(history):
+    names = []
+    for entry in history:
+        for nodes, results in entry['results'].items():
+            for name in results:
+                if (nodes, name) not in names:
+                    names.append((nodes, name))
+    print(" | ".join(["commit", "date"] + [f"{name} @{nodes}" for nodes, name in names]))
+    for entry in history:
+        commit = entry['commit'] + ("+" if entry.get('dirty') else "")
+        print(" | ".join([commit, entry['date']] + [str(entry['results'].get(nodes, {}).get(name, "")) for nodes, name in names]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "history":
+        print_history(load_history())
+        sys.exit(0)
+
+    commit, dirty = git_commit()
+    record = {"commit": commit, "dirty": dirty, "date": datetime.now(ZoneInfo("UTC")).strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(), "cpus": os.cpu_count(), "repeat": BENCH_REPEAT, "compression": fixtures.COMPRESSION, "results": {}}
+    for nodes in BENCH_NODES:
+        print(f"\n----> Benchmark {nodes} nodes, best of {BENCH_REPEAT}", flush=True)
+        folder = fixture_folder(nodes)
+        results = record['results'][str(nodes)] = {}
+        for name, (setup, run) in benchmarks(folder).items():
+            results[name] = best_of(setup, run, BENCH_REPEAT)
+            print(f"{name}: {results[name]} seconds", flush=True)
+
+    history = load_history()
+    previous, slower = regressions(history, record)
+    with open(BENCH_HISTORY, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"\n----> Commit: {commit}{' (uncommitted changes)' if dirty else ''}, History: {BENCH_HISTORY}")
+    if previous is None:
+        print("No earlier commit to compare with")
+        sys.exit(0)
+    print(f"Compared with {previous['commit']} ({previous['date']})")
+    for nodes, name, before, after in slower:
+        print(f"Attention: {name} @{nodes} nodes: {before} -> {after} seconds ({(after / before - 1) * 100:+.0f}%)")
+    sys.exit(1 if slower else 0)
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import math
+import importlib
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+# Cross-run comparison of each physical node, matched by its stable node ID (mapping.txt) whatever its worker name in each run,
+# from the fleet store (34_ingest.py), so the runs are not parsed again; the folders given and found locally are ingested first,
+# which only parses the files added or changed
+#   python3 40_compare.py                          the last run in the store against the COMPARE_RUNS runs before it
+#   python3 40_compare.py test20251213 test2026... the last folder given against the ones before it
+# A node regresses in a metric when it is worse than its baseline (its median over the baseline runs) by at least MIN_CHANGE,
+# and its change is an outlier among the changes of the whole fleet (modified z-score, see 36_qualify.py), so a change of the
+# software or of the test, which moves every node, is not taken for a slow node; for the training iteration time, the
+# iterations of the two sides must also differ by Welch's t-test at SIGNIFICANCE
+# Written to {current FOLDER}/regressions.json
+FLEET_DB      = os.getenv("FLEET_DB", "fleet.db")
+COMPARE_RUNS  = int(os.getenv("COMPARE_RUNS", "3"))
+MIN_CHANGE    = float(os.getenv("MIN_CHANGE", "0.05"))   # 5% worse
+SIGNIFICANCE  = float(os.getenv("SIGNIFICANCE", "0.01")) # One-sided p-value
+MIN_ITERATIONS = 5 # Steady iterations per side for the t-test
+
+REGRESSION_FILE = "regressions.json"
+
+ingest = importlib.import_module("34_ingest")
+qualify = importlib.import_module("36_qualify")
+
+# Metric -> (type, column, direction): "low" regresses when it drops, "high" when it rises
+METRICS = {
+    "dl_throughput_Gbps":       ("model_loading", "dl_throughput_gbps", "low"),
+    "iteration_ms":             ("training", "iteration_ms_mean", "high"),
+    "startup time_s":           ("inference", "startup_time_s", "high"),
+    "output tokens per second": ("inference", "output_tokens_per_second", "low"),
+    "goodput_rps":              ("inference", "goodput_rps", "low"),
+}
+
+# The regularized incomplete beta function I_x(a, b), by its continued fraction (modified Lentz)
+def _beta_fraction(x, a, b):
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)), -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return h
+
+def incomplete_beta(x, a, b):
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _beta_fraction(x, a, b) / a
+    return 1.0 - front * _beta_fraction(1 - x, b, a) / b
+
+# P(T > t) for Student's t with df degrees of freedom
+def t_survival(t, df):
+    tail = 0.5 * incomplete_beta(df / (df + t * t), df / 2, 0.5)
+    return tail if t > 0 else 1.0 - tail
+
+# One-sided p-value of Welch's t-test that the mean of after is above the mean of before
+def welch_p(before, after):
+    before, after = np.asarray(before, dtype=np.float64), np.asarray(after, dtype=np.float64)
+    var_before, var_after = before.var(ddof=1) / len(before), after.var(ddof=1) / len(after)
+    if var_before + var_after == 0:
+        return 0.0 if after.mean() > before.mean() else 1.0
+    t = (after.mean() - before.mean()) / math.sqrt(var_before + var_after)
+    df = (var_before + var_after) ** 2 / (var_before ** 2 / (len(before) - 1) + var_after ** 2 / (len(after) - 1))
+    return t_survival(t, df)
+
+# The runs in the store, oldest first
+def list_runs(connection):
+    return [row[0] for row in connection.execute("SELECT folder FROM records GROUP BY folder ORDER BY MIN(online_utc), folder")]
+
+# {metric: {folder: {node ID: value}}}, the worker names {(folder, node ID): node}, and the steady iteration times {folder: {node ID: [ms, ...]}}
+def load_runs(connection, folders):
+    marks = ", ".join("?" * len(folders))
+    values = {metric: {folder: {} for folder in folders} for metric in METRICS}
+    names = {}
+    for metric, (kind, column, _) in METRICS.items():
+        for folder, node_id, node, value in connection.execute(
+                f"SELECT folder, node_id, node, {column} FROM results WHERE type = ? AND state IN ('success', 'running') "
+                f"AND {column} IS NOT NULL AND {column} > 0 AND folder IN ({marks})", [kind] + folders):
+            values[metric][folder][node_id] = value
+            names[(folder, node_id)] = node
+    iterations = {folder: {} for folder in folders}
+    for folder, node_id, elapsed_ms in connection.execute(
+            f"SELECT results.folder, results.node_id, iterations.elapsed_ms FROM results JOIN iterations ON iterations.path = results.path "
+            f"WHERE results.type = 'training' AND results.state = 'success' AND results.folder IN ({marks}) "
+            f"AND iterations.iteration > ? AND iterations.elapsed_ms IS NOT NULL", folders + [ingest.WARMUP_ITERATIONS]):
+        iterations[folder].setdefault(node_id, []).append(elapsed_ms)
+    return values, names, iterations
+
+def compare(connection, baselines, current):
+    values, names, iterations = load_runs(connection, baselines + [current])
+    nodes = {}
+    statistics = {}
+    for metric, (_, _, direction) in METRICS.items():
+        changes = []  # (node ID, baseline, value, change), the change > 0 when worse
+        for node_id, value in values[metric][current].items():
+            history = [values[metric][folder][node_id] for folder in baselines if node_id in values[metric][folder]]
+            if not history:
+                continue
+            baseline = float(np.median(history))
+            change = (value / baseline - 1) * (1 if direction == "high" else -1)
+            changes.append((node_id, baseline, value, change))
+        if not changes:
+            continue
+        median_change = float(np.median([change for _, _, _, change in changes]))
+        statistics[metric] = {"nodes": len(changes), "median change": round(median_change, 4)}
+        if len(changes) >= qualify.MIN_SAMPLES:
+            z, _, _, _ = qualify.robust_outliers([change for _, _, _, change in changes], "high")
+        else:
+            z = [None] * len(changes)
+            if metric != "iteration_ms":
+                print(f"Attention: {metric} of {len(changes)} nodes only, too few to compare with the fleet", flush=True)
+                continue
+        for (node_id, baseline, value, change), score in zip(changes, z):
+            if change < MIN_CHANGE or (score is not None and score <= qualify.OUTLIER_THRESHOLD):
+                continue
+            regression = {"metric": metric, "baseline": round(baseline, 3), "value": round(value, 3), "change": round(change, 4),
+                          "fleet median change": round(median_change, 4), "z": None if score is None else round(float(score), 2)}
+            if metric == "iteration_ms":
+                before = [ms for folder in baselines for ms in iterations[folder].get(node_id, [])]
+                after = iterations[current].get(node_id, [])
+                if len(before) < MIN_ITERATIONS or len(after) < MIN_ITERATIONS:
+                    if score is None:
+                        continue
+                else:
+                    regression['p'] = round(welch_p(before, after), 6)
+                    if regression['p'] >= SIGNIFICANCE:
+                        continue
+            nodes.setdefault(node_id, {"node": names.get((current, node_id)), "regressions": []})['regressions'].append(regression)
+    return {
+        "current": current,
+        "baselines": baselines,
+        "min change": MIN_CHANGE,
+        "threshold": qualify.OUTLIER_THRESHOLD,
+        "significance": SIGNIFICANCE,
+        "regressed": sorted(nodes),
+        "nodes": nodes,
+        "statistics": statistics,
+    }
+
+
+if __name__ == "__main__":
+    connection = ingest.open_store(FLEET_DB)
+    folders = sys.argv[1:]
+    local = [folder for folder in folders if os.path.isdir(folder)]
+    if local:
+        with connection: # One transaction
+            ingest.ingest_mapping(connection, ingest.mapping_file)
+            for folder in local:
+                parsed, unchanged, failed, removed = ingest.ingest_folder(connection, folder)
+                print(f"----> {folder}: Parsed: {parsed}, Unchanged: {unchanged}, Failed: {failed}, Removed: {removed}")
+    runs = [os.path.basename(os.path.normpath(folder)) for folder in folders] or list_runs(connection)[-(COMPARE_RUNS + 1):]
+    if len(runs) < 2:
+        print(f"Two runs are needed, {len(runs)} in {FLEET_DB}")
+        sys.exit(1)
+    baselines, current = runs[:-1], runs[-1]
+
+    print(f"\n----> Compare {current} with {', '.join(baselines)}")
+    result = compare(connection, baselines, current)
+    connection.close()
+    for metric, stats in result['statistics'].items():
+        print(f"{metric}: {stats['nodes']} nodes, fleet median change {stats['median change'] * 100:+.1f}% (> 0: worse)")
+
+    print(f"\n----> Regressed: {len(result['regressed'])} nodes")
+    for node_id in result['regressed']:
+        for regression in result['nodes'][node_id]['regressions']:
+            detail = f"z {regression['z']}" + (f", p {regression['p']}" if 'p' in regression else "")
+            print(f"Attention: {node_id} ({result['nodes'][node_id]['node']}), {regression['metric']}: {regression['baseline']} -> {regression['value']} "
+                  f"({regression['change'] * 100:+.1f}% worse), {detail}")
+
+    current_folder = next((folder for folder in local if os.path.basename(os.path.normpath(folder)) == current), ".")
+    output_file = os.path.join(current_folder, REGRESSION_FILE)
+    with open(output_file, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n----> Saved to {output_file}")
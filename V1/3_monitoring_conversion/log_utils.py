@@ -0,0 +1,187 @@
+import io
+import os
+import re
+import sys
+import json
+import gzip
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import zstandard
+except ImportError: # Only needed for the logs compressed with zstd
+    zstandard = None
+
+SUBFOLDERS = ["megatron", "benchmark/model_loading", "llama"]
+
+HEADER_BLOCK_SIZE = 64 * 1024          # The headers fit in one block, unless they carry large histograms
+MAX_HEADER_BYTES  = 16 * 1024 * 1024   # Beyond this, the file has no header
+_HEADER_END = re.compile(rb"\n[ \t\r]*\n")
+
+SCAN_WORKERS   = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 1)))
+SCAN_MIN_FILES = 64 # Fewer files are scanned in this process, faster than starting the pool
+
+# The logs are uploaded plain ({NODE_NAME}.log) or compressed ({NODE_NAME}.log.zst, or .log.gz where zstd is not available),
+# see LOG_COMPRESSION in helper.py; the readers below take any of them, recognized by their first bytes
+LOG_SUFFIXES = (".log.zst", ".log.gz", ".log")
+ZSTD_MAGIC   = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC   = b"\x1f\x8b"
+
+def is_log(name):
+    return name.endswith(LOG_SUFFIXES)
+
+# "node.log.zst" -> ("node", ".log.zst")
+def split_log_name(name):
+    for suffix in LOG_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return name, ""
+
+# The node logs in a folder, one per node: the most recent one if a node has both a plain and a compressed log
+def list_logs(path):
+    if not os.path.isdir(path):
+        return []
+    logs = {}
+    for entry in os.scandir(path):
+        if is_log(entry.name) and entry.is_file():
+            node = split_log_name(entry.name)[0]
+            if node not in logs or entry.stat().st_mtime_ns > logs[node].stat().st_mtime_ns:
+                logs[node] = entry
+    return sorted(entry.path for entry in logs.values())
+
+def _require_zstd(log_path):
+    if zstandard is None:
+        raise OSError(f"{log_path} is compressed with zstd, and the zstandard package is not installed")
+
+# A log file opened for reading, decompressed while it is read, so only the bytes read are decompressed
+def open_log(log_path, text=False):
+    f = open(log_path, "rb")
+    magic = f.read(4)
+    f.seek(0)
+    if magic == ZSTD_MAGIC:
+        try:
+            _require_zstd(log_path)
+        except OSError:
+            f.close()
+            raise
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=True))
+    elif magic[:2] == GZIP_MAGIC:
+        f = gzip.GzipFile(fileobj=f, mode="rb")
+    return io.TextIOWrapper(f, encoding="utf-8", errors="replace") if text else f
+
+# The decompressed start of a log from its first bytes, e.g. from a ranged GET, however much of it these bytes give
+def decompress_prefix(data):
+    if data[:4] == ZSTD_MAGIC:
+        _require_zstd("The log")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if data[:2] == GZIP_MAGIC:
+        return zlib.decompressobj(wbits=31).decompress(data)
+    return data
+
+# The JSON header (RESULT) at the top of a log file, which ends at the first blank line
+# Only the header is read, in blocks, not the SMI output and the logs after it; a compressed log is only decompressed
+# as far as its header
+def read_header(log_path):
+    data = b""
+    with open_log(log_path) as f:
+        while True:
+            block = f.read(HEADER_BLOCK_SIZE)
+            start = max(data.rfind(b"\n"), 0) # The blank line may span two blocks
+            data += block
+            match = _HEADER_END.search(data, start)
+            if match:
+                data = data[:match.start() + 1]
+                break
+            if not block: # No blank line, the file is the header
+                break
+            if len(data) > MAX_HEADER_BYTES:
+                raise ValueError(f"No end of header in the first {MAX_HEADER_BYTES} bytes")
+    return json.loads(data.decode("utf-8", errors="replace"))
+
+# The header from the first bytes of a log, e.g. from a ranged GET; None if {data} ends before the header does
+def parse_header_bytes(data, complete=False):
+    data = decompress_prefix(data)
+    match = _HEADER_END.search(data)
+    if match:
+        data = data[:match.start() + 1]
+    elif not complete:
+        return None
+    return json.loads(data.decode("utf-8", errors="replace"))
+
+def _scan_header(log_path):
+    try:
+        return log_path, read_header(log_path), None
+    except (ValueError, OSError) as e: # Malformed or truncated header, or the file is gone
+        return log_path, None, str(e)
+
+# Returns {log_path: (header, error)}, the header being None on error
+# The files are spread over a process pool, as the JSON parsing holds the GIL
+def scan_headers(log_paths, workers=SCAN_WORKERS):
+    if workers <= 1 or len(log_paths) < SCAN_MIN_FILES:
+        results = map(_scan_header, log_paths)
+        return {log_path: (header, error) for log_path, header, error in results}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_scan_header, log_paths, chunksize=max(1, len(log_paths) // (workers * 4)))
+        return {log_path: (header, error) for log_path, header, error in results}
+
+# mapping.txt: | {ID} | {DOKS worker name} | {stable node ID} |
+def read_mapping(mapping_file):
+    mapping = {}
+    with open(mapping_file, "r") as f:
+        for line in f:
+            # Remove leading/trailing whitespace and split by '|'
+            parts = [p.strip() for p in line.strip().split("|")]
+            if len(parts) == 5:
+                _, _, key, value, _ = parts
+                mapping[key] = value
+    return mapping
+
+# The inference logs are shipped as numbered segments next to the status file of each node
+# {FOLDER}/llama/{NODE_NAME}.log                                    the RESULT (JSON) and the GPU info, rewritten on every upload
+# {FOLDER}/llama/{NODE_NAME}.segments/000001.log, 000002.log, ...   the logs, append-only, each compressed on its own if any
+SEGMENTS_SUFFIX = ".segments"
+
+def segments_path(log_path):
+    return split_log_name(log_path)[0] + SEGMENTS_SUFFIX
+
+# The GPU telemetry series of a node, next to its status file: {FOLDER}/{SUBFOLDER}/{NODE_NAME}.telemetry.json
+TELEMETRY_SUFFIX = ".telemetry.json"
+
+def telemetry_path(log_path):
+    return split_log_name(log_path)[0] + TELEMETRY_SUFFIX
+
+def list_segments(log_path):
+    path = segments_path(log_path)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if is_log(f))
+
+# Reassemble the logs lazily, with one segment open at a time
+# A line split across two segments is yielded once
+def iter_segment_lines(log_path):
+    rest = b""
+    for segment in list_segments(log_path):
+        with open_log(segment) as f:
+            for line in f:
+                if rest:
+                    line = rest + line
+                    rest = b""
+                if not line.endswith(b"\n"): # Only the last line of a segment
+                    rest = line
+                    continue
+                yield line.decode("utf-8", errors="replace")
+    if rest:
+        yield rest.decode("utf-8", errors="replace")
+
+# The full log of a node: the status file, then the reassembled segments
+def iter_node_log(log_path):
+    with open_log(log_path, text=True) as f:
+        yield from f
+    segments = list_segments(log_path)
+    if segments:
+        yield "\n\n" + "-" * 40 + f"> Inference Logs ({len(segments)} segments)\n"
+        yield from iter_segment_lines(log_path)
+
+# python3 log_utils.py {FOLDER}/llama/{NODE_NAME}.log, to print the full log of a node
+if __name__ == "__main__":
+    for line in iter_node_log(sys.argv[1]):
+        sys.stdout.write(line)